@@ -0,0 +1,52 @@
+"""TSD prefix sequence and free list
+
+Revision ID: 3d8a5c1f7e24
+Revises: be2e93b312ce
+Create Date: 2026-10-18 13:20:44.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d8a5c1f7e24'
+down_revision = 'be2e93b312ce'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'tsd_free_prefixes',
+        sa.Column('number', sa.Integer(), nullable=False),
+        sa.Column('released_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('number')
+    )
+    op.execute('CREATE SEQUENCE IF NOT EXISTS tsd_device_prefix_seq')
+
+    # Продолжаем нумерацию с максимального выданного префикса, пропуски уходят в список свободных
+    if sa.inspect(op.get_bind()).has_table('tsd_devices'):
+        op.execute("""
+            WITH used AS (
+                SELECT substring(prefix FROM 4)::integer AS number
+                FROM tsd_devices
+                WHERE prefix ~ '^ТСД[0-9]+$'
+            )
+            INSERT INTO tsd_free_prefixes (number)
+            SELECT gs.number
+            FROM generate_series(1, (SELECT coalesce(max(number), 0) FROM used)) AS gs(number)
+            WHERE gs.number NOT IN (SELECT number FROM used)
+        """)
+        op.execute("""
+            SELECT setval(
+                'tsd_device_prefix_seq',
+                coalesce((SELECT max(substring(prefix FROM 4)::integer) FROM tsd_devices WHERE prefix ~ '^ТСД[0-9]+$'), 0) + 1,
+                false
+            )
+        """)
+
+
+def downgrade() -> None:
+    op.execute('DROP SEQUENCE IF EXISTS tsd_device_prefix_seq')
+    op.drop_table('tsd_free_prefixes')
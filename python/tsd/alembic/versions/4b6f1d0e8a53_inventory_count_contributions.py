@@ -0,0 +1,68 @@
+"""Per-counter inventory count contributions and count log
+
+Revision ID: 4b6f1d0e8a53
+Revises: e7b3a2c94f10
+Create Date: 2026-10-18 16:05:31.927364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b6f1d0e8a53'
+down_revision = 'e7b3a2c94f10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'inventory_count_contributions',
+        sa.Column('inventory_id', sa.Integer(), nullable=False),
+        sa.Column('nomenclature_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('device_id', sa.String(length=255), nullable=False),
+        sa.Column('quantity', sa.Numeric(precision=15, scale=3), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['inventory_id'], ['inventories.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['nomenclature_id'], ['nomenclature.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('inventory_id', 'nomenclature_id', 'user_id', 'device_id')
+    )
+    op.create_table(
+        'inventory_count_log',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('inventory_id', sa.Integer(), nullable=False),
+        sa.Column('nomenclature_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('device_id', sa.String(length=255), nullable=False),
+        sa.Column('quantity', sa.Numeric(precision=15, scale=3), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['inventory_id'], ['inventories.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['nomenclature_id'], ['nomenclature.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_inventory_count_log_id', 'inventory_count_log', ['id'])
+    op.create_index(
+        'ix_inventory_count_log_inventory_nomenclature', 'inventory_count_log',
+        ['inventory_id', 'nomenclature_id', 'id']
+    )
+
+    # Уже посчитанные строки становятся вкладом того, кто их посчитал
+    op.execute("""
+        INSERT INTO inventory_count_contributions (inventory_id, nomenclature_id, user_id, device_id, quantity, updated_at)
+        SELECT i.inventory_id, i.nomenclature_id, coalesce(i.counted_by, inv.created_by), '',
+               i.actual_quantity, coalesce(i.counted_at, now())
+        FROM inventory_items i
+        JOIN inventories inv ON inv.id = i.inventory_id
+        WHERE i.actual_quantity IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_inventory_count_log_inventory_nomenclature', table_name='inventory_count_log')
+    op.drop_index('ix_inventory_count_log_id', table_name='inventory_count_log')
+    op.drop_table('inventory_count_log')
+    op.drop_table('inventory_count_contributions')
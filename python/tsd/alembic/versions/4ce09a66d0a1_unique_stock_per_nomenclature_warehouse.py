@@ -0,0 +1,35 @@
+"""Unique stock per nomenclature and warehouse
+
+Revision ID: 4ce09a66d0a1
+Revises: 2e0329fdc062
+Create Date: 2026-10-18 09:12:31.402117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4ce09a66d0a1'
+down_revision = '2e0329fdc062'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Удаляем дубли остатков, оставляя последнюю созданную запись
+    op.execute(
+        """
+        DELETE FROM stocks s
+        USING stocks d
+        WHERE s.nomenclature_id = d.nomenclature_id
+          AND s.warehouse_id = d.warehouse_id
+          AND s.id < d.id
+        """
+    )
+    op.create_unique_constraint(
+        'uq_stocks_nomenclature_warehouse', 'stocks', ['nomenclature_id', 'warehouse_id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_stocks_nomenclature_warehouse', 'stocks', type_='unique')
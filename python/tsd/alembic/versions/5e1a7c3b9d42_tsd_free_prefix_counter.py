@@ -0,0 +1,40 @@
+"""Document counter of released TSD prefixes
+
+Revision ID: 5e1a7c3b9d42
+Revises: 8c3d5e7f9a21
+Create Date: 2026-10-20 10:05:13.742118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1a7c3b9d42'
+down_revision = '8c3d5e7f9a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'tsd_free_prefixes',
+        sa.Column('document_counter', sa.Integer(), server_default='0', nullable=False)
+    )
+    # Уже освобожденные префиксы продолжают нумерацию с последнего номера документа,
+    # выданного с этим префиксом ("ТСД005-INPUT_BALANCE-000012" -> 12)
+    op.execute(r"""
+        UPDATE tsd_free_prefixes AS free
+        SET document_counter = coalesce((
+            SELECT max(substring(documents.document_number FROM '-([0-9]+)$')::integer)
+            FROM documents
+            WHERE documents.document_number LIKE 'ТСД' || CASE
+                WHEN free.number < 1000 THEN lpad(free.number::text, 3, '0')
+                ELSE free.number::text
+            END || '-%'
+        ), 0)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('tsd_free_prefixes', 'document_counter')
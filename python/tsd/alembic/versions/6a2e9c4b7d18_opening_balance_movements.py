@@ -0,0 +1,52 @@
+"""Opening-balance movements for stock rows not covered by the ledger
+
+Revision ID: 6a2e9c4b7d18
+Revises: 4b6f1d0e8a53
+Create Date: 2026-10-19 09:12:44.503217
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '6a2e9c4b7d18'
+down_revision = '4b6f1d0e8a53'
+branch_labels = None
+depends_on = None
+
+OPENING_BALANCE_DESCRIPTION = 'Начальный остаток'
+
+
+def upgrade() -> None:
+    # Остатки, введенные до журнала движений или вручную, переносятся в журнал:
+    # движение на разницу между остатком и суммой движений, датой раньше первого движения.
+    # Автор движения - первый пользователь (у старых остатков автора нет).
+    op.execute(f"""
+        INSERT INTO stock_movements
+            (nomenclature_id, warehouse_id, movement_type, quantity, date, user_id, description)
+        SELECT
+            s.nomenclature_id,
+            s.warehouse_id,
+            'INVENTORY',
+            s.quantity - COALESCE(m.total, 0),
+            LEAST(COALESCE(s.created_at, now()), COALESCE(m.first_date, 'infinity')),
+            (SELECT min(id) FROM users),
+            '{OPENING_BALANCE_DESCRIPTION}'
+        FROM stocks s
+        LEFT JOIN (
+            SELECT nomenclature_id, warehouse_id, sum(quantity) AS total, min(date) AS first_date
+            FROM stock_movements
+            GROUP BY nomenclature_id, warehouse_id
+        ) m ON m.nomenclature_id = s.nomenclature_id AND m.warehouse_id = s.warehouse_id
+        WHERE s.quantity <> COALESCE(m.total, 0)
+          AND EXISTS (SELECT 1 FROM users)
+    """)
+
+
+def downgrade() -> None:
+    op.execute(f"""
+        DELETE FROM stock_movements
+        WHERE description = '{OPENING_BALANCE_DESCRIPTION}'
+          AND document_id IS NULL
+          AND inventory_id IS NULL
+    """)
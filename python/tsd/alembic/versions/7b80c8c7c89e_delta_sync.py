@@ -0,0 +1,42 @@
+"""Delta sync: tombstones and change indexes for reference data
+
+Revision ID: 7b80c8c7c89e
+Revises: f2b9e61e0113
+Create Date: 2026-10-18 11:26:03.551908
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b80c8c7c89e'
+down_revision = 'f2b9e61e0113'
+branch_labels = None
+depends_on = None
+
+SYNC_TABLES = ['units_of_measure', 'nomenclature_categories', 'nomenclature', 'warehouses', 'barcodes']
+
+
+def upgrade() -> None:
+    op.create_table(
+        'sync_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('entity', sa.String(), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_sync_tombstones_id', 'sync_tombstones', ['id'])
+    op.create_index('ix_sync_tombstones_entity_deleted_at', 'sync_tombstones', ['entity', 'deleted_at'])
+
+    for table in SYNC_TABLES:
+        op.create_index(f'ix_{table}_changed_at', table, [sa.text('coalesce(updated_at, created_at)')])
+
+
+def downgrade() -> None:
+    for table in SYNC_TABLES:
+        op.drop_index(f'ix_{table}_changed_at', table_name=table)
+    op.drop_index('ix_sync_tombstones_entity_deleted_at', table_name='sync_tombstones')
+    op.drop_index('ix_sync_tombstones_id', table_name='sync_tombstones')
+    op.drop_table('sync_tombstones')
@@ -0,0 +1,25 @@
+"""Content hash of chunked upload parts
+
+Revision ID: 8c3d5e7f9a21
+Revises: 6a2e9c4b7d18
+Create Date: 2026-10-19 11:40:27.318904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c3d5e7f9a21'
+down_revision = '6a2e9c4b7d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # У частей, полученных до миграции, хеша нет: их повтор подтверждается без сравнения
+    op.add_column('document_upload_chunks', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('document_upload_chunks', 'content_hash')
@@ -0,0 +1,32 @@
+"""Trigram indexes for nomenclature search
+
+Revision ID: be2e93b312ce
+Revises: 7b80c8c7c89e
+Create Date: 2026-10-18 12:41:19.870562
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'be2e93b312ce'
+down_revision = '7b80c8c7c89e'
+branch_labels = None
+depends_on = None
+
+SEARCH_COLUMNS = ['name', 'code', 'description_ru', 'description_ua']
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in SEARCH_COLUMNS:
+        op.create_index(
+            f'ix_nomenclature_{column}_trgm', 'nomenclature', [column],
+            postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'}
+        )
+
+
+def downgrade() -> None:
+    for column in SEARCH_COLUMNS:
+        op.drop_index(f'ix_nomenclature_{column}_trgm', table_name='nomenclature')
@@ -0,0 +1,62 @@
+"""Stock summary projection
+
+Revision ID: c5f0d83a19be
+Revises: 9a41e6b2d5c7
+Create Date: 2026-10-18 14:37:50.118734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f0d83a19be'
+down_revision = '9a41e6b2d5c7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stock_summary',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nomenclature_id', sa.Integer(), nullable=False),
+        sa.Column('nomenclature_code', sa.String(), nullable=False),
+        sa.Column('nomenclature_name', sa.String(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('warehouse_id', sa.Integer(), nullable=False),
+        sa.Column('warehouse_code', sa.String(), nullable=False),
+        sa.Column('warehouse_name', sa.String(), nullable=False),
+        sa.Column('quantity', sa.Numeric(precision=15, scale=3), nullable=False),
+        sa.Column('reserved_quantity', sa.Numeric(precision=15, scale=3), nullable=False),
+        sa.Column('available_quantity', sa.Numeric(precision=15, scale=3), nullable=False),
+        sa.Column('last_updated', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['id'], ['stocks.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_summary_warehouse_id', 'stock_summary', ['warehouse_id', 'id'])
+    op.create_index('ix_stock_summary_nomenclature_id', 'stock_summary', ['nomenclature_id'])
+    op.create_index('ix_stock_summary_category_id', 'stock_summary', ['category_id'])
+
+    # Начальное заполнение из текущих остатков
+    op.execute("""
+        INSERT INTO stock_summary (
+            id, nomenclature_id, nomenclature_code, nomenclature_name, category_id,
+            warehouse_id, warehouse_code, warehouse_name,
+            quantity, reserved_quantity, available_quantity, last_updated
+        )
+        SELECT
+            s.id, s.nomenclature_id, n.code, n.name, n.category_id,
+            s.warehouse_id, w.code, w.name,
+            s.quantity, s.reserved_quantity, s.quantity - s.reserved_quantity, s.last_updated
+        FROM stocks s
+        JOIN nomenclature n ON n.id = s.nomenclature_id
+        JOIN warehouses w ON w.id = s.warehouse_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stock_summary_category_id', table_name='stock_summary')
+    op.drop_index('ix_stock_summary_nomenclature_id', table_name='stock_summary')
+    op.drop_index('ix_stock_summary_warehouse_id', table_name='stock_summary')
+    op.drop_table('stock_summary')
@@ -0,0 +1,33 @@
+"""Unique nomenclature per inventory
+
+Revision ID: e7b3a2c94f10
+Revises: c5f0d83a19be
+Create Date: 2026-10-18 15:12:07.482911
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3a2c94f10'
+down_revision = 'c5f0d83a19be'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Дубликаты строк (если есть) удаляются, остается первая строка
+    op.execute("""
+        DELETE FROM inventory_items a
+        USING inventory_items b
+        WHERE a.inventory_id = b.inventory_id
+          AND a.nomenclature_id = b.nomenclature_id
+          AND a.id > b.id
+    """)
+    op.create_unique_constraint(
+        'uq_inventory_items_inventory_nomenclature', 'inventory_items', ['inventory_id', 'nomenclature_id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_inventory_items_inventory_nomenclature', 'inventory_items', type_='unique')
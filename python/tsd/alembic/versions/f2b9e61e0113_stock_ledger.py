@@ -0,0 +1,38 @@
+"""Stock ledger: transfer target warehouse and movement indexes
+
+Revision ID: f2b9e61e0113
+Revises: 4ce09a66d0a1
+Create Date: 2026-10-18 10:04:57.218840
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b9e61e0113'
+down_revision = '4ce09a66d0a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('target_warehouse_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'documents_target_warehouse_id_fkey', 'documents', 'warehouses',
+        ['target_warehouse_id'], ['id']
+    )
+    op.create_index(
+        'ix_stock_movements_nomenclature_warehouse_date', 'stock_movements',
+        ['nomenclature_id', 'warehouse_id', 'date']
+    )
+    op.create_index('ix_stock_movements_document_id', 'stock_movements', ['document_id'])
+    op.create_index('ix_stock_movements_inventory_id', 'stock_movements', ['inventory_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stock_movements_inventory_id', table_name='stock_movements')
+    op.drop_index('ix_stock_movements_document_id', table_name='stock_movements')
+    op.drop_index('ix_stock_movements_nomenclature_warehouse_date', table_name='stock_movements')
+    op.drop_constraint('documents_target_warehouse_id_fkey', 'documents', type_='foreignkey')
+    op.drop_column('documents', 'target_warehouse_id')
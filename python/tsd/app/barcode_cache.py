@@ -0,0 +1,169 @@
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session, joinedload
+from app.config import settings
+from app.models import Barcode, Nomenclature
+from app.schemas import Barcode as BarcodeSchema
+
+
+def _barcode_query(db: Session):
+    """Запрос штрих-кодов со всеми данными, нужными для ответа сканеру"""
+    return db.query(Barcode).options(
+        joinedload(Barcode.nomenclature).joinedload(Nomenclature.category),
+        joinedload(Barcode.nomenclature).joinedload(Nomenclature.base_unit)
+    )
+
+
+class BarcodeIndex:
+    """Индекс штрих-код -> номенклатура в памяти процесса.
+
+    Хранит готовые ответы эндпоинта сканирования только для активных
+    штрих-кодов. Записи живут не дольше ttl_seconds, чтобы изменения,
+    сделанные другими воркерами, со временем подхватывались из базы.
+    """
+
+    def __init__(self, ttl_seconds: int, enabled: bool = True):
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, Tuple[BarcodeSchema, float]] = {}
+        self._by_nomenclature: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, barcode_value: str) -> Optional[BarcodeSchema]:
+        """Получение штрих-кода из индекса с учетом счетчиков попаданий"""
+        with self._lock:
+            entry = self._entries.get(barcode_value)
+            if entry and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            if entry:
+                self._discard_locked(barcode_value)
+            self.misses += 1
+            return None
+
+    def put(self, barcode: Barcode) -> None:
+        """Добавление штрих-кода в индекс (неактивные штрих-коды удаляются)"""
+        if not self.enabled:
+            return
+        if not barcode.is_active:
+            self.discard(barcode.barcode)
+            return
+        item = BarcodeSchema.model_validate(barcode)
+        with self._lock:
+            self._discard_locked(item.barcode)
+            self._entries[item.barcode] = (item, time.monotonic() + self.ttl_seconds)
+            self._by_nomenclature.setdefault(item.nomenclature_id, set()).add(item.barcode)
+
+    def discard(self, barcode_value: str) -> None:
+        """Удаление штрих-кода из индекса"""
+        with self._lock:
+            self._discard_locked(barcode_value)
+
+    def discard_nomenclature(self, nomenclature_id: int) -> None:
+        """Удаление из индекса всех штрих-кодов номенклатуры"""
+        with self._lock:
+            for barcode_value in list(self._by_nomenclature.get(nomenclature_id, ())):
+                self._discard_locked(barcode_value)
+
+    def reload_nomenclature(self, db: Session, *nomenclature_ids: int) -> None:
+        """Перечитывание из базы штрих-кодов указанных номенклатур"""
+        ids = {nomenclature_id for nomenclature_id in nomenclature_ids if nomenclature_id}
+        for nomenclature_id in ids:
+            self.discard_nomenclature(nomenclature_id)
+        if not self.enabled or not ids:
+            return
+        barcodes = _barcode_query(db).filter(
+            Barcode.nomenclature_id.in_(ids),
+            Barcode.is_active == True
+        ).all()
+        for barcode in barcodes:
+            self.put(barcode)
+
+    def load(self, db: Session) -> int:
+        """Полная загрузка индекса из базы (при старте приложения)"""
+        if not self.enabled:
+            return 0
+        barcodes = _barcode_query(db).filter(Barcode.is_active == True).all()
+        with self._lock:
+            self._entries.clear()
+            self._by_nomenclature.clear()
+        for barcode in barcodes:
+            self.put(barcode)
+        return len(barcodes)
+
+    def clear(self) -> None:
+        """Очистка индекса"""
+        with self._lock:
+            self._entries.clear()
+            self._by_nomenclature.clear()
+
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+    def _discard_locked(self, barcode_value: str) -> None:
+        entry = self._entries.pop(barcode_value, None)
+        if entry:
+            values = self._by_nomenclature.get(entry[0].nomenclature_id)
+            if values:
+                values.discard(barcode_value)
+                if not values:
+                    del self._by_nomenclature[entry[0].nomenclature_id]
+
+
+barcode_index = BarcodeIndex(
+    ttl_seconds=settings.barcode_cache_ttl_seconds,
+    enabled=settings.barcode_cache_enabled
+)
+
+
+def resolve_barcode(db: Session, barcode_value: str) -> Optional[BarcodeSchema]:
+    """Поиск активного штрих-кода: сначала в индексе, затем в базе"""
+    item = barcode_index.get(barcode_value)
+    if item:
+        return item
+
+    barcode = _barcode_query(db).filter(
+        Barcode.barcode == barcode_value,
+        Barcode.is_active == True
+    ).first()
+    if not barcode:
+        return None
+
+    barcode_index.put(barcode)
+    return BarcodeSchema.model_validate(barcode)
+
+
+def resolve_barcodes(db: Session, barcode_values: List[str]) -> Dict[str, BarcodeSchema]:
+    """Пакетный поиск активных штрих-кодов: промахи индекса добираются одним запросом IN"""
+    found: Dict[str, BarcodeSchema] = {}
+    missing: List[str] = []
+    for barcode_value in dict.fromkeys(barcode_values):
+        item = barcode_index.get(barcode_value)
+        if item:
+            found[barcode_value] = item
+        else:
+            missing.append(barcode_value)
+
+    if missing:
+        barcodes = _barcode_query(db).filter(
+            Barcode.barcode.in_(missing),
+            Barcode.is_active == True
+        ).all()
+        for barcode in barcodes:
+            barcode_index.put(barcode)
+            found[barcode.barcode] = BarcodeSchema.model_validate(barcode)
+
+    return found
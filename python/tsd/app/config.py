@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -7,7 +7,69 @@ class Settings(BaseSettings):
     secret_key: str = "your-secret-key-change-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+
+    # Пул соединений с PostgreSQL (на каждый процесс uvicorn)
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30  # Ожидание свободного соединения
+    db_pool_pre_ping: bool = True  # Проверка соединения перед выдачей (после перезапуска PostgreSQL)
+    db_pool_recycle_seconds: int = 1800  # Пересоздание соединений старше этого возраста (-1 - не пересоздавать)
+
+    # Ограничение времени выполнения запроса, мс (0 - без ограничения)
+    db_statement_timeout_ms: int = 30000
+    # Ограничения для отдельных маршрутов: префикс пути -> мс (побеждает самый длинный префикс)
+    db_route_statement_timeouts_ms: Dict[str, int] = {
+        "/api/v1/stocks/rebuild": 600000,
+        "/api/v1/stocks/balances": 120000,
+        "/api/v1/snapshot": 120000,
+        "/api/v1/documents/uploads": 120000
+    }
+    # Ограничение для потоковых выгрузок (курсор открыт все время передачи ответа)
+    db_stream_statement_timeout_ms: int = 0
+
+    # Реплики для обработчиков только на чтение (списки, отчеты, выгрузки, сканирование)
+    database_replica_urls: List[str] = []
+    db_replica_max_lag_seconds: float = 5  # Реплика с большим отставанием не используется
+    db_replica_lag_check_seconds: float = 10  # Период проверки отставания каждой реплики
+
+    # Контроль SQL-запросов на HTTP-запрос (поиск N+1)
+    query_inspector_enabled: bool = True
+    query_repeat_threshold: int = 10  # Сколько одинаковых запросов за HTTP-запрос считать N+1
+    query_count_warning: int = 100  # Предупреждение при большем числе запросов на HTTP-запрос
+
+    # Подключение через PgBouncer в режиме transaction: без параметров сессии,
+    # ограничение времени задается SET LOCAL в каждой транзакции
+    db_pgbouncer_mode: bool = False
+
+    # Размер пула потоков, в котором выполняются синхронные обработчики с запросами к БД.
+    # По умолчанию равен числу соединений пула: лишние потоки только ждали бы соединение
+    threadpool_size: Optional[int] = None
+
+    # Индекс штрих-кодов в памяти процесса
+    barcode_cache_enabled: bool = True
+    barcode_cache_ttl_seconds: int = 300  # Время жизни записи (для согласованности между воркерами)
+
+    # Кэш проверенных OAuth токенов
+    token_cache_max_size: int = 10000
+    token_cache_ttl_seconds: int = 60  # Не больше срока действия самого токена
+
+    # Дельта-синхронизация справочников: перекрытие окна изменений
+    sync_overlap_seconds: int = 30
+
+    # Снимки справочников для первичной загрузки устройств
+    snapshot_dir: str = "snapshots"
+    snapshot_keep: int = 3  # Сколько последних версий хранить на диске
+
+    # Ключи идемпотентности для повторных запросов устройств
+    idempotency_key_ttl_hours: int = 48
+
+    # Пересчет инвентаризации через WebSocket: период записи накопленных приращений
+    inventory_count_flush_seconds: float = 1.0
     
+    @property
+    def threadpool_limit(self) -> int:
+        return self.threadpool_size or self.db_pool_size + self.db_max_overflow
+
     class Config:
         env_file = ".env"
 
@@ -1,17 +1,253 @@
-from sqlalchemy import create_engine
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import anyio
+from fastapi import Depends
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker, MANYTOONE
+from starlette.requests import HTTPConnection
 from app.config import settings
+from app.metrics import instrument_engine, instrumented_pool
 
-engine = create_engine(settings.database_url)
+logger = logging.getLogger(__name__)
+
+# Ключ ограничения времени запросов в Session.info
+STATEMENT_TIMEOUT_KEY = "statement_timeout_ms"
+
+
+def _connect_args() -> dict:
+    """Параметры сессии PostgreSQL, передаваемые при подключении.
+
+    PgBouncer в режиме transaction не принимает параметр options, поэтому
+    в этом режиме ограничение задается в транзакции. psycopg2 не использует
+    подготовленные на сервере запросы, дополнительно отключать их не нужно.
+    """
+    if settings.db_pgbouncer_mode or not settings.db_statement_timeout_ms:
+        return {}
+    return {"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"}
+
+
+def _create_engine(url: str, label: str) -> Engine:
+    db_engine = create_engine(
+        url,
+        poolclass=instrumented_pool(label),
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout_seconds,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_recycle=settings.db_pool_recycle_seconds,
+        connect_args=_connect_args()
+    )
+    instrument_engine(db_engine, label)
+    return db_engine
+
+
+engine = _create_engine(settings.database_url, "primary")
+replica_engines = [_create_engine(url, "replica") for url in settings.database_replica_urls]
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
+def set_statement_timeout(db, timeout_ms: int) -> None:
+    """Ограничение времени запросов сессии, мс (0 - без ограничения).
+
+    Действует с начала следующей транзакции сессии.
+    """
+    db.info[STATEMENT_TIMEOUT_KEY] = timeout_ms
+
+
+@event.listens_for(SessionLocal, "after_begin")
+def _apply_statement_timeout(session, transaction, connection):
+    """SET LOCAL, если ограничение сессии отличается от заданного при подключении"""
+    timeout = session.info.get(STATEMENT_TIMEOUT_KEY, settings.db_statement_timeout_ms)
+    connection_default = 0 if settings.db_pgbouncer_mode else settings.db_statement_timeout_ms
+    if timeout != connection_default:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+
+def route_statement_timeout(path: str) -> Optional[int]:
+    """Ограничение времени запросов для маршрута (по самому длинному префиксу)"""
+    prefixes = [prefix for prefix in settings.db_route_statement_timeouts_ms if path.startswith(prefix)]
+    if not prefixes:
+        return None
+    return settings.db_route_statement_timeouts_ms[max(prefixes, key=len)]
+
+
+# Отставание реплики, сек; на основной БД и при полностью примененном WAL - 0
+REPLICATION_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+
+class ReplicaRouter:
+    """Выбор реплики для чтения с учетом отставания.
+
+    Отставание реплик проверяется фоновой задачей (run_replica_monitor) раз
+    в db_replica_lag_check_seconds, выбор реплики в запросе не ждет проверки.
+    Реплики перебираются по кругу; недоступная, еще не проверенная или
+    отстающая больше db_replica_max_lag_seconds пропускается, если подходящих
+    нет - чтение идет с основной БД.
+    """
+
+    def __init__(self, replicas: List[Engine]):
+        self._replicas = replicas
+        self._lags: Dict[Engine, Tuple[float, Optional[float]]] = {}
+        self._lock = threading.Lock()
+        self._next = itertools.count()
+
+    def _measure_lag(self, replica: Engine) -> Optional[float]:
+        try:
+            with replica.connect() as connection:
+                lag = connection.exec_driver_sql(REPLICATION_LAG_SQL).scalar()
+        except Exception:
+            logger.warning("Реплика %s недоступна", replica.url.render_as_string(hide_password=True), exc_info=True)
+            return None
+        return float(lag) if lag is not None else None
+
+    def refresh(self) -> None:
+        """Проверка отставания всех реплик"""
+        for replica in self._replicas:
+            lag = self._measure_lag(replica)
+            with self._lock:
+                self._lags[replica] = (time.monotonic(), lag)
+
+    def lag(self, replica: Engine) -> Optional[float]:
+        """Отставание реплики по последней проверке (None - недоступна или неизвестно).
+
+        Устаревшая проверка (фоновая задача не успевает) не используется.
+        """
+        with self._lock:
+            checked = self._lags.get(replica)
+        if checked is None or time.monotonic() - checked[0] > 2 * settings.db_replica_lag_check_seconds:
+            return None
+        return checked[1]
+
+    def choose(self) -> Engine:
+        """Реплика с допустимым отставанием или основная БД"""
+        if not self._replicas:
+            return engine
+        start = next(self._next)
+        for offset in range(len(self._replicas)):
+            replica = self._replicas[(start + offset) % len(self._replicas)]
+            lag = self.lag(replica)
+            if lag is not None and lag <= settings.db_replica_max_lag_seconds:
+                return replica
+        return engine
+
+    def status(self) -> List[dict]:
+        with self._lock:
+            lags = dict(self._lags)
+        return [
+            {
+                "url": replica.url.render_as_string(hide_password=True),
+                "lag_seconds": lags.get(replica, (None, None))[1],
+                "checked_out": replica.pool.checkedout()
+            }
+            for replica in self._replicas
+        ]
+
+
+replica_router = ReplicaRouter(replica_engines)
+
+
+async def run_replica_monitor() -> None:
+    """Периодическая проверка отставания реплик"""
+    if not replica_engines:
+        return
+    while True:
+        await anyio.to_thread.run_sync(replica_router.refresh)
+        await asyncio.sleep(settings.db_replica_lag_check_seconds)
+
+
+def read_session():
+    """Сессия только для чтения (реплика или основная БД)"""
+    return SessionLocal(bind=replica_router.choose())
+
+
+def _request_session(connection: HTTPConnection, db):
+    timeout = route_statement_timeout(connection.url.path)
+    if timeout is not None:
+        set_statement_timeout(db, timeout)
     try:
         yield db
     finally:
         db.close()
+
+
+def get_db(connection: HTTPConnection):
+    yield from _request_session(connection, SessionLocal())
+
+
+def get_read_db(connection: HTTPConnection, db: Session = Depends(get_db)):
+    """Сессия для обработчиков только на чтение: списки, отчеты, сканирование.
+
+    Данные могут отставать от основной БД не больше db_replica_max_lag_seconds,
+    поэтому дельта-синхронизация и чтение сразу после записи остаются на get_db.
+    Если реплика не выбрана, используется сессия запроса из get_db (та же,
+    что у авторизации), а не второе соединение с основной БД.
+    """
+    bind = replica_router.choose()
+    if bind is engine:
+        yield db
+        return
+    yield from _request_session(connection, SessionLocal(bind=bind))
+
+
+def pool_status() -> dict:
+    """Состояние пула соединений процесса"""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": settings.db_max_overflow,
+        "timeout_seconds": settings.db_pool_timeout_seconds,
+        "pgbouncer_mode": settings.db_pgbouncer_mode,
+        "replicas": replica_router.status()
+    }
+
+
+def _changed_references(instance):
+    """Связи many-to-one, у которых в этом запросе изменился внешний ключ"""
+    state = inspect(instance)
+    changed = []
+    for relationship in state.mapper.relationships:
+        if relationship.direction is not MANYTOONE:
+            continue
+        keys = [state.mapper.get_property_by_column(column).key for column in relationship.local_columns]
+        if any(state.attrs[key].history.has_changes() for key in keys):
+            changed.append(relationship.key)
+    return changed
+
+
+def flush_response(db, instance, schema):
+    """Отправка изменений и сборка ответа без повторной выборки.
+
+    id и серверные значения (created_at, updated_at) приходят в RETURNING
+    того же INSERT/UPDATE (eager_defaults у моделей), а связанные объекты
+    берутся из identity map сессии.
+    """
+    changed = _changed_references(instance)
+    db.flush()
+    if changed:
+        # Уже загруженная связь не следует за новым внешним ключом
+        db.expire(instance, changed)
+    return schema.model_validate(instance)
+
+
+def commit_with_response(db, instance, schema):
+    """Фиксация изменений с ответом, собранным до commit: после commit
+    не нужны refresh и повторная выборка со связями"""
+    response = flush_response(db, instance, schema)
+    db.commit()
+    return response
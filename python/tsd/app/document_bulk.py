@@ -0,0 +1,102 @@
+from typing import Iterable, List, Optional
+from fastapi import HTTPException, status
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, joinedload
+from app.models import (
+    Document, DocumentItem, DocumentType, Nomenclature, UnitOfMeasure, Warehouse
+)
+from app.schemas import DocumentBase, DocumentItemCreate
+
+
+def missing_ids(db: Session, id_column, ids: Iterable[int]) -> List[int]:
+    """ID, которых нет в таблице (одна проверка на весь набор)"""
+    ids = set(ids)
+    if not ids:
+        return []
+    found = set(db.execute(select(id_column).where(id_column.in_(ids))).scalars())
+    return sorted(ids - found)
+
+
+def validate_document_header(db: Session, document_data: DocumentBase) -> None:
+    """Проверка склада, склада-получателя и уникальности номера документа"""
+    warehouse_ids = [document_data.warehouse_id]
+    if document_data.target_warehouse_id:
+        warehouse_ids.append(document_data.target_warehouse_id)
+    missing_warehouses = missing_ids(db, Warehouse.id, warehouse_ids)
+    if document_data.warehouse_id in missing_warehouses:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Склад не найден"
+        )
+    if missing_warehouses:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Склад-получатель не найден"
+        )
+
+    existing_document = db.query(Document.id).filter(
+        Document.document_number == document_data.document_number
+    ).first()
+    if existing_document:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Документ с таким номером уже существует"
+        )
+
+
+def validate_document_lines(
+    db: Session,
+    document_type: DocumentType,
+    items: List[DocumentItemCreate],
+    document_id: Optional[int] = None
+) -> None:
+    """Проверка номенклатуры и единиц измерения всех строк наборами"""
+    missing_nomenclature = missing_ids(db, Nomenclature.id, (item.nomenclature_id for item in items))
+    if missing_nomenclature:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Номенклатура не найдена: {', '.join(map(str, missing_nomenclature))}"
+        )
+
+    missing_units = missing_ids(db, UnitOfMeasure.id, (item.unit_id for item in items))
+    if missing_units:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Единица измерения не найдена: {', '.join(map(str, missing_units))}"
+        )
+
+    # Для документа "Ввод остатков" номенклатура не должна дублироваться
+    if document_type == DocumentType.STOCK_INPUT:
+        nomenclature_ids = [item.nomenclature_id for item in items]
+        duplicated = len(nomenclature_ids) != len(set(nomenclature_ids))
+        if not duplicated and document_id is not None:
+            duplicated = db.query(DocumentItem.id).filter(
+                DocumentItem.document_id == document_id,
+                DocumentItem.nomenclature_id.in_(set(nomenclature_ids))
+            ).first() is not None
+        if duplicated:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Номенклатура уже добавлена в документ"
+            )
+
+
+def insert_document_lines(db: Session, document_id: int, items: List[DocumentItemCreate]) -> int:
+    """Запись всех строк документа одним INSERT (executemany)"""
+    if not items:
+        return 0
+    db.execute(
+        insert(DocumentItem),
+        [dict(item.model_dump(), document_id=document_id) for item in items]
+    )
+    return len(items)
+
+
+def load_document_with_items(db: Session, document_id: int) -> Optional[Document]:
+    """Документ со складом, автором и строками для ответа"""
+    return db.query(Document).options(
+        joinedload(Document.warehouse),
+        joinedload(Document.creator),
+        joinedload(Document.items).joinedload(DocumentItem.nomenclature),
+        joinedload(Document.items).joinedload(DocumentItem.unit)
+    ).populate_existing().filter(Document.id == document_id).first()
@@ -0,0 +1,220 @@
+import enum
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional
+from sqlalchemy import func, select
+from app.inventory_counts import counted_quantity
+from app.models import (
+    Document, DocumentItem, Inventory, InventoryItem, Nomenclature, StockMovement,
+    StockSummaryRow, Warehouse, DocumentStatus, DocumentType, InventoryStatus
+)
+from app.streaming import csv_stream_response, ndjson_stream_response, stream_statement
+
+
+class ExportFormat(str, enum.Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+def _columns(statement) -> List[str]:
+    return [column.key for column in statement.selected_columns]
+
+
+def stocks_statement(warehouse_id: Optional[int] = None, nomenclature_id: Optional[int] = None):
+    """Остатки из сводки (без соединений)"""
+    statement = select(
+        StockSummaryRow.id,
+        StockSummaryRow.nomenclature_id,
+        StockSummaryRow.nomenclature_code,
+        StockSummaryRow.nomenclature_name,
+        StockSummaryRow.category_id,
+        StockSummaryRow.warehouse_id,
+        StockSummaryRow.warehouse_code,
+        StockSummaryRow.warehouse_name,
+        StockSummaryRow.quantity,
+        StockSummaryRow.reserved_quantity,
+        StockSummaryRow.available_quantity,
+        StockSummaryRow.last_updated
+    )
+    if warehouse_id:
+        statement = statement.where(StockSummaryRow.warehouse_id == warehouse_id)
+    if nomenclature_id:
+        statement = statement.where(StockSummaryRow.nomenclature_id == nomenclature_id)
+    return statement.order_by(StockSummaryRow.id)
+
+
+def movements_statement(
+    warehouse_id: Optional[int] = None,
+    nomenclature_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+):
+    """Журнал движений с кодами номенклатуры и склада"""
+    statement = select(
+        StockMovement.id,
+        StockMovement.date,
+        StockMovement.movement_type,
+        StockMovement.nomenclature_id,
+        Nomenclature.code.label("nomenclature_code"),
+        Nomenclature.name.label("nomenclature_name"),
+        StockMovement.warehouse_id,
+        Warehouse.code.label("warehouse_code"),
+        StockMovement.quantity,
+        StockMovement.document_id,
+        StockMovement.inventory_id,
+        StockMovement.user_id,
+        StockMovement.description
+    ).join(
+        Nomenclature, StockMovement.nomenclature_id == Nomenclature.id
+    ).join(
+        Warehouse, StockMovement.warehouse_id == Warehouse.id
+    )
+    if warehouse_id:
+        statement = statement.where(StockMovement.warehouse_id == warehouse_id)
+    if nomenclature_id:
+        statement = statement.where(StockMovement.nomenclature_id == nomenclature_id)
+    if date_from:
+        statement = statement.where(StockMovement.date >= date_from)
+    if date_to:
+        statement = statement.where(StockMovement.date <= date_to)
+    return statement.order_by(StockMovement.date, StockMovement.id)
+
+
+# Поля заголовка документа; остальные поля строки выгрузки относятся к строке документа
+DOCUMENT_FIELDS = [
+    "id", "document_type", "document_number", "warehouse_id", "warehouse_code",
+    "target_warehouse_id", "date", "status", "created_by", "description", "created_at"
+]
+
+
+def documents_statement(
+    warehouse_id: Optional[int] = None,
+    document_type: Optional[DocumentType] = None,
+    status: Optional[DocumentStatus] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+):
+    """Документы со строками: одна строка выгрузки на строку документа"""
+    statement = select(
+        Document.id,
+        Document.document_type,
+        Document.document_number,
+        Document.warehouse_id,
+        Warehouse.code.label("warehouse_code"),
+        Document.target_warehouse_id,
+        Document.date,
+        Document.status,
+        Document.created_by,
+        Document.description,
+        Document.created_at,
+        DocumentItem.id.label("item_id"),
+        DocumentItem.nomenclature_id,
+        Nomenclature.code.label("nomenclature_code"),
+        DocumentItem.quantity,
+        DocumentItem.unit_id,
+        DocumentItem.price,
+        DocumentItem.total,
+        DocumentItem.description.label("item_description")
+    ).join(
+        Warehouse, Document.warehouse_id == Warehouse.id
+    ).outerjoin(
+        DocumentItem, DocumentItem.document_id == Document.id
+    ).outerjoin(
+        Nomenclature, DocumentItem.nomenclature_id == Nomenclature.id
+    )
+    if warehouse_id:
+        statement = statement.where(Document.warehouse_id == warehouse_id)
+    if document_type:
+        statement = statement.where(Document.document_type == document_type)
+    if status:
+        statement = statement.where(Document.status == status)
+    if date_from:
+        statement = statement.where(Document.date >= date_from)
+    if date_to:
+        statement = statement.where(Document.date <= date_to)
+    return statement.order_by(Document.id, DocumentItem.id)
+
+
+INVENTORY_FIELDS = [
+    "id", "inventory_number", "warehouse_id", "warehouse_code", "date_start", "date_end",
+    "status", "created_by", "description", "created_at"
+]
+
+
+def inventories_statement(
+    warehouse_id: Optional[int] = None,
+    status: Optional[InventoryStatus] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+):
+    """Инвентаризации со строками: одна строка выгрузки на строку инвентаризации.
+
+    Факт строк инвентаризации в процессе - сумма вкладов счетчиков.
+    """
+    actual_quantity = func.coalesce(counted_quantity(), InventoryItem.actual_quantity)
+    statement = select(
+        Inventory.id,
+        Inventory.inventory_number,
+        Inventory.warehouse_id,
+        Warehouse.code.label("warehouse_code"),
+        Inventory.date_start,
+        Inventory.date_end,
+        Inventory.status,
+        Inventory.created_by,
+        Inventory.description,
+        Inventory.created_at,
+        InventoryItem.id.label("item_id"),
+        InventoryItem.nomenclature_id,
+        Nomenclature.code.label("nomenclature_code"),
+        InventoryItem.planned_quantity,
+        actual_quantity.label("actual_quantity"),
+        (actual_quantity - InventoryItem.planned_quantity).label("difference"),
+        InventoryItem.unit_id,
+        InventoryItem.counted_by,
+        InventoryItem.counted_at
+    ).join(
+        Warehouse, Inventory.warehouse_id == Warehouse.id
+    ).outerjoin(
+        InventoryItem, InventoryItem.inventory_id == Inventory.id
+    ).outerjoin(
+        Nomenclature, InventoryItem.nomenclature_id == Nomenclature.id
+    )
+    if warehouse_id:
+        statement = statement.where(Inventory.warehouse_id == warehouse_id)
+    if status:
+        statement = statement.where(Inventory.status == status)
+    if date_from:
+        statement = statement.where(Inventory.date_start >= date_from)
+    if date_to:
+        statement = statement.where(Inventory.date_start <= date_to)
+    return statement.order_by(Inventory.id, InventoryItem.id)
+
+
+def nest_items(rows: Iterable[dict], header_fields: List[str]) -> Iterator[dict]:
+    """Сборка заголовка со строками из отсортированного по заголовку потока.
+
+    В памяти держится только текущий документ.
+    """
+    current = None
+    for row in rows:
+        if current is None or current["id"] != row["id"]:
+            if current is not None:
+                yield current
+            current = {field: row[field] for field in header_fields}
+            current["items"] = []
+        if row["item_id"] is not None:
+            item = {key: value for key, value in row.items() if key not in header_fields}
+            item["id"] = item.pop("item_id")
+            current["items"].append(item)
+    if current is not None:
+        yield current
+
+
+def export_response(statement, export_format: ExportFormat, name: str, header_fields: Optional[List[str]] = None):
+    """Потоковая выгрузка запроса в NDJSON или CSV"""
+    rows = stream_statement(lambda: statement)
+    filename = f"{name}.{export_format.value}"
+    if export_format == ExportFormat.CSV:
+        return csv_stream_response(_columns(statement), rows, filename)
+    if header_fields:
+        rows = nest_items(rows, header_fields)
+    return ndjson_stream_response(rows, filename)
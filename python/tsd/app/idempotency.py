@@ -0,0 +1,111 @@
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import IdempotencyKey
+
+# Заголовок запроса с ключом идемпотентности
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+# Заголовок ответа, отданного из сохраненного результата
+IDEMPOTENT_REPLAY_HEADER = "Idempotent-Replayed"
+
+
+def request_fingerprint(scope: str, payload: Any = None) -> str:
+    """Отпечаток запроса: эндпоинт и тело"""
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{scope}\n{body}".encode()).hexdigest()
+
+
+def begin_idempotent_request(
+    db: Session,
+    user_id: int,
+    key: Optional[str],
+    fingerprint: str
+) -> Optional[JSONResponse]:
+    """Захват ключа идемпотентности в текущей транзакции.
+
+    Возвращает сохраненный ответ, если запрос с этим ключом уже выполнен.
+    Иначе вставляет запись ключа: параллельный повтор с тем же ключом ждет
+    на уникальном индексе до фиксации или отката этой транзакции.
+    """
+    if not key:
+        return None
+
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.idempotency_key_ttl_hours)
+    inserted = db.execute(
+        pg_insert(IdempotencyKey)
+        .values(user_id=user_id, key=key, request_hash=fingerprint)
+        .on_conflict_do_nothing(constraint="uq_idempotency_keys_user_key")
+        .returning(IdempotencyKey.id)
+    ).scalar()
+    if inserted is not None:
+        return None
+
+    stored = db.execute(
+        select(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key
+        )
+    ).scalar_one()
+
+    if stored.created_at < cutoff:
+        # Просроченный ключ используется заново
+        stored.request_hash = fingerprint
+        stored.status_code = None
+        stored.response_body = None
+        stored.created_at = datetime.now(timezone.utc)
+        db.flush()
+        return None
+
+    if stored.request_hash != fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Ключ идемпотентности уже использован для другого запроса"
+        )
+
+    if stored.status_code is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Запрос с этим ключом идемпотентности еще выполняется"
+        )
+
+    return JSONResponse(
+        content=stored.response_body,
+        status_code=stored.status_code,
+        headers={IDEMPOTENT_REPLAY_HEADER: "true"}
+    )
+
+
+def store_idempotent_response(
+    db: Session,
+    user_id: int,
+    key: Optional[str],
+    body: Any,
+    status_code: int = status.HTTP_200_OK
+) -> None:
+    """Сохранение ответа для ключа (до commit, в той же транзакции, что и изменения)"""
+    if not key:
+        return
+    stored = db.execute(
+        select(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key
+        )
+    ).scalar_one()
+    stored.status_code = status_code
+    stored.response_body = jsonable_encoder(body)
+
+
+def purge_expired_keys(db: Session) -> int:
+    """Удаление просроченных ключей идемпотентности"""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.idempotency_key_ttl_hours)
+    result = db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff))
+    db.commit()
+    return result.rowcount
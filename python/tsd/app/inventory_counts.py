@@ -0,0 +1,382 @@
+import asyncio
+import logging
+import threading
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+import anyio
+from sqlalchemy import and_, func, insert, select, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from app.barcode_cache import resolve_barcodes
+from app.config import settings
+from app.database import SessionLocal
+from app.models import (
+    Inventory, InventoryItem, InventoryStatus, InventoryCountContribution, InventoryCountLog, Nomenclature, Stock, User
+)
+from app.schemas import InventoryCountEvent
+
+logger = logging.getLogger(__name__)
+
+# Количество строк в одном INSERT ... ON CONFLICT
+UPSERT_CHUNK_SIZE = 1000
+
+# Заголовок с ID устройства, с которого ведется пересчет
+DEVICE_ID_HEADER = "X-Device-Id"
+
+
+def resolve_count_events(
+    db: Session,
+    events: List[InventoryCountEvent]
+) -> Tuple[Dict[int, Decimal], List[str], int]:
+    """Сведение событий пересчета в приращения по номенклатуре.
+
+    Штрих-коды распознаются пакетно (индекс в памяти, промахи одним запросом).
+    Возвращает приращения, нераспознанные штрих-коды и количество принятых событий.
+    """
+    barcodes = [event.barcode for event in events if event.nomenclature_id is None and event.barcode]
+    found = resolve_barcodes(db, barcodes) if barcodes else {}
+
+    increments: Dict[int, Decimal] = {}
+    not_found: List[str] = []
+    accepted = 0
+    for event in events:
+        nomenclature_id = event.nomenclature_id
+        if nomenclature_id is None and event.barcode in found:
+            nomenclature_id = found[event.barcode].nomenclature_id
+        if nomenclature_id is None:
+            not_found.append(event.barcode or "")
+            continue
+        increments[nomenclature_id] = increments.get(nomenclature_id, Decimal("0")) + event.quantity
+        accepted += 1
+    return increments, not_found, accepted
+
+
+# Ключ вклада: (номенклатура, пользователь, устройство)
+CounterKey = Tuple[int, int, str]
+
+
+def counter_increments(increments: Dict[int, Decimal], user_id: int, device_id: Optional[str]) -> Dict[CounterKey, Decimal]:
+    """Приращения по номенклатуре от одного счетчика"""
+    return {
+        (nomenclature_id, user_id, device_id or ""): quantity
+        for nomenclature_id, quantity in increments.items()
+    }
+
+
+def _count_totals(inventory_ids: List[int], nomenclature_ids: Optional[List[int]] = None):
+    """Сумма вкладов, время последнего пересчета и последний счетчик по инвентаризации и номенклатуре"""
+    totals = select(
+        InventoryCountContribution.inventory_id,
+        InventoryCountContribution.nomenclature_id,
+        func.sum(InventoryCountContribution.quantity).label("quantity"),
+        func.max(InventoryCountContribution.updated_at).label("counted_at"),
+        func.array_agg(
+            aggregate_order_by(InventoryCountContribution.user_id, InventoryCountContribution.updated_at.desc())
+        )[1].label("counted_by")
+    ).where(
+        InventoryCountContribution.inventory_id.in_(inventory_ids)
+    )
+    if nomenclature_ids is not None:
+        totals = totals.where(InventoryCountContribution.nomenclature_id.in_(nomenclature_ids))
+    return totals.group_by(InventoryCountContribution.inventory_id, InventoryCountContribution.nomenclature_id)
+
+
+def counted_quantity():
+    """Сумма вкладов строки инвентаризации (коррелированный подзапрос для выборок по inventory_items)"""
+    return select(
+        func.sum(InventoryCountContribution.quantity)
+    ).where(
+        InventoryCountContribution.inventory_id == InventoryItem.inventory_id,
+        InventoryCountContribution.nomenclature_id == InventoryItem.nomenclature_id
+    ).correlate(InventoryItem).scalar_subquery()
+
+
+def overlay_counts(db: Session, items: List[InventoryItem], nomenclature_ids: Optional[List[int]] = None) -> None:
+    """Факт строк в ответе - сумма вкладов счетчиков на момент чтения.
+
+    При пересчете строки не обновляются (счетчики не конкурируют за одну
+    запись), в таблицу факт записывается при завершении инвентаризации.
+    Значения выставляются как загруженные из БД и не попадают во flush.
+    Суммы строк всех инвентаризаций и счетчики загружаются двумя запросами.
+    """
+    if not items:
+        return
+    inventory_ids = sorted({item.inventory_id for item in items})
+    totals = {
+        (row.inventory_id, row.nomenclature_id): row
+        for row in db.execute(_count_totals(inventory_ids, nomenclature_ids))
+    }
+    user_ids = {total.counted_by for total in totals.values()}
+    users = {user.id: user for user in db.query(User).filter(User.id.in_(user_ids))} if user_ids else {}
+    for item in items:
+        total = totals.get((item.inventory_id, item.nomenclature_id))
+        if total is None:
+            continue
+        set_committed_value(item, "actual_quantity", total.quantity)
+        set_committed_value(item, "difference", total.quantity - item.planned_quantity)
+        set_committed_value(item, "counted_at", total.counted_at)
+        set_committed_value(item, "counted_by", total.counted_by)
+        set_committed_value(item, "counter", users.get(total.counted_by))
+
+
+def merge_counts(db: Session, inventory_id: int) -> int:
+    """Запись факта строк = сумма вкладов всех счетчиков (одним UPDATE ... FROM).
+
+    Выполняется при завершении под блокировкой инвентаризации FOR UPDATE:
+    запись вкладов держит FOR SHARE на ту же строку, поэтому новые вклады
+    не появляются между подсчетом суммы и обновлением строк.
+    """
+    totals = _count_totals([inventory_id]).subquery()
+    stmt = update(InventoryItem).where(
+        InventoryItem.inventory_id == inventory_id,
+        InventoryItem.nomenclature_id == totals.c.nomenclature_id
+    ).values(
+        actual_quantity=totals.c.quantity,
+        difference=totals.c.quantity - InventoryItem.planned_quantity,
+        counted_by=totals.c.counted_by,
+        counted_at=totals.c.counted_at,
+        updated_at=func.now()
+    ).execution_options(synchronize_session=False)
+    return db.execute(stmt).rowcount
+
+
+def _write_contributions(db: Session, inventory_id: int, increments: Dict[CounterKey, Decimal], replace: bool) -> None:
+    """Журнал приращений и вклады счетчиков (каждый счетчик - своя запись)"""
+    keys = sorted(increments)
+    db.execute(
+        insert(InventoryCountLog),
+        [
+            {
+                "inventory_id": inventory_id,
+                "nomenclature_id": nomenclature_id,
+                "user_id": user_id,
+                "device_id": device_id,
+                "quantity": increments[(nomenclature_id, user_id, device_id)]
+            }
+            for nomenclature_id, user_id, device_id in keys
+        ]
+    )
+
+    for start in range(0, len(keys), UPSERT_CHUNK_SIZE):
+        stmt = pg_insert(InventoryCountContribution).values([
+            {
+                "inventory_id": inventory_id,
+                "nomenclature_id": nomenclature_id,
+                "user_id": user_id,
+                "device_id": device_id,
+                "quantity": increments[(nomenclature_id, user_id, device_id)]
+            }
+            for nomenclature_id, user_id, device_id in keys[start:start + UPSERT_CHUNK_SIZE]
+        ])
+        quantity = stmt.excluded.quantity if replace else InventoryCountContribution.quantity + stmt.excluded.quantity
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["inventory_id", "nomenclature_id", "user_id", "device_id"],
+            set_={"quantity": quantity, "updated_at": func.now()}
+        )
+        db.execute(stmt)
+
+
+def lock_inventory_for_counts(db: Session, inventory_id: int) -> Optional[Inventory]:
+    """Инвентаризация с блокировкой FOR SHARE для записи пересчета.
+
+    Счетчики не мешают друг другу, а завершение и отмена (FOR UPDATE)
+    ждут фиксации уже начатых записей и видят их вклады.
+    """
+    return db.query(Inventory).filter(
+        Inventory.id == inventory_id
+    ).with_for_update(read=True).populate_existing().first()
+
+
+def apply_counts(db: Session, inventory: Inventory, increments: Dict[CounterKey, Decimal]) -> List[int]:
+    """Применение приращений пересчета.
+
+    Приращение пишется в журнал и прибавляется к вкладу своего счетчика
+    (пользователь и устройство), поэтому счетчики не конкурируют за одну
+    запись и не перетирают друг друга. Отсутствующие строки создаются
+    с плановым количеством из остатка склада; факт строк не пересчитывается
+    (см. overlay_counts и merge_counts). Вызывающий держит FOR SHARE
+    на инвентаризации со статусом IN_PROGRESS (lock_inventory_for_counts).
+    Возвращает ID номенклатуры, к которой применены приращения.
+    """
+    if not increments:
+        return []
+
+    nomenclature = db.execute(
+        select(
+            Nomenclature.id,
+            Nomenclature.base_unit_id,
+            func.coalesce(Stock.quantity, 0)
+        ).outerjoin(
+            Stock,
+            and_(
+                Stock.nomenclature_id == Nomenclature.id,
+                Stock.warehouse_id == inventory.warehouse_id
+            )
+        ).where(
+            Nomenclature.id.in_({key[0] for key in increments})
+        ).order_by(Nomenclature.id)
+    ).all()
+    if not nomenclature:
+        return []
+
+    applied = [nomenclature_id for nomenclature_id, _, _ in nomenclature]
+    applied_set = set(applied)
+    _write_contributions(
+        db, inventory.id,
+        {key: quantity for key, quantity in increments.items() if key[0] in applied_set},
+        replace=False
+    )
+
+    for start in range(0, len(nomenclature), UPSERT_CHUNK_SIZE):
+        stmt = pg_insert(InventoryItem).values([
+            {
+                "inventory_id": inventory.id,
+                "nomenclature_id": nomenclature_id,
+                "planned_quantity": planned_quantity,
+                "unit_id": unit_id
+            }
+            for nomenclature_id, unit_id, planned_quantity in nomenclature[start:start + UPSERT_CHUNK_SIZE]
+        ]).on_conflict_do_nothing(constraint="uq_inventory_items_inventory_nomenclature")
+        db.execute(stmt)
+
+    return applied
+
+
+def set_own_count(
+    db: Session,
+    inventory_id: int,
+    nomenclature_id: int,
+    user_id: int,
+    device_id: Optional[str],
+    quantity: Decimal
+) -> None:
+    """Установка количества, посчитанного одним счетчиком (остальные вклады не меняются)"""
+    device_id = device_id or ""
+    own = db.query(InventoryCountContribution.quantity).filter(
+        InventoryCountContribution.inventory_id == inventory_id,
+        InventoryCountContribution.nomenclature_id == nomenclature_id,
+        InventoryCountContribution.user_id == user_id,
+        InventoryCountContribution.device_id == device_id
+    ).scalar() or Decimal("0")
+    if quantity != own:
+        # В журнал пишется разница, вклад заменяется новым значением
+        db.execute(
+            insert(InventoryCountLog),
+            [{
+                "inventory_id": inventory_id,
+                "nomenclature_id": nomenclature_id,
+                "user_id": user_id,
+                "device_id": device_id,
+                "quantity": quantity - own
+            }]
+        )
+        stmt = pg_insert(InventoryCountContribution).values(
+            inventory_id=inventory_id,
+            nomenclature_id=nomenclature_id,
+            user_id=user_id,
+            device_id=device_id,
+            quantity=quantity
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["inventory_id", "nomenclature_id", "user_id", "device_id"],
+            set_={"quantity": stmt.excluded.quantity, "updated_at": func.now()}
+        )
+        db.execute(stmt)
+
+
+def _resolve_waiter(waiter: asyncio.Future, applied: Optional[int]) -> None:
+    if not waiter.done():
+        waiter.set_result(applied)
+
+
+class CountBuffer:
+    """Накопление приращений пересчета в памяти процесса.
+
+    События потока (WebSocket) суммируются по инвентаризации и счетчику
+    и периодически записываются пакетом, каждая инвентаризация - своей
+    транзакцией. add возвращает future, который завершается после фиксации
+    пакета: количество примененной номенклатуры или None, если инвентаризация
+    уже не в процессе и приращения не записаны. Подтверждение клиенту
+    отправляется только по нему, поэтому незаписанный пересчет не теряется
+    молча, в том числе при завершении инвентаризации другим воркером.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, Dict[CounterKey, Decimal]] = {}
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, inventory_id: int, increments: Dict[CounterKey, Decimal]) -> asyncio.Future:
+        waiter = asyncio.get_running_loop().create_future()
+        self._merge(inventory_id, increments, [waiter])
+        return waiter
+
+    def _merge(self, inventory_id: int, increments: Dict[CounterKey, Decimal], waiters: List[asyncio.Future]) -> None:
+        with self._lock:
+            pending = self._pending.setdefault(inventory_id, {})
+            for key, quantity in increments.items():
+                pending[key] = pending.get(key, Decimal("0")) + quantity
+            self._waiters.setdefault(inventory_id, []).extend(waiters)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(len(pending) for pending in self._pending.values())
+
+    def _drain(self, inventory_id: Optional[int]) -> Dict[int, Tuple[Dict[CounterKey, Decimal], List[asyncio.Future]]]:
+        with self._lock:
+            ids = [inventory_id] if inventory_id is not None else list(self._pending)
+            return {
+                key: (self._pending.pop(key, {}), self._waiters.pop(key, []))
+                for key in ids
+                if key in self._pending
+            }
+
+    def _write(self, inventory_id: int, increments: Dict[CounterKey, Decimal]) -> Optional[int]:
+        db = SessionLocal()
+        try:
+            inventory = lock_inventory_for_counts(db, inventory_id)
+            # В завершенную или отмененную инвентаризацию приращения не пишутся
+            if inventory is None or inventory.status != InventoryStatus.IN_PROGRESS:
+                return None
+            applied = len(apply_counts(db, inventory, increments))
+            db.commit()
+            return applied
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def flush(self, inventory_id: Optional[int] = None) -> int:
+        """Запись накопленных приращений (всех или одной инвентаризации).
+
+        Ошибка записи одной инвентаризации не задерживает остальные: ее
+        приращения возвращаются в буфер до следующей попытки. При записи
+        одной инвентаризации ошибка передается вызывающему.
+        """
+        applied = 0
+        for key, (increments, waiters) in self._drain(inventory_id).items():
+            try:
+                written = self._write(key, increments)
+            except Exception:
+                self._merge(key, increments, waiters)
+                if inventory_id is not None:
+                    raise
+                logger.exception("Ошибка записи пересчета инвентаризации %s", key)
+                continue
+            for waiter in waiters:
+                waiter.get_loop().call_soon_threadsafe(_resolve_waiter, waiter, written)
+            applied += written or 0
+        return applied
+
+
+count_buffer = CountBuffer()
+
+
+async def run_count_flusher() -> None:
+    """Периодическая запись накопленных приращений пересчета"""
+    while True:
+        await asyncio.sleep(settings.inventory_count_flush_seconds)
+        # Ошибки записи журналируются в flush, приращения остаются в буфере
+        await anyio.to_thread.run_sync(count_buffer.flush)
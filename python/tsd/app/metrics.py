@@ -0,0 +1,197 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from starlette.responses import Response
+from app.query_inspector import RequestStats, report_request
+
+# Маршрут не найден (404): одна метка, чтобы произвольные пути не раздували число рядов
+UNMATCHED_ROUTE = "unmatched"
+
+REQUEST_LATENCY = Histogram(
+    "tsd_http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route", "status"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "tsd_http_requests_in_flight",
+    "Запросы в обработке",
+    multiprocess_mode="livesum"
+)
+
+DB_QUERY_DURATION = Histogram(
+    "tsd_db_query_duration_seconds",
+    "Время выполнения SQL-запроса",
+    ["pool"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "tsd_db_queries_per_request",
+    "Количество SQL-запросов на HTTP-запрос",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 200)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "tsd_db_time_per_request_seconds",
+    "Суммарное время SQL-запросов на HTTP-запрос",
+    ["route"]
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "tsd_db_pool_checkout_wait_seconds",
+    "Ожидание соединения из пула",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "tsd_db_pool_checked_out",
+    "Выданные из пула соединения",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+
+SCANS_RESOLVED = Counter(
+    "tsd_barcode_scans_total",
+    "Сканирования штрих-кодов",
+    ["result"]
+)
+DOCUMENTS_POSTED = Counter(
+    "tsd_documents_posted_total",
+    "Проведенные документы",
+    ["document_type"]
+)
+LINES_POSTED = Counter(
+    "tsd_document_lines_posted_total",
+    "Движения, записанные при проведении документов",
+    ["document_type"]
+)
+
+
+# Счетчики текущего запроса; обработчики в пуле потоков получают копию контекста с тем же объектом
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+
+def instrumented_pool(label: str):
+    """Класс пула, измеряющий ожидание свободного соединения"""
+
+    class InstrumentedQueuePool(QueuePool):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                DB_POOL_CHECKOUT_WAIT.labels(label).observe(time.perf_counter() - start)
+
+    return InstrumentedQueuePool
+
+
+def instrument_engine(engine: Engine, label: str) -> None:
+    """Учет выданных соединений и времени SQL-запросов движка"""
+    checked_out = DB_POOL_CHECKED_OUT.labels(label)
+    query_duration = DB_QUERY_DURATION.labels(label)
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        checked_out.dec()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(connection, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - connection.info["query_start"].pop()
+        query_duration.observe(elapsed)
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.record(statement, elapsed)
+
+
+def route_template(app, scope) -> str:
+    """Шаблон пути маршрута, обработавшего запрос (/api/v1/documents/{document_id})"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    templates = getattr(app.state, "route_templates", None)
+    if templates is None:
+        templates = {
+            route.endpoint: route.path
+            for route in app.routes
+            if hasattr(route, "endpoint")
+        }
+        app.state.route_templates = templates
+    return templates.get(endpoint, UNMATCHED_ROUTE)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: время обработки, запросы в работе и SQL-запросы по маршрутам.
+
+    Повторяющиеся SQL-запросы (N+1) передаются в query_inspector.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            current_request_stats.reset(token)
+            route = route_template(scope["app"], scope)
+            REQUEST_LATENCY.labels(scope["method"], route, str(status_code)).observe(elapsed)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(stats.queries)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.query_seconds)
+            report_request(scope["method"], route, stats)
+
+
+def record_scans(found: int, not_found: int) -> None:
+    if found:
+        SCANS_RESOLVED.labels("found").inc(found)
+    if not_found:
+        SCANS_RESOLVED.labels("not_found").inc(not_found)
+
+
+def record_document_posted(document_type, lines: int) -> None:
+    label = getattr(document_type, "value", document_type)
+    DOCUMENTS_POSTED.labels(label).inc()
+    LINES_POSTED.labels(label).inc(lines)
+
+
+def metrics_response() -> Response:
+    """Метрики в формате Prometheus.
+
+    При нескольких воркерах uvicorn задается PROMETHEUS_MULTIPROC_DIR,
+    и метрики собираются из файлов всех процессов.
+    """
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
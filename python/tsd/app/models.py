@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Numeric, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Numeric, Enum, UniqueConstraint, Index, event, DDL, JSON, PrimaryKeyConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -60,6 +60,13 @@ class UnitOfMeasure(Base):
     is_active = Column(Boolean, default=True)  # Активна ли единица измерения
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Серверные значения (id, created_at, updated_at) возвращаются через RETURNING при flush
+    __mapper_args__ = {"eager_defaults": True}
+    
+    # Индекс для дельта-синхронизации
+    __table_args__ = (
+        Index("ix_units_of_measure_changed_at", func.coalesce(updated_at, created_at)),
+    )
 
 
 class NomenclatureCategory(Base):
@@ -72,6 +79,12 @@ class NomenclatureCategory(Base):
     is_active = Column(Boolean, default=True)  # Активна ли категория
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    __mapper_args__ = {"eager_defaults": True}
+    
+    # Индекс для дельта-синхронизации
+    __table_args__ = (
+        Index("ix_nomenclature_categories_changed_at", func.coalesce(updated_at, created_at)),
+    )
 
 
 class Nomenclature(Base):
@@ -87,10 +100,25 @@ class Nomenclature(Base):
     is_active = Column(Boolean, default=True)  # Признак активности
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    __mapper_args__ = {"eager_defaults": True}
     
     # Relationships
     category = relationship("NomenclatureCategory", backref="nomenclature_items")
     base_unit = relationship("UnitOfMeasure", backref="nomenclature_items")
+    
+    __table_args__ = (
+        # Индекс для дельта-синхронизации
+        Index("ix_nomenclature_changed_at", func.coalesce(updated_at, created_at)),
+        # Триграммные индексы для поиска по подстроке (ILIKE '%...%') и ранжирования
+        Index("ix_nomenclature_name_trgm", name, postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_nomenclature_code_trgm", code, postgresql_using="gin", postgresql_ops={"code": "gin_trgm_ops"}),
+        Index("ix_nomenclature_description_ru_trgm", description_ru, postgresql_using="gin", postgresql_ops={"description_ru": "gin_trgm_ops"}),
+        Index("ix_nomenclature_description_ua_trgm", description_ua, postgresql_using="gin", postgresql_ops={"description_ua": "gin_trgm_ops"}),
+    )
+
+
+# Триграммные индексы номенклатуры требуют расширения pg_trgm
+event.listen(Nomenclature.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
 
 
 class Warehouse(Base):
@@ -104,6 +132,12 @@ class Warehouse(Base):
     is_active = Column(Boolean, default=True)  # Признак активности
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    __mapper_args__ = {"eager_defaults": True}
+    
+    # Индекс для дельта-синхронизации
+    __table_args__ = (
+        Index("ix_warehouses_changed_at", func.coalesce(updated_at, created_at)),
+    )
 
 
 # Enums для документов
@@ -146,6 +180,7 @@ class Stock(Base):
     reserved_quantity = Column(Numeric(15, 3), default=0, nullable=False)  # Зарезервированное количество
     last_updated = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    __mapper_args__ = {"eager_defaults": True}
     
     # Relationships
     nomenclature = relationship("Nomenclature", backref="stocks")
@@ -153,10 +188,36 @@ class Stock(Base):
     
     # Уникальный индекс по номенклатуре и складу
     __table_args__ = (
+        UniqueConstraint("nomenclature_id", "warehouse_id", name="uq_stocks_nomenclature_warehouse"),
         {"extend_existing": True}
     )
 
 
+# Сводка остатков: проекция stocks с данными номенклатуры и склада,
+# обновляется инкрементно при каждом изменении остатков
+class StockSummaryRow(Base):
+    __tablename__ = "stock_summary"
+
+    id = Column(Integer, ForeignKey("stocks.id", ondelete="CASCADE"), primary_key=True)  # ID остатка
+    nomenclature_id = Column(Integer, nullable=False)
+    nomenclature_code = Column(String, nullable=False)
+    nomenclature_name = Column(String, nullable=False)
+    category_id = Column(Integer, nullable=False)
+    warehouse_id = Column(Integer, nullable=False)
+    warehouse_code = Column(String, nullable=False)
+    warehouse_name = Column(String, nullable=False)
+    quantity = Column(Numeric(15, 3), nullable=False)
+    reserved_quantity = Column(Numeric(15, 3), nullable=False)
+    available_quantity = Column(Numeric(15, 3), nullable=False)
+    last_updated = Column(DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        Index("ix_stock_summary_warehouse_id", "warehouse_id", "id"),
+        Index("ix_stock_summary_nomenclature_id", "nomenclature_id"),
+        Index("ix_stock_summary_category_id", "category_id"),
+    )
+
+
 # Документы движения товаров
 class Document(Base):
     __tablename__ = "documents"
@@ -165,15 +226,17 @@ class Document(Base):
     document_type = Column(Enum(DocumentType), nullable=False)  # Тип документа
     document_number = Column(String, nullable=False)  # Номер документа
     warehouse_id = Column(Integer, ForeignKey("warehouses.id"), nullable=False)  # Склад
+    target_warehouse_id = Column(Integer, ForeignKey("warehouses.id"), nullable=True)  # Склад-получатель (для перемещения)
     date = Column(DateTime(timezone=True), nullable=False)  # Дата документа
     status = Column(Enum(DocumentStatus), default=DocumentStatus.DRAFT, nullable=False)  # Статус
     created_by = Column(Integer, ForeignKey("users.id"), nullable=False)  # Создатель
     description = Column(Text, nullable=True)  # Описание документа
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    __mapper_args__ = {"eager_defaults": True}
     
     # Relationships
-    warehouse = relationship("Warehouse", backref="documents")
+    warehouse = relationship("Warehouse", foreign_keys=[warehouse_id], backref="documents")
     creator = relationship("User", backref="created_documents")
     items = relationship("DocumentItem", back_populates="document", cascade="all, delete-orphan")
 
@@ -212,6 +275,7 @@ class Inventory(Base):
     description = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    __mapper_args__ = {"eager_defaults": True}
     
     # Relationships
     warehouse = relationship("Warehouse", backref="inventories")
@@ -234,12 +298,55 @@ class InventoryItem(Base):
     counted_at = Column(DateTime(timezone=True), nullable=True)  # Когда считал
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    __mapper_args__ = {"eager_defaults": True}
     
     # Relationships
     inventory = relationship("Inventory", back_populates="items")
     nomenclature = relationship("Nomenclature", backref="inventory_items")
     unit = relationship("UnitOfMeasure", backref="inventory_items")
     counter = relationship("User", backref="counted_items")
+    
+    # Одна строка на номенклатуру в инвентаризации
+    __table_args__ = (
+        UniqueConstraint("inventory_id", "nomenclature_id", name="uq_inventory_items_inventory_nomenclature"),
+    )
+
+
+# Вклады устройств в пересчет строки инвентаризации: каждый счетчик (пользователь
+# и устройство) меняет только свою запись, факт строки равен сумме вкладов
+class InventoryCountContribution(Base):
+    __tablename__ = "inventory_count_contributions"
+
+    inventory_id = Column(Integer, ForeignKey("inventories.id", ondelete="CASCADE"), nullable=False)
+    nomenclature_id = Column(Integer, ForeignKey("nomenclature.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    device_id = Column(String(255), nullable=False, default="")  # ID ТСД (пусто, если не передан)
+    quantity = Column(Numeric(15, 3), nullable=False, default=0)  # Посчитано этим счетчиком
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    # Relationships
+    user = relationship("User")
+    
+    __table_args__ = (
+        PrimaryKeyConstraint("inventory_id", "nomenclature_id", "user_id", "device_id"),
+    )
+
+
+# Журнал пересчета (только добавление): каждое приращение каждого счетчика
+class InventoryCountLog(Base):
+    __tablename__ = "inventory_count_log"
+
+    id = Column(Integer, primary_key=True, index=True)
+    inventory_id = Column(Integer, ForeignKey("inventories.id", ondelete="CASCADE"), nullable=False)
+    nomenclature_id = Column(Integer, ForeignKey("nomenclature.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    device_id = Column(String(255), nullable=False, default="")
+    quantity = Column(Numeric(15, 3), nullable=False)  # Приращение
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    __table_args__ = (
+        Index("ix_inventory_count_log_inventory_nomenclature", "inventory_id", "nomenclature_id", "id"),
+    )
 
 
 # История движений товаров
@@ -250,7 +357,7 @@ class StockMovement(Base):
     nomenclature_id = Column(Integer, ForeignKey("nomenclature.id"), nullable=False)
     warehouse_id = Column(Integer, ForeignKey("warehouses.id"), nullable=False)
     movement_type = Column(Enum(MovementType), nullable=False)  # Тип движения
-    quantity = Column(Numeric(15, 3), nullable=False)  # Количество
+    quantity = Column(Numeric(15, 3), nullable=False)  # Количество со знаком (расход отрицательный)
     document_id = Column(Integer, ForeignKey("documents.id"), nullable=True)  # Ссылка на документ
     inventory_id = Column(Integer, ForeignKey("inventories.id"), nullable=True)  # Ссылка на инвентаризацию
     date = Column(DateTime(timezone=True), nullable=False)  # Дата движения
@@ -264,6 +371,13 @@ class StockMovement(Base):
     document = relationship("Document", backref="stock_movements")
     inventory = relationship("Inventory", backref="stock_movements")
     user = relationship("User", backref="stock_movements")
+    
+    # Индексы для истории движений и остатков на дату
+    __table_args__ = (
+        Index("ix_stock_movements_nomenclature_warehouse_date", "nomenclature_id", "warehouse_id", "date"),
+        Index("ix_stock_movements_document_id", "document_id"),
+        Index("ix_stock_movements_inventory_id", "inventory_id"),
+    )
 
 
 # Штрих-коды номенклатуры
@@ -279,6 +393,78 @@ class Barcode(Base):
     description = Column(Text, nullable=True)  # Описание штрих-кода
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    __mapper_args__ = {"eager_defaults": True}
     
     # Relationships
     nomenclature = relationship("Nomenclature", backref="barcodes")
+    
+    # Индекс для дельта-синхронизации
+    __table_args__ = (
+        Index("ix_barcodes_changed_at", func.coalesce(updated_at, created_at)),
+    )
+
+
+# Удаленные записи справочников для дельта-синхронизации устройств
+class SyncTombstone(Base):
+    __tablename__ = "sync_tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity = Column(String, nullable=False)  # Справочник (имя таблицы)
+    entity_id = Column(Integer, nullable=False)  # ID удаленной записи
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    __table_args__ = (
+        Index("ix_sync_tombstones_entity_deleted_at", "entity", "deleted_at"),
+    )
+
+
+# Ключи идемпотентности: повторный запрос с тем же ключом получает сохраненный ответ
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)  # Значение заголовка Idempotency-Key
+    request_hash = Column(String(64), nullable=False)  # Отпечаток запроса (эндпоинт и тело)
+    status_code = Column(Integer, nullable=True)  # Код исходного ответа
+    response_body = Column(JSON, nullable=True)  # Тело исходного ответа
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+        Index("ix_idempotency_keys_created_at", "created_at"),
+    )
+
+
+# Загрузка большого документа частями с возобновлением
+class DocumentUpload(Base):
+    __tablename__ = "document_uploads"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), unique=True, nullable=False)
+    total_chunks = Column(Integer, nullable=False)  # Ожидаемое количество частей
+    post = Column(Boolean, default=False, nullable=False)  # Провести документ после получения всех частей
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Relationships
+    document = relationship("Document")
+    chunks = relationship("DocumentUploadChunk", back_populates="upload", cascade="all, delete-orphan")
+
+
+class DocumentUploadChunk(Base):
+    __tablename__ = "document_upload_chunks"
+
+    upload_id = Column(Integer, ForeignKey("document_uploads.id", ondelete="CASCADE"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)  # Номер части (с 0)
+    item_count = Column(Integer, nullable=False)  # Количество строк в части
+    content_hash = Column(String(64), nullable=True)  # SHA-256 строк части (проверка повторной отправки)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    upload = relationship("DocumentUpload", back_populates="chunks")
+    
+    __table_args__ = (
+        PrimaryKeyConstraint("upload_id", "chunk_index"),
+    )
@@ -1,8 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Sequence
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
 
+# Источник новых номеров префиксов ТСД (освобожденные номера берутся из tsd_free_prefixes)
+tsd_prefix_seq = Sequence("tsd_device_prefix_seq", metadata=Base.metadata)
+
 class TsdDevice(Base):
     __tablename__ = "tsd_devices"
 
@@ -18,4 +21,13 @@ class TsdDevice(Base):
     last_seen = Column(DateTime(timezone=True), server_default=func.now())
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    __mapper_args__ = {"eager_defaults": True}
+
+
+class TsdFreePrefix(Base):
+    """Освобожденные номера префиксов удаленных ТСД для повторного использования"""
+    __tablename__ = "tsd_free_prefixes"
 
+    number = Column(Integer, primary_key=True)
+    document_counter = Column(Integer, default=0, nullable=False)  # Последний номер документа, выданный с префиксом
+    released_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -6,11 +6,12 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
 from app.config import settings
 from app.database import get_db
 from app.models import User, OAuthClient, OAuthToken
 from app.schemas import TokenData
+from app.token_cache import token_cache
 
 # Настройка хеширования паролей
 pwd_context = None
@@ -137,7 +138,50 @@ def get_oauth_token(db: Session, access_token: str) -> Optional[OAuthToken]:
     return db.query(OAuthToken).filter(OAuthToken.access_token == access_token).first()
 
 
-async def get_current_user_from_token(
+def revoke_oauth_token(db: Session, token: str, user_id: int) -> bool:
+    """Отзыв токена пользователя по access_token или refresh_token"""
+    oauth_token = db.query(OAuthToken).filter(
+        OAuthToken.user_id == user_id,
+        (OAuthToken.access_token == token) | (OAuthToken.refresh_token == token)
+    ).first()
+    if not oauth_token:
+        return False
+    
+    access_token = oauth_token.access_token
+    db.delete(oauth_token)
+    db.commit()
+    token_cache.invalidate_token(access_token)
+    return True
+
+
+def get_user_by_access_token(db: Session, access_token: str) -> Optional[User]:
+    """Получение пользователя по действующему access_token (с кэшированием)"""
+    # Токен уже проверялся: восстанавливаем пользователя в сессии без запросов к БД
+    snapshot = token_cache.get(access_token)
+    if snapshot is not None:
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+    
+    # Проверяем OAuth токен
+    oauth_token = get_oauth_token(db, access_token)
+    if not oauth_token or not oauth_token.user_id:
+        return None
+    
+    # Проверяем, не истек ли токен
+    if oauth_token.expires_at < datetime.now(timezone.utc):
+        return None
+    
+    # Получаем пользователя
+    user = db.query(User).filter(User.id == oauth_token.user_id).first()
+    if not user:
+        return None
+    
+    token_cache.put(access_token, user, oauth_token.expires_at)
+    return user
+
+
+def get_current_user_from_token(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> User:
@@ -148,26 +192,13 @@ async def get_current_user_from_token(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    # Проверяем OAuth токен
-    oauth_token = get_oauth_token(db, credentials.credentials)
-    if not oauth_token:
-        raise credentials_exception
-    
-    # Проверяем, не истек ли токен
-    if oauth_token.expires_at < datetime.now(timezone.utc):
-        raise credentials_exception
-    
-    # Получаем пользователя
-    if oauth_token.user_id:
-        user = db.query(User).filter(User.id == oauth_token.user_id).first()
-        if not user:
-            raise credentials_exception
-        return user
-    else:
+    user = get_user_by_access_token(db, credentials.credentials)
+    if not user:
         raise credentials_exception
+    return user
 
 
-async def get_current_client_from_token(
+def get_current_client_from_token(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> OAuthClient:
@@ -0,0 +1,55 @@
+import base64
+import binascii
+import json
+from typing import Optional
+from fastapi import HTTPException, Response, status
+from sqlalchemy.orm import Query
+
+# Заголовок ответа с курсором следующей страницы
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(last_id: int) -> str:
+    """Непрозрачный курсор по последнему ID страницы"""
+    payload = json.dumps({"id": last_id}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Разбор курсора, полученного клиентом в заголовке X-Next-Cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded))["id"]
+        if not isinstance(last_id, int):
+            raise ValueError
+        return last_id
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор"
+        )
+
+
+def paginate(
+    query: Query,
+    id_column,
+    skip: int,
+    limit: int,
+    cursor: Optional[str],
+    response: Response
+) -> list:
+    """Страница списка в стабильном порядке по ID.
+
+    С курсором используется keyset-пагинация (WHERE id > :last_id), стоимость
+    которой не зависит от глубины страницы; без курсора - прежний skip.
+    """
+    query = query.order_by(id_column)
+    if cursor:
+        query = query.filter(id_column > decode_cursor(cursor))
+    else:
+        query = query.offset(skip)
+    
+    items = query.limit(limit).all()
+    if items and len(items) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(items[-1].id)
+    return items
@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+import traceback
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from prometheus_client import Counter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Сколько кадров кода приложения показывать в отчете о повторяющемся запросе
+STACK_DEPTH = 8
+# Длина текста запроса в журнале
+STATEMENT_LOG_LENGTH = 500
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_OWN_MODULES = {os.path.abspath(__file__), os.path.join(_APP_DIR, "metrics.py")}
+
+REPEATED_STATEMENTS = Counter(
+    "tsd_db_repeated_statements_total",
+    "HTTP-запросы с повторяющимся SQL-запросом (N+1)",
+    ["route"]
+)
+QUERY_HEAVY_REQUESTS = Counter(
+    "tsd_db_query_heavy_requests_total",
+    "HTTP-запросы с числом SQL-запросов больше query_count_warning",
+    ["route"]
+)
+
+
+def _caller_stack() -> str:
+    """Кадры кода приложения, из которых выполнен запрос"""
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(_APP_DIR) and frame.filename not in _OWN_MODULES
+    ]
+    return "".join(traceback.format_list(frames[-STACK_DEPTH:]))
+
+
+class RequestStats:
+    """SQL-запросы одного HTTP-запроса.
+
+    Одинаковые по тексту запросы считаются отдельно: запрос, выполненный
+    query_repeat_threshold раз, - признак N+1 (ленивая загрузка связи в цикле).
+    Стек снимается один раз, в момент достижения порога.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.statements: Dict[str, int] = {}
+        self.repeated: Dict[str, str] = {}
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.queries += 1
+        self.query_seconds += elapsed
+        if not settings.query_inspector_enabled:
+            return
+        count = self.statements.get(statement, 0) + 1
+        self.statements[statement] = count
+        if count == settings.query_repeat_threshold:
+            self.repeated[statement] = _caller_stack()
+
+
+def report_request(method: str, route: str, stats: RequestStats) -> None:
+    """Журнал и счетчики для HTTP-запросов с N+1 или слишком большим числом запросов"""
+    if not settings.query_inspector_enabled:
+        return
+    if stats.repeated:
+        REPEATED_STATEMENTS.labels(route).inc()
+    for statement, stack in stats.repeated.items():
+        logger.warning(
+            "N+1: %s %s выполнил одинаковый запрос %d раз: %s\n%s",
+            method, route, stats.statements[statement], statement[:STATEMENT_LOG_LENGTH], stack
+        )
+    if stats.queries > settings.query_count_warning:
+        QUERY_HEAVY_REQUESTS.labels(route).inc()
+        logger.warning("%s %s выполнил %d SQL-запросов", method, route, stats.queries)
+
+
+@contextmanager
+def assert_query_budget(db_engine: Engine, max_queries: int, max_repeats: Optional[int] = None) -> Iterator[RequestStats]:
+    """Проверка числа SQL-запросов в блоке (для тестов эндпоинтов).
+
+    Считаются все запросы движка, в том числе выполненные в потоке
+    обработчика TestClient:
+
+        with assert_query_budget(engine, max_queries=4, max_repeats=1):
+            client.put(f"/api/v1/inventories/items/{item_id}", json=payload, headers=headers)
+    """
+    stats = RequestStats()
+    lock = threading.Lock()
+
+    def count(connection, cursor, statement, parameters, context, executemany):
+        with lock:
+            stats.queries += 1
+            stats.statements[statement] = stats.statements.get(statement, 0) + 1
+
+    event.listen(db_engine, "after_cursor_execute", count)
+    try:
+        yield stats
+    finally:
+        event.remove(db_engine, "after_cursor_execute", count)
+
+    problems = []
+    if stats.queries > max_queries:
+        problems.append(f"выполнено {stats.queries} SQL-запросов при бюджете {max_queries}")
+    if max_repeats is not None:
+        problems.extend(
+            f"запрос выполнен {count} раз (допустимо {max_repeats}): {statement[:STATEMENT_LOG_LENGTH]}"
+            for statement, count in stats.statements.items()
+            if count > max_repeats
+        )
+    if problems:
+        raise AssertionError("\n".join(problems))
@@ -1,28 +1,38 @@
+from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import and_
-from app.database import get_db
+from app.database import get_db, get_read_db, commit_with_response
+from app.pagination import paginate
 from app.models import Barcode, Nomenclature, User
 from app.schemas import (
     Barcode as BarcodeSchema,
     BarcodeCreate,
-    BarcodeUpdate
+    BarcodeUpdate,
+    BarcodeScanBatchRequest,
+    BarcodeScanBatchResponse,
+    SyncResponse
 )
+from app.metrics import record_scans
 from app.oauth import get_current_user_from_token
+from app.barcode_cache import barcode_index, resolve_barcode, resolve_barcodes
+from app.sync import new_sync_token, filter_changed, get_deleted_ids, record_tombstone
 
 router = APIRouter(prefix="/barcodes", tags=["barcodes"])
 
 
 @router.get("/", response_model=List[BarcodeSchema])
-async def get_barcodes(
+def get_barcodes(
+    response: Response,
     skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
     limit: int = Query(100, ge=1, le=1000, description="Максимальное количество записей"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (заголовок X-Next-Cursor)"),
     nomenclature_id: Optional[int] = Query(None, description="Фильтр по номенклатуре"),
     barcode_type: Optional[str] = Query(None, description="Фильтр по типу штрих-кода"),
     active_only: bool = Query(True, description="Показывать только активные штрих-коды"),
     search: Optional[str] = Query(None, description="Поиск по штрих-коду"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Получение списка штрих-кодов"""
@@ -43,12 +53,38 @@ async def get_barcodes(
         search_filter = f"%{search}%"
         query = query.filter(Barcode.barcode.ilike(search_filter))
     
-    barcodes = query.offset(skip).limit(limit).all()
+    barcodes = paginate(query, Barcode.id, skip, limit, cursor, response)
     return barcodes
 
 
+@router.get("/sync", response_model=SyncResponse[BarcodeSchema])
+def sync_barcodes(
+    changed_since: Optional[datetime] = Query(None, description="Токен предыдущей синхронизации (sync_token)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Дельта-синхронизация штрих-кодов (включая деактивированные и удаленные)"""
+    sync_token = new_sync_token(db)
+    query = db.query(Barcode).options(
+        joinedload(Barcode.nomenclature)
+    )
+    
+    barcodes = filter_changed(query, Barcode, changed_since).all()
+    deleted_ids = get_deleted_ids(db, "barcodes", changed_since)
+    
+    return {"items": barcodes, "deleted_ids": deleted_ids, "sync_token": sync_token}
+
+
+@router.get("/cache/stats")
+def get_barcode_cache_stats(
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Статистика индекса штрих-кодов (попадания/промахи)"""
+    return barcode_index.stats()
+
+
 @router.get("/{barcode_id}", response_model=BarcodeSchema)
-async def get_barcode(
+def get_barcode(
     barcode_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -67,20 +103,14 @@ async def get_barcode(
 
 
 @router.get("/scan/{barcode_value}", response_model=BarcodeSchema)
-async def get_barcode_by_value(
+def get_barcode_by_value(
     barcode_value: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Получение номенклатуры по штрих-коду (для сканирования)"""
-    barcode = db.query(Barcode).options(
-        joinedload(Barcode.nomenclature)
-    ).filter(
-        and_(
-            Barcode.barcode == barcode_value,
-            Barcode.is_active == True
-        )
-    ).first()
+    barcode = resolve_barcode(db, barcode_value)
+    record_scans(found=int(barcode is not None), not_found=int(barcode is None))
     
     if not barcode:
         raise HTTPException(
@@ -90,8 +120,22 @@ async def get_barcode_by_value(
     return barcode
 
 
+@router.post("/scan/batch", response_model=BarcodeScanBatchResponse)
+def scan_barcodes_batch(
+    request: BarcodeScanBatchRequest,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Пакетное получение номенклатуры по списку штрих-кодов (синхронизация после офлайна)"""
+    found = resolve_barcodes(db, request.barcodes)
+    not_found = [value for value in dict.fromkeys(request.barcodes) if value not in found]
+    record_scans(found=len(found), not_found=len(not_found))
+    
+    return BarcodeScanBatchResponse(found=found, not_found=not_found)
+
+
 @router.post("/", response_model=BarcodeSchema)
-async def create_barcode(
+def create_barcode(
     barcode_data: BarcodeCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -106,7 +150,10 @@ async def create_barcode(
         )
     
     # Проверяем, существует ли номенклатура
-    nomenclature = db.query(Nomenclature).filter(Nomenclature.id == barcode_data.nomenclature_id).first()
+    nomenclature = db.query(Nomenclature).options(
+        joinedload(Nomenclature.category),
+        joinedload(Nomenclature.base_unit)
+    ).filter(Nomenclature.id == barcode_data.nomenclature_id).first()
     if not nomenclature:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -133,26 +180,26 @@ async def create_barcode(
     )
     
     db.add(barcode)
-    db.commit()
-    db.refresh(barcode)
+    response = commit_with_response(db, barcode, BarcodeSchema)
     
-    # Загружаем связанные данные для ответа
-    barcode = db.query(Barcode).options(
-        joinedload(Barcode.nomenclature)
-    ).filter(Barcode.id == barcode.id).first()
+    # Обновляем индекс (могли измениться признаки основного у других штрих-кодов)
+    barcode_index.reload_nomenclature(db, response.nomenclature_id)
     
-    return barcode
+    return response
 
 
 @router.put("/{barcode_id}", response_model=BarcodeSchema)
-async def update_barcode(
+def update_barcode(
     barcode_id: int,
     barcode_data: BarcodeUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Обновление штрих-кода"""
-    barcode = db.query(Barcode).filter(Barcode.id == barcode_id).first()
+    barcode = db.query(Barcode).options(
+        joinedload(Barcode.nomenclature).joinedload(Nomenclature.category),
+        joinedload(Barcode.nomenclature).joinedload(Nomenclature.base_unit)
+    ).filter(Barcode.id == barcode_id).first()
     if not barcode:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -184,24 +231,25 @@ async def update_barcode(
             )
         ).update({"is_primary": False})
     
+    old_value = barcode.barcode
+    old_nomenclature_id = barcode.nomenclature_id
+    
     # Обновляем поля
     update_data = barcode_data.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(barcode, field, value)
     
-    db.commit()
-    db.refresh(barcode)
+    response = commit_with_response(db, barcode, BarcodeSchema)
     
-    # Загружаем связанные данные для ответа
-    barcode = db.query(Barcode).options(
-        joinedload(Barcode.nomenclature)
-    ).filter(Barcode.id == barcode.id).first()
+    # Обновляем индекс по старому и новому значению
+    barcode_index.discard(old_value)
+    barcode_index.reload_nomenclature(db, old_nomenclature_id, response.nomenclature_id)
     
-    return barcode
+    return response
 
 
 @router.delete("/{barcode_id}")
-async def delete_barcode(
+def delete_barcode(
     barcode_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -214,14 +262,18 @@ async def delete_barcode(
             detail="Штрих-код не найден"
         )
     
+    barcode_value = barcode.barcode
     db.delete(barcode)
+    record_tombstone(db, "barcodes", barcode_id)
     db.commit()
     
+    barcode_index.discard(barcode_value)
+    
     return {"message": "Штрих-код удален"}
 
 
 @router.patch("/{barcode_id}/activate")
-async def activate_barcode(
+def activate_barcode(
     barcode_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -237,11 +289,13 @@ async def activate_barcode(
     barcode.is_active = True
     db.commit()
     
+    barcode_index.reload_nomenclature(db, barcode.nomenclature_id)
+    
     return {"message": "Штрих-код активирован"}
 
 
 @router.patch("/{barcode_id}/deactivate")
-async def deactivate_barcode(
+def deactivate_barcode(
     barcode_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -257,11 +311,13 @@ async def deactivate_barcode(
     barcode.is_active = False
     db.commit()
     
+    barcode_index.discard(barcode.barcode)
+    
     return {"message": "Штрих-код деактивирован"}
 
 
 @router.patch("/{barcode_id}/set-primary")
-async def set_primary_barcode(
+def set_primary_barcode(
     barcode_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -287,4 +343,6 @@ async def set_primary_barcode(
     barcode.is_primary = True
     db.commit()
     
+    barcode_index.reload_nomenclature(db, barcode.nomenclature_id)
+    
     return {"message": "Штрих-код установлен как основной"}
@@ -0,0 +1,230 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Header
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from app.database import get_db
+from app.models import (
+    Document, DocumentItem, DocumentUpload, DocumentUploadChunk, DocumentType, DocumentStatus, User
+)
+from app.schemas import (
+    DocumentUploadCreate,
+    DocumentUploadChunk as DocumentUploadChunkSchema,
+    DocumentUploadStatus,
+    DocumentWithItems
+)
+from app.oauth import get_current_user_from_token
+from app.metrics import record_document_posted
+from app.stock_posting import post_document_movements
+from app.document_bulk import (
+    validate_document_header, validate_document_lines, insert_document_lines, load_document_with_items
+)
+from app.idempotency import (
+    IDEMPOTENCY_KEY_HEADER, begin_idempotent_request, store_idempotent_response, request_fingerprint
+)
+
+router = APIRouter(prefix="/documents/uploads", tags=["documents"])
+
+
+def _get_upload(db: Session, upload_id: int, for_update: bool = False, shared: bool = False) -> DocumentUpload:
+    query = db.query(DocumentUpload).filter(DocumentUpload.id == upload_id)
+    if for_update:
+        query = query.with_for_update(read=shared)
+    upload = query.first()
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Загрузка не найдена"
+        )
+    return upload
+
+
+def _upload_status(db: Session, upload: DocumentUpload) -> DocumentUploadStatus:
+    """Состояние загрузки: полученные части и первая недостающая"""
+    received = [
+        chunk_index for (chunk_index,) in db.query(DocumentUploadChunk.chunk_index).filter(
+            DocumentUploadChunk.upload_id == upload.id
+        ).order_by(DocumentUploadChunk.chunk_index)
+    ]
+    received_set = set(received)
+    next_chunk = next(
+        (chunk_index for chunk_index in range(upload.total_chunks) if chunk_index not in received_set),
+        None
+    )
+    return DocumentUploadStatus(
+        upload_id=upload.id,
+        document_id=upload.document_id,
+        total_chunks=upload.total_chunks,
+        received_chunks=received,
+        next_chunk=next_chunk,
+        completed=upload.completed_at is not None
+    )
+
+
+@router.post("/", response_model=DocumentUploadStatus)
+def start_upload(
+    upload_data: DocumentUploadCreate,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Начало загрузки документа частями: создается черновик документа"""
+    replay = begin_idempotent_request(
+        db, current_user.id, idempotency_key,
+        request_fingerprint("documents.uploads.start", upload_data)
+    )
+    if replay:
+        return replay
+    
+    validate_document_header(db, upload_data)
+    
+    document = Document(
+        document_type=upload_data.document_type,
+        document_number=upload_data.document_number,
+        warehouse_id=upload_data.warehouse_id,
+        target_warehouse_id=upload_data.target_warehouse_id,
+        date=upload_data.date,
+        status=DocumentStatus.DRAFT,
+        created_by=current_user.id,
+        description=upload_data.description
+    )
+    db.add(document)
+    db.flush()
+    
+    upload = DocumentUpload(
+        document_id=document.id,
+        total_chunks=upload_data.total_chunks,
+        post=upload_data.post,
+        created_by=current_user.id
+    )
+    db.add(upload)
+    db.flush()
+    
+    result = _upload_status(db, upload)
+    store_idempotent_response(db, current_user.id, idempotency_key, result)
+    db.commit()
+    
+    return result
+
+
+@router.get("/{upload_id}", response_model=DocumentUploadStatus)
+def get_upload_status(
+    upload_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Состояние загрузки для возобновления с первой неполученной части"""
+    upload = _get_upload(db, upload_id)
+    return _upload_status(db, upload)
+
+
+@router.put("/{upload_id}/chunks/{chunk_index}", response_model=DocumentUploadStatus)
+def upload_chunk(
+    chunk_data: DocumentUploadChunkSchema,
+    upload_id: int,
+    chunk_index: int = Path(..., ge=0),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Прием части строк документа.
+    
+    Повторная отправка части с тем же содержимым подтверждается без повторной
+    записи, с другим - отклоняется (409).
+    """
+    # FOR SHARE: части принимаются параллельно, завершение загрузки (FOR UPDATE) ждет их фиксации
+    upload = _get_upload(db, upload_id, for_update=True, shared=True)
+    
+    if chunk_index >= upload.total_chunks:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Номер части больше заявленного количества частей"
+        )
+    
+    # Регистрируем часть первой: параллельный повтор ждет на первичном ключе и получает подтверждение
+    content_hash = request_fingerprint("documents.uploads.chunk", chunk_data)
+    inserted = db.execute(
+        pg_insert(DocumentUploadChunk)
+        .values(
+            upload_id=upload.id,
+            chunk_index=chunk_index,
+            item_count=len(chunk_data.items),
+            content_hash=content_hash
+        )
+        .on_conflict_do_nothing()
+        .returning(DocumentUploadChunk.chunk_index)
+    ).scalar()
+    if inserted is None:
+        received_hash = db.query(DocumentUploadChunk.content_hash).filter(
+            DocumentUploadChunk.upload_id == upload.id,
+            DocumentUploadChunk.chunk_index == chunk_index
+        ).scalar()
+        if received_hash is not None and received_hash != content_hash:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Часть с этим номером уже получена с другим содержимым"
+            )
+        return _upload_status(db, upload)
+    
+    if upload.completed_at is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Загрузка уже завершена"
+        )
+    
+    # Статус проверяется под блокировкой: проведение (FOR UPDATE) не пропустит добавленные строки
+    document = db.query(Document).filter(Document.id == upload.document_id).with_for_update(read=True).first()
+    if document.status == DocumentStatus.POSTED:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Нельзя редактировать проведенный документ"
+        )
+    
+    validate_document_lines(db, document.document_type, chunk_data.items, document_id=upload.document_id)
+    insert_document_lines(db, upload.document_id, chunk_data.items)
+    
+    result = _upload_status(db, upload)
+    db.commit()
+    
+    return result
+
+
+@router.post("/{upload_id}/complete", response_model=DocumentWithItems)
+def complete_upload(
+    upload_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Завершение загрузки: проверка полноты и, если запрошено, проведение документа"""
+    upload = _get_upload(db, upload_id, for_update=True)
+    
+    if upload.completed_at is None:
+        upload_status = _upload_status(db, upload)
+        if upload_status.next_chunk is not None:
+            missing = sorted(set(range(upload.total_chunks)) - set(upload_status.received_chunks))
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Не получены части: {', '.join(map(str, missing))}"
+            )
+        
+        posted_type = None
+        if upload.post:
+            document = db.query(Document).filter(Document.id == upload.document_id).with_for_update().first()
+            if document.document_type == DocumentType.TRANSFER and not document.target_warehouse_id:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Для перемещения не указан склад-получатель"
+                )
+            if document.status == DocumentStatus.DRAFT:
+                post_document_movements(db, document, current_user.id)
+                posted_type = document.document_type
+                line_count = db.query(func.count(DocumentItem.id)).filter(
+                    DocumentItem.document_id == document.id
+                ).scalar()
+                document.status = DocumentStatus.POSTED
+        
+        upload.completed_at = func.now()
+        db.commit()
+        if posted_type is not None:
+            record_document_posted(posted_type, line_count)
+    
+    return load_document_with_items(db, upload.document_id)
@@ -1,34 +1,46 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, Header
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_
-from app.database import get_db
+from sqlalchemy import and_, func
+from app.database import get_db, get_read_db, commit_with_response, flush_response
+from app.pagination import paginate
 from app.models import (
     Document, DocumentItem, Nomenclature, Warehouse, User, UnitOfMeasure,
-    DocumentType, DocumentStatus, Stock
+    DocumentType, DocumentStatus, StockMovement
 )
 from app.schemas import (
     Document as DocumentSchema,
     DocumentCreate,
     DocumentUpdate,
     DocumentWithItems,
+    DocumentBulkCreate,
     DocumentItem as DocumentItemSchema,
     DocumentItemCreate,
     DocumentItemUpdate
 )
+from app.metrics import record_document_posted
 from app.oauth import get_current_user_from_token
+from app.stock_posting import post_document_movements, reverse_movements
+from app.document_bulk import (
+    validate_document_header, validate_document_lines, insert_document_lines, load_document_with_items
+)
+from app.idempotency import (
+    IDEMPOTENCY_KEY_HEADER, begin_idempotent_request, store_idempotent_response, request_fingerprint
+)
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
 
 @router.get("/", response_model=List[DocumentSchema])
-async def get_documents(
+def get_documents(
+    response: Response,
     skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
     limit: int = Query(100, ge=1, le=1000, description="Максимальное количество записей"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (заголовок X-Next-Cursor)"),
     document_type: Optional[DocumentType] = Query(None, description="Фильтр по типу документа"),
     warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
     status: Optional[DocumentStatus] = Query(None, description="Фильтр по статусу"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Получение списка документов"""
@@ -46,12 +58,12 @@ async def get_documents(
     if status:
         query = query.filter(Document.status == status)
     
-    documents = query.offset(skip).limit(limit).all()
+    documents = paginate(query, Document.id, skip, limit, cursor, response)
     return documents
 
 
 @router.get("/{document_id}", response_model=DocumentWithItems)
-async def get_document(
+def get_document(
     document_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -73,12 +85,20 @@ async def get_document(
 
 
 @router.post("/", response_model=DocumentSchema)
-async def create_document(
+def create_document(
     document_data: DocumentCreate,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Создание нового документа"""
+    replay = begin_idempotent_request(
+        db, current_user.id, idempotency_key,
+        request_fingerprint("documents.create", document_data)
+    )
+    if replay:
+        return replay
+    
     # Проверяем, существует ли склад
     warehouse = db.query(Warehouse).filter(Warehouse.id == document_data.warehouse_id).first()
     if not warehouse:
@@ -87,6 +107,15 @@ async def create_document(
             detail="Склад не найден"
         )
     
+    # Проверяем склад-получатель
+    if document_data.target_warehouse_id:
+        target_warehouse = db.query(Warehouse).filter(Warehouse.id == document_data.target_warehouse_id).first()
+        if not target_warehouse:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Склад-получатель не найден"
+            )
+    
     # Проверяем уникальность номера документа
     existing_document = db.query(Document).filter(
         Document.document_number == document_data.document_number
@@ -102,34 +131,92 @@ async def create_document(
         document_type=document_data.document_type,
         document_number=document_data.document_number,
         warehouse_id=document_data.warehouse_id,
+        target_warehouse_id=document_data.target_warehouse_id,
         date=document_data.date,
         status=document_data.status,
         created_by=current_user.id,
-        description=document_data.description
+        description=document_data.description,
+        items=[]
     )
     
     db.add(document)
+    # Склад и автор уже в сессии, строк у нового документа нет
+    result = flush_response(db, document, DocumentSchema)
+    store_idempotent_response(db, current_user.id, idempotency_key, result)
     db.commit()
-    db.refresh(document)
     
-    # Загружаем связанные данные для ответа
-    document = db.query(Document).options(
-        joinedload(Document.warehouse),
-        joinedload(Document.creator)
-    ).filter(Document.id == document.id).first()
+    return result
+
+
+@router.post("/bulk", response_model=DocumentWithItems)
+def create_document_bulk(
+    document_data: DocumentBulkCreate,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Создание документа со всеми строками (и, при post=true, проведение) одной транзакцией"""
+    replay = begin_idempotent_request(
+        db, current_user.id, idempotency_key,
+        request_fingerprint("documents.bulk", document_data)
+    )
+    if replay:
+        return replay
     
-    return document
+    # Склады, номенклатура и единицы измерения проверяются наборами
+    validate_document_header(db, document_data)
+    validate_document_lines(db, document_data.document_type, document_data.items)
+    
+    if document_data.post and document_data.document_type == DocumentType.TRANSFER and not document_data.target_warehouse_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Для перемещения не указан склад-получатель"
+        )
+    
+    document = Document(
+        document_type=document_data.document_type,
+        document_number=document_data.document_number,
+        warehouse_id=document_data.warehouse_id,
+        target_warehouse_id=document_data.target_warehouse_id,
+        date=document_data.date,
+        status=DocumentStatus.DRAFT if document_data.post else document_data.status,
+        created_by=current_user.id,
+        description=document_data.description
+    )
+    db.add(document)
+    db.flush()
+    
+    insert_document_lines(db, document.id, document_data.items)
+    
+    if document_data.post:
+        post_document_movements(db, document, current_user.id)
+        document.status = DocumentStatus.POSTED
+        db.flush()
+    
+    # Ответ формируется до commit, чтобы сохраниться вместе с ключом идемпотентности
+    result = DocumentWithItems.model_validate(load_document_with_items(db, document.id))
+    store_idempotent_response(db, current_user.id, idempotency_key, result)
+    db.commit()
+    if document_data.post:
+        record_document_posted(document_data.document_type, len(document_data.items))
+    
+    return result
 
 
 @router.put("/{document_id}", response_model=DocumentSchema)
-async def update_document(
+def update_document(
     document_id: int,
     document_data: DocumentUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Обновление документа"""
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = db.query(Document).options(
+        joinedload(Document.warehouse),
+        joinedload(Document.creator),
+        joinedload(Document.items).joinedload(DocumentItem.nomenclature),
+        joinedload(Document.items).joinedload(DocumentItem.unit)
+    ).filter(Document.id == document_id).first()
     if not document:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -157,25 +244,25 @@ async def update_document(
                 detail="Документ с таким номером уже существует"
             )
     
+    # Проверяем склад-получатель, если он указан
+    if document_data.target_warehouse_id:
+        target_warehouse = db.query(Warehouse).filter(Warehouse.id == document_data.target_warehouse_id).first()
+        if not target_warehouse:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Склад-получатель не найден"
+            )
+    
     # Обновляем поля
     update_data = document_data.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(document, field, value)
     
-    db.commit()
-    db.refresh(document)
-    
-    # Загружаем связанные данные для ответа
-    document = db.query(Document).options(
-        joinedload(Document.warehouse),
-        joinedload(Document.creator)
-    ).filter(Document.id == document.id).first()
-    
-    return document
+    return commit_with_response(db, document, DocumentSchema)
 
 
 @router.delete("/{document_id}")
-async def delete_document(
+def delete_document(
     document_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -195,6 +282,14 @@ async def delete_document(
             detail="Нельзя удалить проведенный документ"
         )
     
+    # Документ с записанными движениями остается в журнале
+    has_movements = db.query(StockMovement.id).filter(StockMovement.document_id == document_id).first()
+    if has_movements:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Нельзя удалить документ, по которому были движения товаров"
+        )
+    
     db.delete(document)
     db.commit()
     
@@ -202,15 +297,14 @@ async def delete_document(
 
 
 @router.patch("/{document_id}/post")
-async def post_document(
+def post_document(
     document_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Проведение документа"""
-    document = db.query(Document).options(
-        joinedload(Document.items)
-    ).filter(Document.id == document_id).first()
+    # Строка документа блокируется: параллельное проведение ждет и видит статус "Проведен"
+    document = db.query(Document).filter(Document.id == document_id).with_for_update().first()
     
     if not document:
         raise HTTPException(
@@ -224,52 +318,39 @@ async def post_document(
             detail="Документ уже проведен"
         )
     
-    if not document.items:
+    line_count = db.query(func.count(DocumentItem.id)).filter(DocumentItem.document_id == document_id).scalar()
+    if not line_count:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нельзя провести документ без строк"
         )
     
-    # Логика проведения документа в зависимости от типа
-    if document.document_type == DocumentType.STOCK_INPUT:
-        # Для документа "Ввод остатков" создаем или обновляем остатки
-        for item in document.items:
-            # Проверяем, существует ли уже остаток для данной номенклатуры и склада
-            existing_stock = db.query(Stock).filter(
-                and_(
-                    Stock.nomenclature_id == item.nomenclature_id,
-                    Stock.warehouse_id == document.warehouse_id
-                )
-            ).first()
-            
-            if existing_stock:
-                # Обновляем существующий остаток
-                existing_stock.quantity = item.quantity
-            else:
-                # Создаем новый остаток
-                new_stock = Stock(
-                    nomenclature_id=item.nomenclature_id,
-                    warehouse_id=document.warehouse_id,
-                    quantity=item.quantity,
-                    reserved_quantity=0.0
-                )
-                db.add(new_stock)
+    if document.document_type == DocumentType.TRANSFER and not document.target_warehouse_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Для перемещения не указан склад-получатель"
+        )
+    
+    # Записываем движения по всем строкам и изменяем остатки пакетно
+    post_document_movements(db, document, current_user.id)
+    document_type = document.document_type
     
     # Меняем статус документа на "Проведен"
     document.status = DocumentStatus.POSTED
     db.commit()
+    record_document_posted(document_type, line_count)
     
     return {"message": "Документ проведен"}
 
 
 @router.patch("/{document_id}/cancel")
-async def cancel_document(
+def cancel_document(
     document_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Отмена документа"""
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = db.query(Document).filter(Document.id == document_id).with_for_update().first()
     
     if not document:
         raise HTTPException(
@@ -283,9 +364,14 @@ async def cancel_document(
             detail="Документ уже отменен"
         )
     
-    # Здесь должна быть логика отмены документа
-    # (обратное обновление остатков и т.д.)
-    # Пока просто меняем статус
+    # Для проведенного документа записываем обратные движения
+    if document.status == DocumentStatus.POSTED:
+        reverse_movements(
+            db,
+            current_user.id,
+            f"Отмена документа {document.document_number}",
+            document_id=document.id
+        )
     
     document.status = DocumentStatus.CANCELLED
     db.commit()
@@ -295,13 +381,21 @@ async def cancel_document(
 
 # Эндпоинты для работы со строками документов
 @router.post("/{document_id}/items", response_model=DocumentItemSchema)
-async def create_document_item(
+def create_document_item(
     document_id: int,
     item_data: DocumentItemCreate,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Создание строки документа"""
+    replay = begin_idempotent_request(
+        db, current_user.id, idempotency_key,
+        request_fingerprint(f"documents.{document_id}.items.create", item_data)
+    )
+    if replay:
+        return replay
+    
     # Проверяем, существует ли документ
     document = db.query(Document).filter(Document.id == document_id).first()
     if not document:
@@ -318,7 +412,10 @@ async def create_document_item(
         )
     
     # Проверяем, существует ли номенклатура
-    nomenclature = db.query(Nomenclature).filter(Nomenclature.id == item_data.nomenclature_id).first()
+    nomenclature = db.query(Nomenclature).options(
+        joinedload(Nomenclature.category),
+        joinedload(Nomenclature.base_unit)
+    ).filter(Nomenclature.id == item_data.nomenclature_id).first()
     if not nomenclature:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -359,27 +456,28 @@ async def create_document_item(
     )
     
     db.add(item)
+    # Номенклатура и единица измерения уже в сессии после проверок
+    result = flush_response(db, item, DocumentItemSchema)
+    store_idempotent_response(db, current_user.id, idempotency_key, result)
     db.commit()
-    db.refresh(item)
     
-    # Загружаем связанные данные для ответа
-    item = db.query(DocumentItem).options(
-        joinedload(DocumentItem.nomenclature),
-        joinedload(DocumentItem.unit)
-    ).filter(DocumentItem.id == item.id).first()
-    
-    return item
+    return result
 
 
 @router.put("/items/{item_id}", response_model=DocumentItemSchema)
-async def update_document_item(
+def update_document_item(
     item_id: int,
     item_data: DocumentItemUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Обновление строки документа"""
-    item = db.query(DocumentItem).filter(DocumentItem.id == item_id).first()
+    item = db.query(DocumentItem).options(
+        joinedload(DocumentItem.document),
+        joinedload(DocumentItem.nomenclature).joinedload(Nomenclature.category),
+        joinedload(DocumentItem.nomenclature).joinedload(Nomenclature.base_unit),
+        joinedload(DocumentItem.unit)
+    ).filter(DocumentItem.id == item_id).first()
     if not item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -398,26 +496,19 @@ async def update_document_item(
     for field, value in update_data.items():
         setattr(item, field, value)
     
-    db.commit()
-    db.refresh(item)
-    
-    # Загружаем связанные данные для ответа
-    item = db.query(DocumentItem).options(
-        joinedload(DocumentItem.nomenclature),
-        joinedload(DocumentItem.unit)
-    ).filter(DocumentItem.id == item.id).first()
-    
-    return item
+    return commit_with_response(db, item, DocumentItemSchema)
 
 
 @router.delete("/items/{item_id}")
-async def delete_document_item(
+def delete_document_item(
     item_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Удаление строки документа"""
-    item = db.query(DocumentItem).filter(DocumentItem.id == item_id).first()
+    item = db.query(DocumentItem).options(
+        joinedload(DocumentItem.document)
+    ).filter(DocumentItem.id == item_id).first()
     if not item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -0,0 +1,76 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from app.models import User, DocumentType, DocumentStatus, InventoryStatus
+from app.oauth import get_current_user_from_token
+from app.exports import (
+    ExportFormat,
+    DOCUMENT_FIELDS,
+    INVENTORY_FIELDS,
+    export_response,
+    stocks_statement,
+    movements_statement,
+    documents_statement,
+    inventories_statement
+)
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+
+@router.get("/stocks")
+def export_stocks(
+    format: ExportFormat = Query(ExportFormat.NDJSON, description="Формат выгрузки: ndjson или csv"),
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
+    nomenclature_id: Optional[int] = Query(None, description="Фильтр по номенклатуре"),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Потоковая выгрузка остатков"""
+    return export_response(stocks_statement(warehouse_id, nomenclature_id), format, "stocks")
+
+
+@router.get("/movements")
+def export_movements(
+    format: ExportFormat = Query(ExportFormat.NDJSON, description="Формат выгрузки: ndjson или csv"),
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
+    nomenclature_id: Optional[int] = Query(None, description="Фильтр по номенклатуре"),
+    date_from: Optional[datetime] = Query(None, description="Начало периода"),
+    date_to: Optional[datetime] = Query(None, description="Конец периода"),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Потоковая выгрузка журнала движений"""
+    return export_response(
+        movements_statement(warehouse_id, nomenclature_id, date_from, date_to), format, "movements"
+    )
+
+
+@router.get("/documents")
+def export_documents(
+    format: ExportFormat = Query(ExportFormat.NDJSON, description="Формат выгрузки: ndjson (документ со строками) или csv (строка на строку документа)"),
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
+    document_type: Optional[DocumentType] = Query(None, description="Фильтр по типу документа"),
+    status: Optional[DocumentStatus] = Query(None, description="Фильтр по статусу"),
+    date_from: Optional[datetime] = Query(None, description="Начало периода"),
+    date_to: Optional[datetime] = Query(None, description="Конец периода"),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Потоковая выгрузка документов со строками"""
+    return export_response(
+        documents_statement(warehouse_id, document_type, status, date_from, date_to),
+        format, "documents", DOCUMENT_FIELDS
+    )
+
+
+@router.get("/inventories")
+def export_inventories(
+    format: ExportFormat = Query(ExportFormat.NDJSON, description="Формат выгрузки: ndjson (инвентаризация со строками) или csv (строка на строку инвентаризации)"),
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
+    status: Optional[InventoryStatus] = Query(None, description="Фильтр по статусу"),
+    date_from: Optional[datetime] = Query(None, description="Начало периода"),
+    date_to: Optional[datetime] = Query(None, description="Конец периода"),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Потоковая выгрузка инвентаризаций со строками"""
+    return export_response(
+        inventories_statement(warehouse_id, status, date_from, date_to),
+        format, "inventories", INVENTORY_FIELDS
+    )
@@ -1,11 +1,17 @@
+import asyncio
+from datetime import datetime, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, Header, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import and_, func, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.database import get_db, get_read_db, SessionLocal, commit_with_response
+from app.pagination import paginate
 from app.models import (
-    Inventory, InventoryItem, Nomenclature, Warehouse, User, UnitOfMeasure,
-    InventoryStatus
+    Inventory, InventoryItem, Nomenclature, Stock, Warehouse, User, UnitOfMeasure,
+    InventoryStatus, InventoryCountContribution, InventoryCountLog
 )
 from app.schemas import (
     Inventory as InventorySchema,
@@ -14,26 +20,51 @@ from app.schemas import (
     InventoryWithItems,
     InventoryItem as InventoryItemSchema,
     InventoryItemCreate,
-    InventoryItemUpdate
+    InventoryItemUpdate,
+    InventoryCountBatch,
+    InventoryCountResult,
+    InventoryCountContribution as InventoryCountContributionSchema,
+    InventoryCountLogEntry
 )
-from app.oauth import get_current_user_from_token
+from app.oauth import get_current_user_from_token, get_user_by_access_token
+from app.inventory_counts import (
+    DEVICE_ID_HEADER, resolve_count_events, counter_increments, lock_inventory_for_counts, apply_counts, set_own_count,
+    overlay_counts, merge_counts, count_buffer
+)
+from app.stock_posting import post_inventory_movements, reverse_movements
 
 router = APIRouter(prefix="/inventories", tags=["inventories"])
 
 
+def _overlay_in_progress(db: Session, inventories: List[Inventory]) -> None:
+    """Факт строк инвентаризаций в процессе - из вкладов счетчиков (в строки пишется при завершении)"""
+    overlay_counts(db, [
+        item
+        for inventory in inventories
+        if inventory.status == InventoryStatus.IN_PROGRESS
+        for item in inventory.items
+    ])
+
+
 @router.get("/", response_model=List[InventorySchema])
-async def get_inventories(
+def get_inventories(
+    response: Response,
     skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
     limit: int = Query(100, ge=1, le=1000, description="Максимальное количество записей"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (заголовок X-Next-Cursor)"),
     warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
     status: Optional[InventoryStatus] = Query(None, description="Фильтр по статусу"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Получение списка инвентаризаций"""
+    # Строки всех инвентаризаций страницы и их связи - отдельными запросами на страницу, без N+1
     query = db.query(Inventory).options(
         joinedload(Inventory.warehouse),
-        joinedload(Inventory.creator)
+        joinedload(Inventory.creator),
+        selectinload(Inventory.items).joinedload(InventoryItem.nomenclature),
+        selectinload(Inventory.items).joinedload(InventoryItem.unit),
+        selectinload(Inventory.items).joinedload(InventoryItem.counter)
     )
     
     if warehouse_id:
@@ -42,12 +73,13 @@ async def get_inventories(
     if status:
         query = query.filter(Inventory.status == status)
     
-    inventories = query.offset(skip).limit(limit).all()
+    inventories = paginate(query, Inventory.id, skip, limit, cursor, response)
+    _overlay_in_progress(db, inventories)
     return inventories
 
 
 @router.get("/{inventory_id}", response_model=InventoryWithItems)
-async def get_inventory(
+def get_inventory(
     inventory_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -66,11 +98,12 @@ async def get_inventory(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Инвентаризация не найдена"
         )
+    _overlay_in_progress(db, [inventory])
     return inventory
 
 
 @router.post("/", response_model=InventorySchema)
-async def create_inventory(
+def create_inventory(
     inventory_data: InventoryCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -102,31 +135,30 @@ async def create_inventory(
         date_end=inventory_data.date_end,
         status=inventory_data.status,
         created_by=current_user.id,
-        description=inventory_data.description
+        description=inventory_data.description,
+        items=[]
     )
     
     db.add(inventory)
-    db.commit()
-    db.refresh(inventory)
-    
-    # Загружаем связанные данные для ответа
-    inventory = db.query(Inventory).options(
-        joinedload(Inventory.warehouse),
-        joinedload(Inventory.creator)
-    ).filter(Inventory.id == inventory.id).first()
-    
-    return inventory
+    # Склад и автор уже в сессии, строк у новой инвентаризации нет
+    return commit_with_response(db, inventory, InventorySchema)
 
 
 @router.put("/{inventory_id}", response_model=InventorySchema)
-async def update_inventory(
+def update_inventory(
     inventory_id: int,
     inventory_data: InventoryUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Обновление инвентаризации"""
-    inventory = db.query(Inventory).filter(Inventory.id == inventory_id).first()
+    inventory = db.query(Inventory).options(
+        joinedload(Inventory.warehouse),
+        joinedload(Inventory.creator),
+        joinedload(Inventory.items).joinedload(InventoryItem.nomenclature),
+        joinedload(Inventory.items).joinedload(InventoryItem.unit),
+        joinedload(Inventory.items).joinedload(InventoryItem.counter)
+    ).filter(Inventory.id == inventory_id).first()
     if not inventory:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -159,20 +191,12 @@ async def update_inventory(
     for field, value in update_data.items():
         setattr(inventory, field, value)
     
-    db.commit()
-    db.refresh(inventory)
-    
-    # Загружаем связанные данные для ответа
-    inventory = db.query(Inventory).options(
-        joinedload(Inventory.warehouse),
-        joinedload(Inventory.creator)
-    ).filter(Inventory.id == inventory.id).first()
-    
-    return inventory
+    _overlay_in_progress(db, [inventory])
+    return commit_with_response(db, inventory, InventorySchema)
 
 
 @router.delete("/{inventory_id}")
-async def delete_inventory(
+def delete_inventory(
     inventory_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -199,15 +223,18 @@ async def delete_inventory(
 
 
 @router.patch("/{inventory_id}/complete")
-async def complete_inventory(
+def complete_inventory(
     inventory_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
-    """Завершение инвентаризации"""
-    inventory = db.query(Inventory).options(
-        joinedload(Inventory.items)
-    ).filter(Inventory.id == inventory_id).first()
+    """Завершение инвентаризации с применением разниц к остаткам"""
+    # Сначала записываем приращения, накопленные потоком пересчета в этом воркере.
+    # Приращения других воркеров, не записанные до блокировки ниже, отклоняются
+    # при их записи (статус уже не IN_PROGRESS), и клиент не получает подтверждения
+    count_buffer.flush(inventory_id)
+    
+    inventory = db.query(Inventory).filter(Inventory.id == inventory_id).with_for_update().first()
     
     if not inventory:
         raise HTTPException(
@@ -221,40 +248,54 @@ async def complete_inventory(
             detail="Инвентаризация уже завершена"
         )
     
-    if not inventory.items:
+    if inventory.status == InventoryStatus.CANCELLED:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Нельзя завершить отмененную инвентаризацию"
+        )
+    
+    # Факт строк сводится из вкладов всех счетчиков
+    merge_counts(db, inventory_id)
+    
+    # Количество строк и посчитанных строк одним запросом
+    total_items, counted_items = db.query(
+        func.count(InventoryItem.id),
+        func.count(InventoryItem.actual_quantity)
+    ).filter(InventoryItem.inventory_id == inventory_id).one()
+    
+    if not total_items:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нельзя завершить инвентаризацию без строк"
         )
     
     # Проверяем, что все строки посчитаны
-    uncounted_items = [item for item in inventory.items if item.actual_quantity is None]
-    if uncounted_items:
+    if counted_items < total_items:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Не все позиции посчитаны"
         )
     
-    # Здесь должна быть логика завершения инвентаризации
-    # (создание документов по разницам, обновление остатков и т.д.)
-    # Пока просто меняем статус и дату окончания
+    # Разницы по всем строкам записываются движениями и применяются к остаткам пакетно
+    date_end = datetime.now(timezone.utc)
+    adjusted = post_inventory_movements(db, inventory, current_user.id, date_end)
     
-    from datetime import datetime
     inventory.status = InventoryStatus.COMPLETED
-    inventory.date_end = datetime.utcnow()
+    inventory.date_end = date_end
     db.commit()
     
-    return {"message": "Инвентаризация завершена"}
+    return {"message": "Инвентаризация завершена", "adjusted": adjusted}
 
 
 @router.patch("/{inventory_id}/cancel")
-async def cancel_inventory(
+def cancel_inventory(
     inventory_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Отмена инвентаризации"""
-    inventory = db.query(Inventory).filter(Inventory.id == inventory_id).first()
+    # Блокировка: параллельные отмена и завершение не проводят движения дважды
+    inventory = db.query(Inventory).filter(Inventory.id == inventory_id).with_for_update().first()
     
     if not inventory:
         raise HTTPException(
@@ -268,23 +309,235 @@ async def cancel_inventory(
             detail="Инвентаризация уже отменена"
         )
     
+    # Для завершенной инвентаризации записываем обратные движения
+    if inventory.status == InventoryStatus.COMPLETED:
+        reverse_movements(
+            db,
+            current_user.id,
+            f"Отмена инвентаризации {inventory.inventory_number}",
+            inventory_id=inventory.id
+        )
+    
     inventory.status = InventoryStatus.CANCELLED
     db.commit()
     
     return {"message": "Инвентаризация отменена"}
 
 
+@router.post("/{inventory_id}/fill-from-stock")
+def fill_inventory_from_stock(
+    inventory_id: int,
+    category_id: Optional[int] = Query(None, description="Только номенклатура указанной категории"),
+    include_zero: bool = Query(False, description="Включать позиции с нулевым остатком"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Заполнение строк инвентаризации текущими остатками склада (плановое количество)"""
+    # FOR SHARE: завершение (FOR UPDATE) ждет добавления строк, а после него строки не добавляются
+    inventory = lock_inventory_for_counts(db, inventory_id)
+    if not inventory:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Инвентаризация не найдена"
+        )
+    
+    if inventory.status != InventoryStatus.IN_PROGRESS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Заполнять можно только инвентаризацию в процессе"
+        )
+    
+    # Все строки одним INSERT ... SELECT; уже добавленная номенклатура пропускается
+    source = select(
+        literal(inventory.id),
+        Stock.nomenclature_id,
+        Stock.quantity,
+        Nomenclature.base_unit_id
+    ).join(
+        Nomenclature, Stock.nomenclature_id == Nomenclature.id
+    ).where(
+        Stock.warehouse_id == inventory.warehouse_id,
+        Nomenclature.is_active == True
+    )
+    if category_id:
+        source = source.where(Nomenclature.category_id == category_id)
+    if not include_zero:
+        source = source.where(Stock.quantity != 0)
+    
+    stmt = pg_insert(InventoryItem).from_select(
+        ["inventory_id", "nomenclature_id", "planned_quantity", "unit_id"],
+        source
+    ).on_conflict_do_nothing(constraint="uq_inventory_items_inventory_nomenclature")
+    added = db.execute(stmt).rowcount
+    db.commit()
+    
+    return {"message": "Инвентаризация заполнена по остаткам", "added": added}
+
+
+def _get_inventory_in_progress(db: Session, inventory_id: int) -> Inventory:
+    inventory = lock_inventory_for_counts(db, inventory_id)
+    if not inventory:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Инвентаризация не найдена"
+        )
+    if inventory.status != InventoryStatus.IN_PROGRESS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Инвентаризация не в процессе"
+        )
+    return inventory
+
+
+@router.post("/{inventory_id}/counts", response_model=InventoryCountResult)
+def add_inventory_counts(
+    inventory_id: int,
+    batch: InventoryCountBatch,
+    device_id: Optional[str] = Header(None, alias=DEVICE_ID_HEADER),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Пакет событий пересчета: приращения по штрих-кодам или номенклатуре одной записью"""
+    inventory = _get_inventory_in_progress(db, inventory_id)
+    
+    increments, not_found, accepted = resolve_count_events(db, batch.events)
+    applied = apply_counts(db, inventory, counter_increments(increments, current_user.id, device_id))
+    db.commit()
+    
+    # Номенклатура, переданная по несуществующему ID
+    not_found.extend(str(nomenclature_id) for nomenclature_id in sorted(set(increments) - set(applied)))
+    
+    return InventoryCountResult(accepted=accepted, applied=len(applied), not_found=not_found)
+
+
+COUNT_STREAM_REJECTED = "Инвентаризация не в процессе, пересчет не записан"
+
+
+def _authorize_count_stream(inventory_id: int, access_token: Optional[str]) -> Optional[int]:
+    """Проверка токена и инвентаризации для потока пересчета (ID пользователя или None)"""
+    if not access_token:
+        return None
+    db = SessionLocal()
+    try:
+        user = get_user_by_access_token(db, access_token)
+        if not user or not user.is_active:
+            return None
+        inventory = db.query(Inventory.status).filter(Inventory.id == inventory_id).first()
+        if not inventory or inventory.status != InventoryStatus.IN_PROGRESS:
+            return None
+        return user.id
+    finally:
+        db.close()
+
+
+def _resolve_count_stream_events(events):
+    db = SessionLocal()
+    try:
+        return resolve_count_events(db, events)
+    finally:
+        db.close()
+
+
+@router.websocket("/{inventory_id}/counts/ws")
+async def inventory_counts_stream(
+    websocket: WebSocket,
+    inventory_id: int,
+    token: Optional[str] = Query(None, description="Access token (если нельзя передать заголовок Authorization)"),
+    device_id: Optional[str] = Query(None, description="ID устройства, с которого ведется пересчет")
+):
+    """Поток событий пересчета.
+    
+    Сообщение - событие, список событий или {"seq": 17, "events": [...]}.
+    Приращения суммируются в памяти и записываются пакетами раз в
+    inventory_count_flush_seconds. Сообщения читаются без ожидания записи,
+    ответ на каждое (количество принятых событий и нераспознанные штрих-коды)
+    отправляется после фиксации его пакета и содержит seq сообщения, поэтому
+    ответы могут приходить не по порядку. Если инвентаризация к этому моменту
+    завершена или отменена, по seq приходит ошибка, и следующие сообщения
+    отклоняются сразу.
+    """
+    access_token = token
+    authorization = websocket.headers.get("authorization", "")
+    if not access_token and authorization.lower().startswith("bearer "):
+        access_token = authorization[7:]
+    
+    user_id = await run_in_threadpool(_authorize_count_stream, inventory_id, access_token)
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    pending_acks = set()
+    rejected = False
+    
+    async def send(seq, payload: dict) -> None:
+        async with send_lock:
+            await websocket.send_json({"seq": seq, **payload})
+    
+    async def acknowledge(seq, result: InventoryCountResult, written: asyncio.Future) -> None:
+        nonlocal rejected
+        try:
+            # Подтверждение - только после записи пакета в БД
+            if await written is None:
+                rejected = True
+                await send(seq, {"error": COUNT_STREAM_REJECTED})
+            else:
+                await send(seq, result.model_dump(mode="json"))
+        except (WebSocketDisconnect, RuntimeError):
+            # Клиент отключился до записи пакета
+            pass
+    
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except ValueError:
+                await send(None, {"error": "Некорректное сообщение"})
+                continue
+            seq = message.pop("seq", None) if isinstance(message, dict) else None
+            if isinstance(message, dict) and "events" not in message:
+                message = [message]
+            try:
+                batch = InventoryCountBatch.model_validate(
+                    message if isinstance(message, dict) else {"events": message}
+                )
+            except ValidationError as error:
+                await send(seq, {"error": "Некорректное сообщение", "details": error.errors(include_url=False)})
+                continue
+            if rejected:
+                await send(seq, {"error": COUNT_STREAM_REJECTED})
+                continue
+            
+            increments, not_found, accepted = await run_in_threadpool(_resolve_count_stream_events, batch.events)
+            result = InventoryCountResult(accepted=accepted, not_found=not_found)
+            if not increments:
+                await send(seq, result.model_dump(mode="json"))
+                continue
+            written = count_buffer.add(inventory_id, counter_increments(increments, user_id, device_id))
+            task = asyncio.create_task(acknowledge(seq, result, written))
+            pending_acks.add(task)
+            task.add_done_callback(pending_acks.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Приращения остаются в буфере и будут записаны, отвечать уже некому
+        for task in list(pending_acks):
+            task.cancel()
+
+
 # Эндпоинты для работы со строками инвентаризации
 @router.post("/{inventory_id}/items", response_model=InventoryItemSchema)
-async def create_inventory_item(
+def create_inventory_item(
     inventory_id: int,
     item_data: InventoryItemCreate,
+    device_id: Optional[str] = Header(None, alias=DEVICE_ID_HEADER),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Создание строки инвентаризации"""
-    # Проверяем, существует ли инвентаризация
-    inventory = db.query(Inventory).filter(Inventory.id == inventory_id).first()
+    # Проверяем, существует ли инвентаризация (FOR SHARE: завершение ждет записи вклада)
+    inventory = lock_inventory_for_counts(db, inventory_id)
     if not inventory:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -299,7 +552,10 @@ async def create_inventory_item(
         )
     
     # Проверяем, существует ли номенклатура
-    nomenclature = db.query(Nomenclature).filter(Nomenclature.id == item_data.nomenclature_id).first()
+    nomenclature = db.query(Nomenclature).options(
+        joinedload(Nomenclature.category),
+        joinedload(Nomenclature.base_unit)
+    ).filter(Nomenclature.id == item_data.nomenclature_id).first()
     if not nomenclature:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -332,92 +588,142 @@ async def create_inventory_item(
         inventory_id=inventory_id,
         nomenclature_id=item_data.nomenclature_id,
         planned_quantity=item_data.planned_quantity,
-        actual_quantity=item_data.actual_quantity,
-        difference=item_data.difference,
         unit_id=item_data.unit_id
     )
     
     db.add(item)
-    db.commit()
-    db.refresh(item)
     
-    # Загружаем связанные данные для ответа
-    item = db.query(InventoryItem).options(
-        joinedload(InventoryItem.nomenclature),
-        joinedload(InventoryItem.unit)
-    ).filter(InventoryItem.id == item.id).first()
+    # Фактическое количество записывается вкладом текущего счетчика
+    if item_data.actual_quantity is not None:
+        db.flush()
+        set_own_count(db, inventory_id, item.nomenclature_id, current_user.id, device_id, item_data.actual_quantity)
+        overlay_counts(db, [item], [item.nomenclature_id])
     
-    return item
+    return commit_with_response(db, item, InventoryItemSchema)
 
 
 @router.put("/items/{item_id}", response_model=InventoryItemSchema)
-async def update_inventory_item(
+def update_inventory_item(
     item_id: int,
     item_data: InventoryItemUpdate,
+    device_id: Optional[str] = Header(None, alias=DEVICE_ID_HEADER),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Обновление строки инвентаризации"""
-    item = db.query(InventoryItem).filter(InventoryItem.id == item_id).first()
+    item = db.query(InventoryItem).options(
+        joinedload(InventoryItem.inventory),
+        joinedload(InventoryItem.nomenclature).joinedload(Nomenclature.category),
+        joinedload(InventoryItem.nomenclature).joinedload(Nomenclature.base_unit),
+        joinedload(InventoryItem.unit),
+        joinedload(InventoryItem.counter)
+    ).filter(InventoryItem.id == item_id).first()
     if not item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Строка инвентаризации не найдена"
         )
     
-    # Проверяем, можно ли редактировать инвентаризацию
-    if item.inventory.status == InventoryStatus.COMPLETED:
+    # Проверяем, можно ли редактировать инвентаризацию (FOR SHARE: завершение ждет записи вклада)
+    if lock_inventory_for_counts(db, item.inventory_id).status == InventoryStatus.COMPLETED:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нельзя редактировать завершенную инвентаризацию"
         )
     
-    # Обновляем поля
+    # Обновляем поля (факт строки складывается из вкладов счетчиков)
     update_data = item_data.model_dump(exclude_unset=True)
+    update_data.pop("difference", None)
+    actual_quantity = update_data.pop("actual_quantity", None)
     for field, value in update_data.items():
         setattr(item, field, value)
     
-    # Если указано фактическое количество, рассчитываем разницу
-    if item_data.actual_quantity is not None:
-        item.difference = item_data.actual_quantity - item.planned_quantity
-        item.counted_by = current_user.id
-        from datetime import datetime
-        item.counted_at = datetime.utcnow()
-    
-    db.commit()
-    db.refresh(item)
-    
-    # Загружаем связанные данные для ответа
-    item = db.query(InventoryItem).options(
-        joinedload(InventoryItem.nomenclature),
-        joinedload(InventoryItem.unit),
-        joinedload(InventoryItem.counter)
-    ).filter(InventoryItem.id == item.id).first()
+    # Указанное фактическое количество - это пересчет текущего счетчика (пользователь и устройство);
+    # вклады других счетчиков сохраняются, факт строки равен их сумме
+    if actual_quantity is not None:
+        db.flush()
+        set_own_count(db, item.inventory_id, item.nomenclature_id, current_user.id, device_id, actual_quantity)
+    if item.inventory.status == InventoryStatus.IN_PROGRESS:
+        overlay_counts(db, [item], [item.nomenclature_id])
     
+    return commit_with_response(db, item, InventoryItemSchema)
+
+
+def _get_item(db: Session, item_id: int) -> InventoryItem:
+    item = db.query(InventoryItem).filter(InventoryItem.id == item_id).first()
+    if not item:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Строка инвентаризации не найдена"
+        )
     return item
 
 
+@router.get("/items/{item_id}/contributions", response_model=List[InventoryCountContributionSchema])
+def get_inventory_item_contributions(
+    item_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Разбивка факта строки по счетчикам (пользователь и устройство)"""
+    item = _get_item(db, item_id)
+    return db.query(InventoryCountContribution).options(
+        joinedload(InventoryCountContribution.user)
+    ).filter(
+        InventoryCountContribution.inventory_id == item.inventory_id,
+        InventoryCountContribution.nomenclature_id == item.nomenclature_id
+    ).order_by(
+        InventoryCountContribution.updated_at
+    ).all()
+
+
+@router.get("/items/{item_id}/count-log", response_model=List[InventoryCountLogEntry])
+def get_inventory_item_count_log(
+    item_id: int,
+    skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
+    limit: int = Query(100, ge=1, le=1000, description="Максимальное количество записей"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Журнал приращений пересчета строки"""
+    item = _get_item(db, item_id)
+    return db.query(InventoryCountLog).filter(
+        InventoryCountLog.inventory_id == item.inventory_id,
+        InventoryCountLog.nomenclature_id == item.nomenclature_id
+    ).order_by(
+        InventoryCountLog.id
+    ).offset(skip).limit(limit).all()
+
+
 @router.delete("/items/{item_id}")
-async def delete_inventory_item(
+def delete_inventory_item(
     item_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Удаление строки инвентаризации"""
-    item = db.query(InventoryItem).filter(InventoryItem.id == item_id).first()
+    item = db.query(InventoryItem).options(
+        joinedload(InventoryItem.inventory)
+    ).filter(InventoryItem.id == item_id).first()
     if not item:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Строка инвентаризации не найдена"
         )
     
-    # Проверяем, можно ли редактировать инвентаризацию
-    if item.inventory.status == InventoryStatus.COMPLETED:
+    # Проверяем, можно ли редактировать инвентаризацию (FOR SHARE: завершение не сведет удаляемые вклады)
+    if lock_inventory_for_counts(db, item.inventory_id).status == InventoryStatus.COMPLETED:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нельзя редактировать завершенную инвентаризацию"
         )
     
+    # Вклады строки удаляются вместе с ней, иначе они вернутся в факт при повторном
+    # добавлении номенклатуры и при завершении. Журнал пересчета не изменяется
+    db.query(InventoryCountContribution).filter(
+        InventoryCountContribution.inventory_id == item.inventory_id,
+        InventoryCountContribution.nomenclature_id == item.nomenclature_id
+    ).delete(synchronize_session=False)
     db.delete(item)
     db.commit()
     
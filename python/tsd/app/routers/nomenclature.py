@@ -1,27 +1,37 @@
+from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import func
 from sqlalchemy.orm import Session, joinedload
-from app.database import get_db
+from app.database import get_db, get_read_db, commit_with_response
+from app.pagination import paginate
 from app.models import Nomenclature, NomenclatureCategory, UnitOfMeasure
 from app.schemas import (
     Nomenclature as NomenclatureSchema,
     NomenclatureCreate,
-    NomenclatureUpdate
+    NomenclatureUpdate,
+    SyncResponse
 )
 from app.oauth import get_current_user_from_token
+from app.barcode_cache import barcode_index
+from app.stock_summary import refresh_stock_summary_for
+from app.sync import new_sync_token, filter_changed, get_deleted_ids
 from app.models import User
 
 router = APIRouter(prefix="/nomenclature", tags=["nomenclature"])
 
 
 @router.get("/", response_model=List[NomenclatureSchema])
-async def get_nomenclature(
+def get_nomenclature(
+    response: Response,
     skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
     limit: int = Query(100, ge=1, le=1000, description="Максимальное количество записей"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (заголовок X-Next-Cursor)"),
     active_only: bool = Query(True, description="Показывать только активную номенклатуру"),
     category_id: Optional[int] = Query(None, description="Фильтр по категории"),
     search: Optional[str] = Query(None, description="Поиск по названию или коду"),
-    db: Session = Depends(get_db),
+    ranked: bool = Query(False, description="Сортировать результаты поиска по релевантности"),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Получение списка номенклатуры"""
@@ -44,13 +54,47 @@ async def get_nomenclature(
             (Nomenclature.description_ru.ilike(search_filter)) |
             (Nomenclature.description_ua.ilike(search_filter))
         )
+        
+        if ranked:
+            if cursor:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Курсор не поддерживается при сортировке по релевантности, используйте skip"
+                )
+            # Отбор по триграммным индексам, сортировка по сходству со строкой поиска
+            relevance = func.greatest(
+                func.word_similarity(search, Nomenclature.name),
+                func.word_similarity(search, Nomenclature.code),
+                func.word_similarity(search, func.coalesce(Nomenclature.description_ru, "")),
+                func.word_similarity(search, func.coalesce(Nomenclature.description_ua, ""))
+            )
+            return query.order_by(relevance.desc(), Nomenclature.id).offset(skip).limit(limit).all()
     
-    nomenclature = query.offset(skip).limit(limit).all()
+    nomenclature = paginate(query, Nomenclature.id, skip, limit, cursor, response)
     return nomenclature
 
 
+@router.get("/sync", response_model=SyncResponse[NomenclatureSchema])
+def sync_nomenclature(
+    changed_since: Optional[datetime] = Query(None, description="Токен предыдущей синхронизации (sync_token)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Дельта-синхронизация номенклатуры (включая деактивированную)"""
+    sync_token = new_sync_token(db)
+    query = db.query(Nomenclature).options(
+        joinedload(Nomenclature.category),
+        joinedload(Nomenclature.base_unit)
+    )
+    
+    nomenclature = filter_changed(query, Nomenclature, changed_since).all()
+    deleted_ids = get_deleted_ids(db, "nomenclature", changed_since)
+    
+    return {"items": nomenclature, "deleted_ids": deleted_ids, "sync_token": sync_token}
+
+
 @router.get("/{nomenclature_id}", response_model=NomenclatureSchema)
-async def get_nomenclature_item(
+def get_nomenclature_item(
     nomenclature_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -70,7 +114,7 @@ async def get_nomenclature_item(
 
 
 @router.get("/code/{code}", response_model=NomenclatureSchema)
-async def get_nomenclature_by_code(
+def get_nomenclature_by_code(
     code: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -90,7 +134,7 @@ async def get_nomenclature_by_code(
 
 
 @router.post("/", response_model=NomenclatureSchema)
-async def create_nomenclature(
+def create_nomenclature(
     nomenclature_data: NomenclatureCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -132,27 +176,22 @@ async def create_nomenclature(
     )
     
     db.add(nomenclature)
-    db.commit()
-    db.refresh(nomenclature)
-    
-    # Загружаем связанные данные для ответа
-    nomenclature = db.query(Nomenclature).options(
-        joinedload(Nomenclature.category),
-        joinedload(Nomenclature.base_unit)
-    ).filter(Nomenclature.id == nomenclature.id).first()
-    
-    return nomenclature
+    # Категория и единица измерения уже в сессии после проверок
+    return commit_with_response(db, nomenclature, NomenclatureSchema)
 
 
 @router.put("/{nomenclature_id}", response_model=NomenclatureSchema)
-async def update_nomenclature(
+def update_nomenclature(
     nomenclature_id: int,
     nomenclature_data: NomenclatureUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Обновление номенклатуры"""
-    nomenclature = db.query(Nomenclature).filter(Nomenclature.id == nomenclature_id).first()
+    nomenclature = db.query(Nomenclature).options(
+        joinedload(Nomenclature.category),
+        joinedload(Nomenclature.base_unit)
+    ).filter(Nomenclature.id == nomenclature_id).first()
     if not nomenclature:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -194,20 +233,21 @@ async def update_nomenclature(
     for field, value in update_data.items():
         setattr(nomenclature, field, value)
     
-    db.commit()
-    db.refresh(nomenclature)
+    # Код, наименование и категория хранятся в сводке остатков
+    if {"code", "name", "category_id"} & update_data.keys():
+        db.flush()
+        refresh_stock_summary_for(db, nomenclature_id=nomenclature.id)
     
-    # Загружаем связанные данные для ответа
-    nomenclature = db.query(Nomenclature).options(
-        joinedload(Nomenclature.category),
-        joinedload(Nomenclature.base_unit)
-    ).filter(Nomenclature.id == nomenclature.id).first()
+    response = commit_with_response(db, nomenclature, NomenclatureSchema)
     
-    return nomenclature
+    # Данные номенклатуры входят в ответ сканирования штрих-кода
+    barcode_index.reload_nomenclature(db, nomenclature_id)
+    
+    return response
 
 
 @router.delete("/{nomenclature_id}")
-async def delete_nomenclature(
+def delete_nomenclature(
     nomenclature_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -224,11 +264,13 @@ async def delete_nomenclature(
     nomenclature.is_active = False
     db.commit()
     
+    barcode_index.reload_nomenclature(db, nomenclature_id)
+    
     return {"message": "Номенклатура деактивирована"}
 
 
 @router.patch("/{nomenclature_id}/activate")
-async def activate_nomenclature(
+def activate_nomenclature(
     nomenclature_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -244,4 +286,6 @@ async def activate_nomenclature(
     nomenclature.is_active = True
     db.commit()
     
+    barcode_index.reload_nomenclature(db, nomenclature_id)
+    
     return {"message": "Номенклатура активирована"}
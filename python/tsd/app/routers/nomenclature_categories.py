@@ -1,23 +1,29 @@
+from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, commit_with_response
+from app.pagination import paginate
 from app.models import NomenclatureCategory
 from app.schemas import (
     NomenclatureCategory as NomenclatureCategorySchema,
     NomenclatureCategoryCreate,
-    NomenclatureCategoryUpdate
+    NomenclatureCategoryUpdate,
+    SyncResponse
 )
 from app.oauth import get_current_user_from_token
+from app.sync import new_sync_token, filter_changed, get_deleted_ids
 from app.models import User
 
 router = APIRouter(prefix="/nomenclature-categories", tags=["nomenclature-categories"])
 
 
 @router.get("/", response_model=List[NomenclatureCategorySchema])
-async def get_nomenclature_categories(
+def get_nomenclature_categories(
+    response: Response,
     skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
     limit: int = Query(100, ge=1, le=1000, description="Максимальное количество записей"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (заголовок X-Next-Cursor)"),
     active_only: bool = Query(True, description="Показывать только активные категории"),
     search: Optional[str] = Query(None, description="Поиск по названию или коду"),
     db: Session = Depends(get_db),
@@ -36,12 +42,28 @@ async def get_nomenclature_categories(
             (NomenclatureCategory.code.ilike(search_filter))
         )
     
-    categories = query.offset(skip).limit(limit).all()
+    categories = paginate(query, NomenclatureCategory.id, skip, limit, cursor, response)
     return categories
 
 
+@router.get("/sync", response_model=SyncResponse[NomenclatureCategorySchema])
+def sync_nomenclature_categories(
+    changed_since: Optional[datetime] = Query(None, description="Токен предыдущей синхронизации (sync_token)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Дельта-синхронизация категорий номенклатуры (включая деактивированные)"""
+    sync_token = new_sync_token(db)
+    query = db.query(NomenclatureCategory)
+    
+    categories = filter_changed(query, NomenclatureCategory, changed_since).all()
+    deleted_ids = get_deleted_ids(db, "nomenclature_categories", changed_since)
+    
+    return {"items": categories, "deleted_ids": deleted_ids, "sync_token": sync_token}
+
+
 @router.get("/{category_id}", response_model=NomenclatureCategorySchema)
-async def get_nomenclature_category(
+def get_nomenclature_category(
     category_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -57,7 +79,7 @@ async def get_nomenclature_category(
 
 
 @router.get("/code/{code}", response_model=NomenclatureCategorySchema)
-async def get_category_by_code(
+def get_category_by_code(
     code: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -73,7 +95,7 @@ async def get_category_by_code(
 
 
 @router.post("/", response_model=NomenclatureCategorySchema)
-async def create_nomenclature_category(
+def create_nomenclature_category(
     category_data: NomenclatureCategoryCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -96,14 +118,11 @@ async def create_nomenclature_category(
     )
     
     db.add(category)
-    db.commit()
-    db.refresh(category)
-    
-    return category
+    return commit_with_response(db, category, NomenclatureCategorySchema)
 
 
 @router.put("/{category_id}", response_model=NomenclatureCategorySchema)
-async def update_nomenclature_category(
+def update_nomenclature_category(
     category_id: int,
     category_data: NomenclatureCategoryUpdate,
     db: Session = Depends(get_db),
@@ -134,14 +153,11 @@ async def update_nomenclature_category(
     for field, value in update_data.items():
         setattr(category, field, value)
     
-    db.commit()
-    db.refresh(category)
-    
-    return category
+    return commit_with_response(db, category, NomenclatureCategorySchema)
 
 
 @router.delete("/{category_id}")
-async def delete_nomenclature_category(
+def delete_nomenclature_category(
     category_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -162,7 +178,7 @@ async def delete_nomenclature_category(
 
 
 @router.patch("/{category_id}/activate")
-async def activate_nomenclature_category(
+def activate_nomenclature_category(
     category_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
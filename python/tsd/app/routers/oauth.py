@@ -20,6 +20,7 @@ from app.oauth import (
     authenticate_client,
     create_oauth_token,
     get_oauth_client,
+    revoke_oauth_token,
     get_current_user_from_token,
     get_current_client_from_token
 )
@@ -29,7 +30,7 @@ router = APIRouter(prefix="/oauth", tags=["oauth"])
 
 
 @router.post("/register", response_model=OAuthClientResponse)
-async def register_oauth_client(
+def register_oauth_client(
     client_data: OAuthClientCreate, 
     db: Session = Depends(get_db)
 ):
@@ -58,7 +59,7 @@ async def register_oauth_client(
 
 
 @router.post("/token", response_model=TokenResponse)
-async def get_token(
+def get_token(
     grant_type: str = Form(...),
     client_id: str = Form(...),
     client_secret: str = Form(None),
@@ -149,7 +150,7 @@ async def get_token(
 
 
 @router.post("/register-user", response_model=UserSchema)
-async def register_user(
+def register_user(
     user: UserCreate, 
     db: Session = Depends(get_db)
 ):
@@ -184,8 +185,24 @@ async def register_user(
     return db_user
 
 
+@router.post("/revoke")
+def revoke_token(
+    token: str = Form(...),
+    current_user: User = Depends(get_current_user_from_token),
+    db: Session = Depends(get_db)
+):
+    """Отзыв OAuth токена текущего пользователя"""
+    if not revoke_oauth_token(db, token, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Token not found"
+        )
+    
+    return {"message": "Token revoked"}
+
+
 @router.get("/me", response_model=UserSchema)
-async def get_current_user_info(
+def get_current_user_info(
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Получение информации о текущем пользователе"""
@@ -193,7 +210,7 @@ async def get_current_user_info(
 
 
 @router.get("/client-info")
-async def get_client_info(
+def get_client_info(
     current_client: OAuthClient = Depends(get_current_client_from_token)
 ):
     """Получение информации о текущем клиенте"""
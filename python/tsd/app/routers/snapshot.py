@@ -0,0 +1,87 @@
+import os
+import re
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models import User
+from app.oauth import get_current_user_from_token
+from app.snapshot import get_snapshot
+
+router = APIRouter(prefix="/snapshot", tags=["snapshot"])
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _read_range(path: str, start: int, end: int):
+    with open(path, "rb") as source:
+        source.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = source.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _parse_range(range_header: str, size: int) -> Optional[tuple]:
+    """Разбор заголовка Range (поддерживается один диапазон байт)"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+    else:
+        # Суффиксный диапазон: последние N байт
+        start = max(size - int(match.group(2)), 0)
+        end = size - 1
+    return start, min(end, size - 1)
+
+
+@router.get("/")
+def download_snapshot(
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Сжатый снимок всех активных справочников (gzip NDJSON) для первичной загрузки ТСД"""
+    version, path = get_snapshot(db)
+    etag = f'"{version}"'
+    size = os.path.getsize(path)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    
+    if if_none_match and etag in [value.strip() for value in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    # Докачка: диапазон отдается, только если снимок не изменился
+    if range_header and (not if_range or if_range == etag):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None or byte_range[0] >= size or byte_range[0] > byte_range[1]:
+            raise HTTPException(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail="Некорректный диапазон",
+                headers={"Content-Range": f"bytes */{size}"}
+            )
+        start, end = byte_range
+        headers.update({
+            "Content-Range": f"bytes {start}-{end}/{size}",
+            "Content-Length": str(end - start + 1)
+        })
+        return StreamingResponse(
+            _read_range(path, start, end),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type="application/gzip",
+            headers=headers
+        )
+    
+    return FileResponse(
+        path,
+        media_type="application/gzip",
+        filename=os.path.basename(path),
+        headers=headers
+    )
@@ -1,27 +1,39 @@
+from datetime import datetime
+from decimal import Decimal
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import and_
-from app.database import get_db
-from app.models import Stock, Nomenclature, Warehouse, User
+from app.database import get_db, get_read_db, commit_with_response
+from app.pagination import paginate
+from app.models import Stock, StockMovement, StockSummaryRow, Nomenclature, Warehouse, User
 from app.schemas import (
     Stock as StockSchema,
     StockCreate,
     StockUpdate,
-    StockSummary
+    StockSummary,
+    StockWarehouseTotals,
+    StockCategoryTotals,
+    StockMovementHistory,
+    StockBalance
 )
 from app.oauth import get_current_user_from_token
+from app.stock_posting import adjust_stock, balances_as_of, rebuild_stock_balances
+from app.stock_summary import summary_query, warehouse_totals, category_totals, refresh_stock_summary
+from app.streaming import ndjson_response
 
 router = APIRouter(prefix="/stocks", tags=["stocks"])
 
 
 @router.get("/", response_model=List[StockSchema])
-async def get_stocks(
+def get_stocks(
+    response: Response,
     skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
     limit: int = Query(100, ge=1, le=1000, description="Максимальное количество записей"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (заголовок X-Next-Cursor)"),
     warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
     nomenclature_id: Optional[int] = Query(None, description="Фильтр по номенклатуре"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Получение списка остатков товаров"""
@@ -36,62 +48,137 @@ async def get_stocks(
     if nomenclature_id:
         query = query.filter(Stock.nomenclature_id == nomenclature_id)
     
-    stocks = query.offset(skip).limit(limit).all()
+    stocks = paginate(query, Stock.id, skip, limit, cursor, response)
     return stocks
 
 
+# Размер страницы сводки, если передан только cursor
+SUMMARY_PAGE_SIZE = 1000
+
+
 @router.get("/summary", response_model=List[StockSummary])
-async def get_stocks_summary(
+def get_stocks_summary(
+    response: Response,
+    skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Максимальное количество записей (без limit и cursor - вся сводка)"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (заголовок X-Next-Cursor)"),
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
+    nomenclature_id: Optional[int] = Query(None, description="Фильтр по номенклатуре"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Получение сводки по остаткам товаров.
+    
+    Постраничная выдача включается параметром limit или cursor; без них, как и
+    раньше, возвращается вся сводка (для больших складов - /summary/stream).
+    """
+    query = summary_query(db, warehouse_id, nomenclature_id)
+    if limit is None and cursor is None:
+        return query.order_by(StockSummaryRow.id).offset(skip).all()
+    return paginate(query, StockSummaryRow.id, skip, limit or SUMMARY_PAGE_SIZE, cursor, response)
+
+
+@router.get("/summary/stream")
+def stream_stocks_summary(
     warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
     nomenclature_id: Optional[int] = Query(None, description="Фильтр по номенклатуре"),
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
-    """Получение сводки по остаткам товаров"""
-    query = db.query(
-        Stock.nomenclature_id,
-        Nomenclature.code.label('nomenclature_code'),
-        Nomenclature.name.label('nomenclature_name'),
-        Stock.warehouse_id,
-        Warehouse.code.label('warehouse_code'),
-        Warehouse.name.label('warehouse_name'),
-        Stock.quantity,
-        Stock.reserved_quantity,
-        (Stock.quantity - Stock.reserved_quantity).label('available_quantity'),
-        Stock.last_updated
-    ).join(
-        Nomenclature, Stock.nomenclature_id == Nomenclature.id
-    ).join(
-        Warehouse, Stock.warehouse_id == Warehouse.id
+    """Полная сводка по остаткам потоком NDJSON"""
+    return ndjson_response(
+        lambda db: summary_query(db, warehouse_id, nomenclature_id).order_by(StockSummaryRow.id),
+        lambda row: StockSummary.model_validate(row)
+    )
+
+
+@router.get("/summary/warehouses", response_model=List[StockWarehouseTotals])
+def get_stocks_summary_by_warehouse(
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Итоги остатков по складам"""
+    return warehouse_totals(db, warehouse_id)
+
+
+@router.get("/summary/categories", response_model=List[StockCategoryTotals])
+def get_stocks_summary_by_category(
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Итоги остатков по категориям номенклатуры"""
+    return category_totals(db, warehouse_id)
+
+
+@router.get("/movements", response_model=List[StockMovementHistory])
+def get_stock_movements(
+    skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
+    limit: int = Query(100, ge=1, le=1000, description="Максимальное количество записей"),
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
+    nomenclature_id: Optional[int] = Query(None, description="Фильтр по номенклатуре"),
+    document_id: Optional[int] = Query(None, description="Фильтр по документу"),
+    inventory_id: Optional[int] = Query(None, description="Фильтр по инвентаризации"),
+    date_from: Optional[datetime] = Query(None, description="Начало периода"),
+    date_to: Optional[datetime] = Query(None, description="Конец периода"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """История движений товаров"""
+    query = db.query(StockMovement).options(
+        joinedload(StockMovement.nomenclature),
+        joinedload(StockMovement.warehouse)
     )
     
     if warehouse_id:
-        query = query.filter(Stock.warehouse_id == warehouse_id)
+        query = query.filter(StockMovement.warehouse_id == warehouse_id)
     
     if nomenclature_id:
-        query = query.filter(Stock.nomenclature_id == nomenclature_id)
+        query = query.filter(StockMovement.nomenclature_id == nomenclature_id)
     
-    results = query.all()
-    
-    return [
-        StockSummary(
-            nomenclature_id=row.nomenclature_id,
-            nomenclature_code=row.nomenclature_code,
-            nomenclature_name=row.nomenclature_name,
-            warehouse_id=row.warehouse_id,
-            warehouse_code=row.warehouse_code,
-            warehouse_name=row.warehouse_name,
-            quantity=row.quantity,
-            reserved_quantity=row.reserved_quantity,
-            available_quantity=row.available_quantity,
-            last_updated=row.last_updated
-        )
-        for row in results
-    ]
+    if document_id:
+        query = query.filter(StockMovement.document_id == document_id)
+    
+    if inventory_id:
+        query = query.filter(StockMovement.inventory_id == inventory_id)
+    
+    if date_from:
+        query = query.filter(StockMovement.date >= date_from)
+    
+    if date_to:
+        query = query.filter(StockMovement.date <= date_to)
+    
+    movements = query.order_by(StockMovement.date, StockMovement.id).offset(skip).limit(limit).all()
+    return movements
+
+
+@router.get("/balances", response_model=List[StockBalance])
+def get_stock_balances(
+    as_of: datetime = Query(..., description="Дата, на которую рассчитываются остатки"),
+    warehouse_id: Optional[int] = Query(None, description="Фильтр по складу"),
+    nomenclature_id: Optional[int] = Query(None, description="Фильтр по номенклатуре"),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Остатки товаров на дату по журналу движений"""
+    return balances_as_of(db, as_of, warehouse_id, nomenclature_id)
+
+
+@router.post("/rebuild")
+def rebuild_stocks(
+    warehouse_id: Optional[int] = Query(None, description="Пересчитать только указанный склад"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Пересчет остатков по журналу движений"""
+    updated = rebuild_stock_balances(db, warehouse_id)
+    db.commit()
+    
+    return {"message": "Остатки пересчитаны", "updated": updated}
 
 
 @router.get("/{stock_id}", response_model=StockSchema)
-async def get_stock(
+def get_stock(
     stock_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -111,7 +198,7 @@ async def get_stock(
 
 
 @router.get("/nomenclature/{nomenclature_id}/warehouse/{warehouse_id}", response_model=StockSchema)
-async def get_stock_by_nomenclature_and_warehouse(
+def get_stock_by_nomenclature_and_warehouse(
     nomenclature_id: int,
     warehouse_id: int,
     db: Session = Depends(get_db),
@@ -137,7 +224,7 @@ async def get_stock_by_nomenclature_and_warehouse(
 
 
 @router.post("/", response_model=StockSchema)
-async def create_stock(
+def create_stock(
     stock_data: StockCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -158,7 +245,10 @@ async def create_stock(
         )
     
     # Проверяем, существует ли номенклатура
-    nomenclature = db.query(Nomenclature).filter(Nomenclature.id == stock_data.nomenclature_id).first()
+    nomenclature = db.query(Nomenclature).options(
+        joinedload(Nomenclature.category),
+        joinedload(Nomenclature.base_unit)
+    ).filter(Nomenclature.id == stock_data.nomenclature_id).first()
     if not nomenclature:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -173,61 +263,59 @@ async def create_stock(
             detail="Склад не найден"
         )
     
-    # Создаем новый остаток
+    # Создаем остаток с нулевым количеством: количество вносится движением журнала
     stock = Stock(
         nomenclature_id=stock_data.nomenclature_id,
         warehouse_id=stock_data.warehouse_id,
-        quantity=stock_data.quantity,
+        quantity=0,
         reserved_quantity=stock_data.reserved_quantity
     )
     
     db.add(stock)
-    db.commit()
-    db.refresh(stock)
-    
-    # Загружаем связанные данные для ответа
-    stock = db.query(Stock).options(
-        joinedload(Stock.nomenclature),
-        joinedload(Stock.warehouse)
-    ).filter(Stock.id == stock.id).first()
-    
-    return stock
+    db.flush()
+    adjust_stock(db, stock.nomenclature_id, stock.warehouse_id, stock_data.quantity, current_user.id)
+    db.expire(stock, ["quantity", "last_updated"])
+    refresh_stock_summary(db, [(stock.nomenclature_id, stock.warehouse_id)])
+    # Номенклатура и склад уже в сессии: ответ собирается без повторной выборки
+    return commit_with_response(db, stock, StockSchema)
 
 
 @router.put("/{stock_id}", response_model=StockSchema)
-async def update_stock(
+def update_stock(
     stock_id: int,
     stock_data: StockUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
 ):
     """Обновление остатка"""
-    stock = db.query(Stock).filter(Stock.id == stock_id).first()
+    stock = db.query(Stock).options(
+        joinedload(Stock.nomenclature).joinedload(Nomenclature.category),
+        joinedload(Stock.nomenclature).joinedload(Nomenclature.base_unit),
+        joinedload(Stock.warehouse)
+    ).filter(Stock.id == stock_id).first()
     if not stock:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Остаток не найден"
         )
     
-    # Обновляем поля
+    # Обновляем поля; количество меняется только движением журнала
     update_data = stock_data.model_dump(exclude_unset=True)
+    quantity = update_data.pop("quantity", None)
     for field, value in update_data.items():
         setattr(stock, field, value)
     
-    db.commit()
-    db.refresh(stock)
-    
-    # Загружаем связанные данные для ответа
-    stock = db.query(Stock).options(
-        joinedload(Stock.nomenclature),
-        joinedload(Stock.warehouse)
-    ).filter(Stock.id == stock.id).first()
-    
-    return stock
+    db.flush()
+    if quantity is not None:
+        adjust_stock(db, stock.nomenclature_id, stock.warehouse_id, quantity, current_user.id)
+        db.expire(stock, ["quantity", "last_updated"])
+    refresh_stock_summary(db, [(stock.nomenclature_id, stock.warehouse_id)])
+    # Номенклатура и склад уже в сессии: ответ собирается без повторной выборки
+    return commit_with_response(db, stock, StockSchema)
 
 
 @router.delete("/{stock_id}")
-async def delete_stock(
+def delete_stock(
     stock_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -240,6 +328,8 @@ async def delete_stock(
             detail="Остаток не найден"
         )
     
+    # Остаток списывается движением, чтобы журнал оставался согласован с остатками
+    adjust_stock(db, stock.nomenclature_id, stock.warehouse_id, Decimal("0"), current_user.id)
     db.delete(stock)
     db.commit()
     
@@ -1,7 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, status, Response
+from sqlalchemy import update, delete, select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models_tsd import TsdDevice
+from app.database import get_db, commit_with_response
+from app.pagination import paginate
+from app.models_tsd import TsdDevice, TsdFreePrefix, tsd_prefix_seq
 from app.schemas_tsd import (
     TsdDeviceCreate, 
     TsdDeviceUpdate, 
@@ -13,43 +18,87 @@ from app.schemas_tsd import (
 )
 from app.oauth import get_current_user_from_token
 from app.models import User
-import string
-import random
 
 router = APIRouter(prefix="/tsd-devices", tags=["tsd-devices"])
 
-def generate_prefix() -> str:
-    """Генерирует уникальный префикс для ТСД"""
-    # Генерируем префикс вида "ТСД001", "ТСД002", etc.
-    letters = "АБВГДЕЖЗИКЛМНОПРСТУФХЦЧШЩЭЮЯ"
-    numbers = "0123456789"
+PREFIX_BASE = "ТСД"
+
+
+def format_prefix(number: int) -> str:
+    """Префикс ТСД по номеру: "ТСД001" ... "ТСД999", далее "ТСД1000" и т.д."""
+    return f"{PREFIX_BASE}{number:03d}"
+
+
+def parse_prefix(prefix: str) -> Optional[int]:
+    """Номер из префикса ТСД (None для префиксов другого вида)"""
+    if not prefix or not prefix.startswith(PREFIX_BASE):
+        return None
+    digits = prefix[len(PREFIX_BASE):]
+    return int(digits) if digits.isdigit() else None
+
+
+def _take_prefix_number(db: Session) -> Tuple[int, int]:
+    """Номер префикса и счетчик документов, с которого его продолжать.
+
+    Сначала берется освобожденный номер (счетчик продолжается с последнего
+    номера документа удаленного ТСД, чтобы номера документов не повторялись),
+    иначе следующий из последовательности со счетчиком 0.
+    """
+    # SKIP LOCKED: параллельные регистрации не ждут друг друга и не берут один номер
+    free_number = select(TsdFreePrefix.number).order_by(
+        TsdFreePrefix.number
+    ).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+    free = db.execute(
+        delete(TsdFreePrefix)
+        .where(TsdFreePrefix.number == free_number)
+        .returning(TsdFreePrefix.number, TsdFreePrefix.document_counter)
+    ).first()
+    if free is not None:
+        return tuple(free)
+    return db.execute(tsd_prefix_seq.next_value()).scalar(), 0
+
+
+def generate_prefix(db: Session) -> Tuple[str, int]:
+    """Генерирует уникальный префикс для ТСД за O(1). Возвращает префикс и начальный счетчик документов"""
+    while True:
+        number, document_counter = _take_prefix_number(db)
+        prefix = format_prefix(number)
+        # Префиксы, выданные до появления последовательности, пропускаются
+        taken = db.query(TsdDevice.id).filter(TsdDevice.prefix == prefix).first()
+        if not taken:
+            return prefix, document_counter
+
+
+def release_prefix(db: Session, prefix: str, document_counter: int) -> None:
+    """Возврат номера префикса удаленного ТСД в список свободных вместе с последним номером документа"""
+    number = parse_prefix(prefix)
+    if number is None:
+        return
+    db.execute(
+        pg_insert(TsdFreePrefix).values(number=number, document_counter=document_counter).on_conflict_do_nothing()
+    )
+
+def allocate_document_numbers(db: Session, device_id: str, count: int = 1) -> Optional[tuple]:
+    """Атомарное резервирование блока номеров документов для активного ТСД.
     
-    # Находим следующий доступный номер
-    db = next(get_db())
-    try:
-        existing_prefixes = db.query(TsdDevice.prefix).all()
-        used_numbers = set()
-        
-        for prefix_tuple in existing_prefixes:
-            prefix = prefix_tuple[0]
-            if prefix.startswith("ТСД") and len(prefix) == 6:
-                try:
-                    number = int(prefix[3:])
-                    used_numbers.add(number)
-                except ValueError:
-                    continue
-        
-        # Находим первый свободный номер
-        next_number = 1
-        while next_number in used_numbers:
-            next_number += 1
-        
-        return f"ТСД{next_number:03d}"
-    finally:
-        db.close()
+    Счетчик увеличивается одним UPDATE ... RETURNING, поэтому параллельные
+    запросы одного устройства никогда не получают пересекающиеся номера.
+    Возвращает (префикс, последний выданный номер) или None.
+    """
+    result = db.execute(
+        update(TsdDevice)
+        .where(TsdDevice.device_id == device_id, TsdDevice.is_active == True)
+        .values(
+            document_counter=TsdDevice.document_counter + count,
+            last_seen=func.now()
+        )
+        .returning(TsdDevice.prefix, TsdDevice.document_counter)
+        .execution_options(synchronize_session=False)
+    ).first()
+    return tuple(result) if result else None
 
 @router.post("/register", response_model=TsdDeviceRegisterResponse)
-async def register_device(
+def register_device(
     request: TsdDeviceRegisterRequest,
     current_user: User = Depends(get_current_user_from_token),
     db: Session = Depends(get_db)
@@ -71,7 +120,7 @@ async def register_device(
         )
     
     # Генерируем уникальный префикс
-    prefix = generate_prefix()
+    prefix, document_counter = generate_prefix(db)
     
     # Создаем новое устройство
     device = TsdDevice(
@@ -81,12 +130,27 @@ async def register_device(
         android_version=request.android_version,
         app_version=request.app_version,
         prefix=prefix,
+        document_counter=document_counter,
         is_active=True
     )
     
     db.add(device)
-    db.commit()
-    db.refresh(device)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Устройство одновременно зарегистрировано другим запросом
+        db.rollback()
+        # Номер из последовательности откатом не возвращается - возвращаем его в список
+        # свободных (номер из списка свободных откат уже восстановил, повтор игнорируется)
+        release_prefix(db, prefix, document_counter)
+        db.commit()
+        device = db.query(TsdDevice).filter(
+            TsdDevice.device_id == request.device_id
+        ).first()
+        if not device:
+            raise
+    else:
+        db.refresh(device)
     
     return TsdDeviceRegisterResponse(
         id=device.id,
@@ -96,7 +160,7 @@ async def register_device(
     )
 
 @router.get("/me", response_model=TsdDeviceSchema)
-async def get_my_device(
+def get_my_device(
     current_user: User = Depends(get_current_user_from_token),
     db: Session = Depends(get_db)
 ):
@@ -115,9 +179,11 @@ async def get_my_device(
     return device
 
 @router.get("/", response_model=list[TsdDeviceSchema])
-async def get_devices(
+def get_devices(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     active_only: bool = True,
     current_user: User = Depends(get_current_user_from_token),
     db: Session = Depends(get_db)
@@ -129,11 +195,11 @@ async def get_devices(
     if active_only:
         query = query.filter(TsdDevice.is_active == True)
     
-    devices = query.offset(skip).limit(limit).all()
+    devices = paginate(query, TsdDevice.id, skip, limit, cursor, response)
     return devices
 
 @router.put("/me", response_model=TsdDeviceSchema)
-async def update_my_device(
+def update_my_device(
     request: TsdDeviceRegisterRequest,
     current_user: User = Depends(get_current_user_from_token),
     db: Session = Depends(get_db)
@@ -156,23 +222,59 @@ async def update_my_device(
     device.android_version = request.android_version
     device.app_version = request.app_version
     
-    db.commit()
-    db.refresh(device)
-    
-    return device
+    return commit_with_response(db, device, TsdDeviceSchema)
 
 @router.post("/next-document-number", response_model=DocumentNumberResponse)
-async def get_next_document_number(
+def get_next_document_number(
     request: DocumentNumberRequest,
     current_user: User = Depends(get_current_user_from_token),
     db: Session = Depends(get_db)
 ):
-    """Получение следующего номера документа для ТСД устройства"""
+    """Получение следующего номера документа (или блока из count номеров) для ТСД устройства"""
     
-    # Находим устройство по device_id
-    device = db.query(TsdDevice).filter(
-        TsdDevice.device_id == request.device_id
-    ).first()
+    allocated = allocate_document_numbers(db, request.device_id, request.count)
+    
+    if not allocated:
+        # Номера не выданы: уточняем причину
+        device = db.query(TsdDevice).filter(
+            TsdDevice.device_id == request.device_id
+        ).first()
+        if not device:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="ТСД устройство не найдено"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ТСД устройство неактивно"
+        )
+    
+    db.commit()
+    
+    prefix, last_counter = allocated
+    first_counter = last_counter - request.count + 1
+    document_type = request.document_type.upper()
+    document_numbers = [
+        f"{prefix}-{document_type}-{counter:06d}"
+        for counter in range(first_counter, last_counter + 1)
+    ]
+    
+    return DocumentNumberResponse(
+        document_number=document_numbers[0],
+        next_counter=last_counter,
+        first_counter=first_counter,
+        document_numbers=document_numbers
+    )
+
+@router.delete("/{device_id}")
+def delete_device(
+    device_id: int,
+    current_user: User = Depends(get_current_user_from_token),
+    db: Session = Depends(get_db)
+):
+    """Удаление ТСД устройства с освобождением его префикса"""
+    
+    device = db.query(TsdDevice).filter(TsdDevice.id == device_id).with_for_update().first()
     
     if not device:
         raise HTTPException(
@@ -180,21 +282,17 @@ async def get_next_document_number(
             detail="ТСД устройство не найдено"
         )
     
-    if not device.is_active:
+    # Активное устройство продолжает получать номера документов: счетчик, сохраненный
+    # вместе с префиксом, устарел бы. Деактивированное номеров не получает
+    if device.is_active:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="ТСД устройство неактивно"
+            detail="Нельзя удалить активное ТСД устройство, сначала деактивируйте его"
         )
     
-    # Увеличиваем счетчик документов
-    device.document_counter += 1
+    prefix, document_counter = device.prefix, device.document_counter
+    db.delete(device)
+    release_prefix(db, prefix, document_counter)
     db.commit()
     
-    # Формируем номер документа
-    document_number = f"{device.prefix}-{request.document_type.upper()}-{device.document_counter:06d}"
-    
-    return DocumentNumberResponse(
-        document_number=document_number,
-        next_counter=device.document_counter
-    )
-
+    return {"message": "ТСД устройство удалено"}
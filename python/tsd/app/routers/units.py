@@ -1,23 +1,29 @@
+from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, commit_with_response
+from app.pagination import paginate
 from app.models import UnitOfMeasure
 from app.schemas import (
     UnitOfMeasure as UnitOfMeasureSchema,
     UnitOfMeasureCreate,
-    UnitOfMeasureUpdate
+    UnitOfMeasureUpdate,
+    SyncResponse
 )
 from app.oauth import get_current_user_from_token
+from app.sync import new_sync_token, filter_changed, get_deleted_ids
 from app.models import User
 
 router = APIRouter(prefix="/units", tags=["units-of-measure"])
 
 
 @router.get("/", response_model=List[UnitOfMeasureSchema])
-async def get_units_of_measure(
+def get_units_of_measure(
+    response: Response,
     skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
     limit: int = Query(100, ge=1, le=1000, description="Максимальное количество записей"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (заголовок X-Next-Cursor)"),
     active_only: bool = Query(True, description="Показывать только активные единицы измерения"),
     search: Optional[str] = Query(None, description="Поиск по названию или коду"),
     db: Session = Depends(get_db),
@@ -37,12 +43,28 @@ async def get_units_of_measure(
             (UnitOfMeasure.short_name.ilike(search_filter))
         )
     
-    units = query.offset(skip).limit(limit).all()
+    units = paginate(query, UnitOfMeasure.id, skip, limit, cursor, response)
     return units
 
 
+@router.get("/sync", response_model=SyncResponse[UnitOfMeasureSchema])
+def sync_units_of_measure(
+    changed_since: Optional[datetime] = Query(None, description="Токен предыдущей синхронизации (sync_token)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Дельта-синхронизация единиц измерения (включая деактивированные)"""
+    sync_token = new_sync_token(db)
+    query = db.query(UnitOfMeasure)
+    
+    units = filter_changed(query, UnitOfMeasure, changed_since).all()
+    deleted_ids = get_deleted_ids(db, "units_of_measure", changed_since)
+    
+    return {"items": units, "deleted_ids": deleted_ids, "sync_token": sync_token}
+
+
 @router.get("/{unit_id}", response_model=UnitOfMeasureSchema)
-async def get_unit_of_measure(
+def get_unit_of_measure(
     unit_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -58,7 +80,7 @@ async def get_unit_of_measure(
 
 
 @router.get("/code/{code}", response_model=UnitOfMeasureSchema)
-async def get_unit_by_code(
+def get_unit_by_code(
     code: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -74,7 +96,7 @@ async def get_unit_by_code(
 
 
 @router.post("/", response_model=UnitOfMeasureSchema)
-async def create_unit_of_measure(
+def create_unit_of_measure(
     unit_data: UnitOfMeasureCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -98,14 +120,11 @@ async def create_unit_of_measure(
     )
     
     db.add(unit)
-    db.commit()
-    db.refresh(unit)
-    
-    return unit
+    return commit_with_response(db, unit, UnitOfMeasureSchema)
 
 
 @router.put("/{unit_id}", response_model=UnitOfMeasureSchema)
-async def update_unit_of_measure(
+def update_unit_of_measure(
     unit_id: int,
     unit_data: UnitOfMeasureUpdate,
     db: Session = Depends(get_db),
@@ -136,14 +155,11 @@ async def update_unit_of_measure(
     for field, value in update_data.items():
         setattr(unit, field, value)
     
-    db.commit()
-    db.refresh(unit)
-    
-    return unit
+    return commit_with_response(db, unit, UnitOfMeasureSchema)
 
 
 @router.delete("/{unit_id}")
-async def delete_unit_of_measure(
+def delete_unit_of_measure(
     unit_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -164,7 +180,7 @@ async def delete_unit_of_measure(
 
 
 @router.patch("/{unit_id}/activate")
-async def activate_unit_of_measure(
+def activate_unit_of_measure(
     unit_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
@@ -1,20 +1,25 @@
+from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, commit_with_response
+from app.pagination import paginate
+from app.stock_summary import refresh_stock_summary_for
 from app.models import Warehouse
 from app.schemas import (
     WarehouseCreate,
     Warehouse as WarehouseSchema,
-    WarehouseUpdate
+    WarehouseUpdate,
+    SyncResponse
 )
 from app.oauth import get_current_user_from_token # Защита эндпоинтов
+from app.sync import new_sync_token, filter_changed, get_deleted_ids
 
 router = APIRouter(prefix="/warehouses", tags=["warehouses"])
 
 
 @router.post("/", response_model=WarehouseSchema, status_code=status.HTTP_201_CREATED)
-async def create_warehouse(
+def create_warehouse(
     warehouse: WarehouseCreate,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user_from_token) # Защита эндпоинта
@@ -26,15 +31,15 @@ async def create_warehouse(
     
     db_warehouse = Warehouse(**warehouse.model_dump())
     db.add(db_warehouse)
-    db.commit()
-    db.refresh(db_warehouse)
-    return db_warehouse
+    return commit_with_response(db, db_warehouse, WarehouseSchema)
 
 
 @router.get("/", response_model=List[WarehouseSchema])
-async def read_warehouses(
+def read_warehouses(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=0, le=1000),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (заголовок X-Next-Cursor)"),
     active_only: bool = Query(True, description="Показывать только активные склады"),
     search: Optional[str] = Query(None, description="Поиск по коду, названию или адресу"),
     db: Session = Depends(get_db),
@@ -50,12 +55,28 @@ async def read_warehouses(
             (Warehouse.name.ilike(f"%{search}%")) |
             (Warehouse.address.ilike(f"%{search}%"))
         )
-    warehouses = query.offset(skip).limit(limit).all()
+    warehouses = paginate(query, Warehouse.id, skip, limit, cursor, response)
     return warehouses
 
 
+@router.get("/sync", response_model=SyncResponse[WarehouseSchema])
+def sync_warehouses(
+    changed_since: Optional[datetime] = Query(None, description="Токен предыдущей синхронизации (sync_token)"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user_from_token) # Защита эндпоинта
+):
+    """Дельта-синхронизация складов (включая деактивированные)"""
+    sync_token = new_sync_token(db)
+    query = db.query(Warehouse)
+    
+    warehouses = filter_changed(query, Warehouse, changed_since).all()
+    deleted_ids = get_deleted_ids(db, "warehouses", changed_since)
+    
+    return {"items": warehouses, "deleted_ids": deleted_ids, "sync_token": sync_token}
+
+
 @router.get("/{warehouse_id}", response_model=WarehouseSchema)
-async def read_warehouse(
+def read_warehouse(
     warehouse_id: int,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user_from_token) # Защита эндпоинта
@@ -68,7 +89,7 @@ async def read_warehouse(
 
 
 @router.get("/code/{warehouse_code}", response_model=WarehouseSchema)
-async def read_warehouse_by_code(
+def read_warehouse_by_code(
     warehouse_code: str,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user_from_token) # Защита эндпоинта
@@ -81,7 +102,7 @@ async def read_warehouse_by_code(
 
 
 @router.put("/{warehouse_id}", response_model=WarehouseSchema)
-async def update_warehouse(
+def update_warehouse(
     warehouse_id: int,
     warehouse: WarehouseUpdate,
     db: Session = Depends(get_db),
@@ -97,13 +118,17 @@ async def update_warehouse(
         setattr(db_warehouse, key, value)
     
     db.add(db_warehouse)
-    db.commit()
-    db.refresh(db_warehouse)
-    return db_warehouse
+    
+    # Код и название склада хранятся в сводке остатков
+    if {"code", "name"} & update_data.keys():
+        db.flush()
+        refresh_stock_summary_for(db, warehouse_id=db_warehouse.id)
+    
+    return commit_with_response(db, db_warehouse, WarehouseSchema)
 
 
 @router.delete("/{warehouse_id}", response_model=WarehouseSchema)
-async def deactivate_warehouse(
+def deactivate_warehouse(
     warehouse_id: int,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user_from_token) # Защита эндпоинта
@@ -115,13 +140,11 @@ async def deactivate_warehouse(
     
     db_warehouse.is_active = False
     db.add(db_warehouse)
-    db.commit()
-    db.refresh(db_warehouse)
-    return db_warehouse
+    return commit_with_response(db, db_warehouse, WarehouseSchema)
 
 
 @router.patch("/{warehouse_id}/activate", response_model=WarehouseSchema)
-async def activate_warehouse(
+def activate_warehouse(
     warehouse_id: int,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user_from_token) # Защита эндпоинта
@@ -133,6 +156,4 @@ async def activate_warehouse(
     
     db_warehouse.is_active = True
     db.add(db_warehouse)
-    db.commit()
-    db.refresh(db_warehouse)
-    return db_warehouse
+    return commit_with_response(db, db_warehouse, WarehouseSchema)
@@ -1,6 +1,6 @@
 import json
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Generic, TypeVar
 from datetime import datetime
 from decimal import Decimal
 from app.models import DocumentType, DocumentStatus, MovementType, InventoryStatus
@@ -245,6 +245,7 @@ class DocumentBase(BaseModel):
     document_type: DocumentType
     document_number: str
     warehouse_id: int
+    target_warehouse_id: Optional[int] = None
     date: datetime
     status: DocumentStatus = DocumentStatus.DRAFT
     description: Optional[str] = None
@@ -258,6 +259,7 @@ class DocumentUpdate(BaseModel):
     document_type: Optional[DocumentType] = None
     document_number: Optional[str] = None
     warehouse_id: Optional[int] = None
+    target_warehouse_id: Optional[int] = None
     date: Optional[datetime] = None
     status: Optional[DocumentStatus] = None
     description: Optional[str] = None
@@ -367,6 +369,46 @@ class InventoryItemUpdate(BaseModel):
     unit_id: Optional[int] = None
 
 
+class InventoryCountEvent(BaseModel):
+    """Событие пересчета: штрих-код или номенклатура и приращение количества"""
+    barcode: Optional[str] = None
+    nomenclature_id: Optional[int] = None
+    quantity: Decimal = Decimal("1")  # Приращение (отрицательное - исправление)
+
+
+class InventoryCountBatch(BaseModel):
+    events: List[InventoryCountEvent] = Field(..., min_length=1, max_length=10000)
+
+
+class InventoryCountResult(BaseModel):
+    accepted: int  # Принято событий
+    applied: int = 0  # Обновлено строк инвентаризации
+    not_found: List[str] = []  # Нераспознанные штрих-коды и номенклатура
+
+
+class InventoryCountContribution(BaseModel):
+    """Вклад одного счетчика в факт строки инвентаризации"""
+    user_id: int
+    device_id: str = ""
+    quantity: Decimal
+    updated_at: datetime
+    user: Optional[User] = None
+
+    class Config:
+        from_attributes = True
+
+
+class InventoryCountLogEntry(BaseModel):
+    id: int
+    user_id: int
+    device_id: str = ""
+    quantity: Decimal
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 class InventoryItem(InventoryItemBase):
     id: int
     inventory_id: int
@@ -412,11 +454,56 @@ class StockMovement(StockMovementBase):
         from_attributes = True
 
 
+class StockMovementHistory(StockMovementBase):
+    id: int
+    user_id: int
+    created_at: datetime
+    nomenclature: Optional[Nomenclature] = None
+    warehouse: Optional[Warehouse] = None
+
+    class Config:
+        from_attributes = True
+
+
+class StockBalance(BaseModel):
+    nomenclature_id: int
+    warehouse_id: int
+    quantity: Decimal
+
+    class Config:
+        from_attributes = True
+
+
 # Дополнительные схемы для API
 class DocumentWithItems(Document):
     items: List[DocumentItem] = []
 
 
+class DocumentBulkCreate(DocumentBase):
+    """Документ вместе со всеми строками одним запросом"""
+    items: List[DocumentItemCreate] = Field(..., min_length=1, max_length=10000)
+    post: bool = False  # Провести документ сразу после создания
+
+
+class DocumentUploadCreate(DocumentBase):
+    """Начало загрузки большого документа частями"""
+    total_chunks: int = Field(..., ge=1, le=10000)
+    post: bool = False  # Провести документ после получения всех частей
+
+
+class DocumentUploadChunk(BaseModel):
+    items: List[DocumentItemCreate] = Field(..., min_length=1, max_length=5000)
+
+
+class DocumentUploadStatus(BaseModel):
+    upload_id: int
+    document_id: int
+    total_chunks: int
+    received_chunks: List[int] = []
+    next_chunk: Optional[int] = None  # Первая неполученная часть (для возобновления)
+    completed: bool = False
+
+
 class InventoryWithItems(Inventory):
     items: List[InventoryItem] = []
 
@@ -432,6 +519,33 @@ class StockSummary(BaseModel):
     reserved_quantity: Decimal
     available_quantity: Decimal
     last_updated: datetime
+    category_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class StockWarehouseTotals(BaseModel):
+    warehouse_id: int
+    warehouse_code: str
+    warehouse_name: str
+    positions: int
+    quantity: Decimal
+    reserved_quantity: Decimal
+    available_quantity: Decimal
+
+    class Config:
+        from_attributes = True
+
+
+class StockCategoryTotals(BaseModel):
+    category_id: int
+    category_code: str
+    category_name: str
+    positions: int
+    quantity: Decimal
+    reserved_quantity: Decimal
+    available_quantity: Decimal
 
     class Config:
         from_attributes = True
@@ -470,6 +584,25 @@ class Barcode(BarcodeBase):
         from_attributes = True
 
 
+class BarcodeScanBatchRequest(BaseModel):
+    barcodes: List[str] = Field(..., min_length=1, max_length=1000)
+
+
+class BarcodeScanBatchResponse(BaseModel):
+    found: Dict[str, Barcode] = {}
+    not_found: List[str] = []
+
+
+# Дельта-синхронизация справочников
+SyncItem = TypeVar("SyncItem")
+
+
+class SyncResponse(BaseModel, Generic[SyncItem]):
+    items: List[SyncItem] = []
+    deleted_ids: List[int] = []
+    sync_token: datetime  # Передается в changed_since при следующей синхронизации
+
+
 # Обновляем ссылки на модели
 Document.model_rebuild()
 DocumentItem.model_rebuild()
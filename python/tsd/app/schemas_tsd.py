@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Optional, List
 from datetime import datetime
 
 class TsdDeviceBase(BaseModel):
@@ -43,8 +43,11 @@ class TsdDeviceRegisterResponse(BaseModel):
 class DocumentNumberRequest(BaseModel):
     device_id: str
     document_type: str = "input_balance"  # Тип документа (ввод остатков)
+    count: int = Field(1, ge=1, le=10000)  # Количество резервируемых номеров (блок для работы офлайн)
 
 class DocumentNumberResponse(BaseModel):
-    document_number: str
-    next_counter: int
+    document_number: str  # Первый номер блока
+    next_counter: int  # Последний выданный номер счетчика
+    first_counter: int
+    document_numbers: List[str] = []
 
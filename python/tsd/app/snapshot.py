@@ -0,0 +1,101 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Tuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import UnitOfMeasure, NomenclatureCategory, Nomenclature, Warehouse, Barcode, SyncTombstone
+from app.sync import changed_at, new_sync_token
+
+# Справочники в снимке: тип строки NDJSON -> модель
+SNAPSHOT_ENTITIES = [
+    ("unit", UnitOfMeasure),
+    ("category", NomenclatureCategory),
+    ("nomenclature", Nomenclature),
+    ("warehouse", Warehouse),
+    ("barcode", Barcode),
+]
+
+_build_lock = threading.Lock()
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Unsupported type: {type(value)}")
+
+
+def _row_to_dict(obj) -> dict:
+    return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+
+def get_data_version(db: Session) -> str:
+    """Версия справочных данных: меняется при любом изменении, деактивации или удалении"""
+    parts = []
+    for _, model in SNAPSHOT_ENTITIES:
+        parts.append(select(func.count(model.id), func.max(changed_at(model))))
+    parts.append(select(func.count(SyncTombstone.id), func.max(SyncTombstone.id)))
+
+    values = [tuple(db.execute(part).one()) for part in parts]
+    return hashlib.sha1(repr(values).encode()).hexdigest()[:16]
+
+
+def snapshot_path(version: str) -> str:
+    return os.path.join(settings.snapshot_dir, f"snapshot-{version}.ndjson.gz")
+
+
+def build_snapshot(db: Session, version: str) -> str:
+    """Формирование сжатого NDJSON со всеми активными справочниками"""
+    os.makedirs(settings.snapshot_dir, exist_ok=True)
+    path = snapshot_path(version)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    # Токен берется до выборки: изменения во время сборки придут дельта-синхронизацией
+    meta = {"version": version, "sync_token": new_sync_token(db)}
+
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as output:
+        output.write(json.dumps({"type": "meta", "data": meta}, default=_json_default) + "\n")
+        for entity, model in SNAPSHOT_ENTITIES:
+            query = db.query(model).filter(model.is_active == True).order_by(model.id).yield_per(1000)
+            for obj in query:
+                line = {"type": entity, "data": _row_to_dict(obj)}
+                output.write(json.dumps(line, ensure_ascii=False, default=_json_default) + "\n")
+
+    os.replace(tmp_path, path)
+    return path
+
+
+def _remove_old_snapshots() -> None:
+    """Удаление устаревших снимков (несколько последних сохраняются для начатых загрузок)"""
+    paths = [
+        os.path.join(settings.snapshot_dir, name)
+        for name in os.listdir(settings.snapshot_dir)
+        if name.startswith("snapshot-") and name.endswith(".ndjson.gz")
+    ]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[settings.snapshot_keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def get_snapshot(db: Session) -> Tuple[str, str]:
+    """Снимок для текущей версии данных: собирается один раз и хранится на диске"""
+    version = get_data_version(db)
+    path = snapshot_path(version)
+    if os.path.exists(path):
+        return version, path
+
+    with _build_lock:
+        if not os.path.exists(path):
+            build_snapshot(db, version)
+            _remove_old_snapshots()
+    return version, path
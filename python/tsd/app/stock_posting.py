@@ -0,0 +1,315 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models import (
+    Document, DocumentItem, DocumentType, Inventory, InventoryItem, MovementType, Stock, StockMovement
+)
+from app.stock_summary import refresh_stock_summary, refresh_stock_summary_for
+
+# Количество строк в одном INSERT ... ON CONFLICT
+UPSERT_CHUNK_SIZE = 1000
+
+
+def _document_lines(document: Document):
+    """Количество по номенклатуре в строках документа"""
+    return select(
+        DocumentItem.nomenclature_id,
+        func.sum(DocumentItem.quantity).label("quantity")
+    ).where(
+        DocumentItem.document_id == document.id
+    ).group_by(
+        DocumentItem.nomenclature_id
+    )
+
+
+def _lock_stocks(db: Session, warehouse_id: int, nomenclature_ids: List[int]) -> Dict[int, Decimal]:
+    """Текущие остатки склада с блокировкой строк (FOR UPDATE в порядке номенклатуры).
+
+    Отсутствующие строки сначала создаются с нулевым количеством, иначе
+    параллельные проведения не нашли бы что блокировать и посчитали бы
+    разницу от одного и того же нуля.
+    """
+    if not nomenclature_ids:
+        return {}
+    nomenclature_ids = sorted(set(nomenclature_ids))
+    for start in range(0, len(nomenclature_ids), UPSERT_CHUNK_SIZE):
+        db.execute(
+            pg_insert(Stock).values([
+                {"nomenclature_id": nomenclature_id, "warehouse_id": warehouse_id, "quantity": 0, "reserved_quantity": 0}
+                for nomenclature_id in nomenclature_ids[start:start + UPSERT_CHUNK_SIZE]
+            ]).on_conflict_do_nothing(constraint="uq_stocks_nomenclature_warehouse")
+        )
+    return dict(db.execute(
+        select(Stock.nomenclature_id, Stock.quantity).where(
+            Stock.warehouse_id == warehouse_id,
+            Stock.nomenclature_id.in_(nomenclature_ids)
+        ).order_by(Stock.nomenclature_id).with_for_update()
+    ).all())
+
+
+def _movement_rows(db: Session, document: Document, user_id: int) -> List[dict]:
+    """Формирование движений по документу.
+
+    Количество в движении хранится со знаком: приход положительный,
+    расход отрицательный, поэтому остаток равен сумме движений.
+    """
+    def row(nomenclature_id, warehouse_id, movement_type, quantity):
+        return {
+            "nomenclature_id": nomenclature_id,
+            "warehouse_id": warehouse_id,
+            "movement_type": movement_type,
+            "quantity": quantity,
+            "document_id": document.id,
+            "date": document.date,
+            "user_id": user_id,
+            "description": f"Документ {document.document_number}"
+        }
+
+    if document.document_type in (DocumentType.STOCK_INPUT, DocumentType.INVENTORY):
+        # Ввод остатков и инвентаризация устанавливают количество: движение равно разнице
+        lines = db.execute(_document_lines(document)).all()
+        current = _lock_stocks(db, document.warehouse_id, [nomenclature_id for nomenclature_id, _ in lines])
+        return [
+            row(nomenclature_id, document.warehouse_id, MovementType.INVENTORY, quantity - current[nomenclature_id])
+            for nomenclature_id, quantity in lines
+            if quantity != current[nomenclature_id]
+        ]
+
+    lines = db.execute(_document_lines(document)).all()
+
+    if document.document_type == DocumentType.RECEIPT:
+        return [
+            row(nomenclature_id, document.warehouse_id, MovementType.RECEIPT, quantity)
+            for nomenclature_id, quantity in lines
+        ]
+
+    if document.document_type == DocumentType.EXPENSE:
+        return [
+            row(nomenclature_id, document.warehouse_id, MovementType.EXPENSE, -quantity)
+            for nomenclature_id, quantity in lines
+        ]
+
+    if document.document_type == DocumentType.TRANSFER:
+        rows = []
+        for nomenclature_id, quantity in lines:
+            rows.append(row(nomenclature_id, document.warehouse_id, MovementType.TRANSFER_OUT, -quantity))
+            rows.append(row(nomenclature_id, document.target_warehouse_id, MovementType.TRANSFER_IN, quantity))
+        return rows
+
+    return []
+
+
+def apply_stock_deltas(db: Session, deltas: Dict[Tuple[int, int], Decimal]) -> None:
+    """Инкрементное изменение остатков: пакетный INSERT ... ON CONFLICT DO UPDATE"""
+    items = [
+        {
+            "nomenclature_id": nomenclature_id,
+            "warehouse_id": warehouse_id,
+            "quantity": quantity,
+            "reserved_quantity": 0
+        }
+        for (nomenclature_id, warehouse_id), quantity in deltas.items()
+        if quantity != 0
+    ]
+    for start in range(0, len(items), UPSERT_CHUNK_SIZE):
+        stmt = pg_insert(Stock).values(items[start:start + UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_stocks_nomenclature_warehouse",
+            set_={
+                "quantity": Stock.quantity + stmt.excluded.quantity,
+                "last_updated": func.now()
+            }
+        )
+        db.execute(stmt)
+
+    # Сводка остатков обновляется только по затронутым парам
+    refresh_stock_summary(
+        db, [(item["nomenclature_id"], item["warehouse_id"]) for item in items]
+    )
+
+
+def append_movements(db: Session, rows: List[dict]) -> int:
+    """Запись движений в журнал и применение их к остаткам"""
+    if not rows:
+        return 0
+
+    db.execute(insert(StockMovement), rows)
+
+    deltas: Dict[Tuple[int, int], Decimal] = {}
+    for item in rows:
+        key = (item["nomenclature_id"], item["warehouse_id"])
+        deltas[key] = deltas.get(key, Decimal("0")) + Decimal(item["quantity"])
+    apply_stock_deltas(db, deltas)
+
+    return len(rows)
+
+
+# Описание движений ручной корректировки остатка
+MANUAL_ADJUSTMENT_DESCRIPTION = "Ручная корректировка остатка"
+
+
+def adjust_stock(
+    db: Session,
+    nomenclature_id: int,
+    warehouse_id: int,
+    quantity: Decimal,
+    user_id: int
+) -> Decimal:
+    """Установка остатка вручную: движение на разницу с текущим количеством.
+
+    Строка остатка блокируется, чтобы параллельные корректировки не
+    посчитали разницу от одного и того же значения.
+    """
+    current = db.execute(
+        select(Stock.quantity).where(
+            Stock.nomenclature_id == nomenclature_id,
+            Stock.warehouse_id == warehouse_id
+        ).with_for_update()
+    ).scalar() or Decimal("0")
+    delta = Decimal(quantity) - current
+    if delta != 0:
+        append_movements(db, [{
+            "nomenclature_id": nomenclature_id,
+            "warehouse_id": warehouse_id,
+            "movement_type": MovementType.INVENTORY,
+            "quantity": delta,
+            "date": datetime.now(timezone.utc),
+            "user_id": user_id,
+            "description": MANUAL_ADJUSTMENT_DESCRIPTION
+        }])
+    return delta
+
+
+def post_document_movements(db: Session, document: Document, user_id: int) -> int:
+    """Проведение документа: движения по всем строкам и изменение остатков"""
+    return append_movements(db, _movement_rows(db, document, user_id))
+
+
+def post_inventory_movements(db: Session, inventory: Inventory, user_id: int, date: datetime) -> int:
+    """Применение результатов инвентаризации.
+
+    Разницы (факт - план) по всем строкам считаются и записываются в журнал
+    одним INSERT ... SELECT, затем остатки меняются одним пакетным upsert.
+    """
+    differences = select(
+        InventoryItem.nomenclature_id,
+        literal(inventory.warehouse_id),
+        literal(MovementType.INVENTORY, StockMovement.movement_type.type),
+        func.sum(InventoryItem.actual_quantity - InventoryItem.planned_quantity),
+        literal(inventory.id),
+        literal(date, StockMovement.date.type),
+        literal(user_id),
+        literal(f"Инвентаризация {inventory.inventory_number}")
+    ).where(
+        InventoryItem.inventory_id == inventory.id
+    ).group_by(
+        InventoryItem.nomenclature_id
+    ).having(
+        func.sum(InventoryItem.actual_quantity - InventoryItem.planned_quantity) != 0
+    )
+
+    stmt = insert(StockMovement).from_select(
+        ["nomenclature_id", "warehouse_id", "movement_type", "quantity",
+         "inventory_id", "date", "user_id", "description"],
+        differences
+    ).returning(StockMovement.nomenclature_id, StockMovement.quantity)
+
+    deltas = {
+        (nomenclature_id, inventory.warehouse_id): quantity
+        for nomenclature_id, quantity in db.execute(stmt)
+    }
+    apply_stock_deltas(db, deltas)
+    return len(deltas)
+
+
+def reverse_movements(
+    db: Session,
+    user_id: int,
+    description: str,
+    document_id: Optional[int] = None,
+    inventory_id: Optional[int] = None
+) -> int:
+    """Сторно: обратные движения к уже записанным по документу или инвентаризации"""
+    query = select(
+        StockMovement.nomenclature_id,
+        StockMovement.warehouse_id,
+        StockMovement.movement_type,
+        func.sum(StockMovement.quantity)
+    )
+    if document_id is not None:
+        query = query.where(StockMovement.document_id == document_id)
+    if inventory_id is not None:
+        query = query.where(StockMovement.inventory_id == inventory_id)
+    query = query.group_by(
+        StockMovement.nomenclature_id,
+        StockMovement.warehouse_id,
+        StockMovement.movement_type
+    ).having(func.sum(StockMovement.quantity) != 0)
+
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "nomenclature_id": nomenclature_id,
+            "warehouse_id": warehouse_id,
+            "movement_type": movement_type,
+            "quantity": -quantity,
+            "document_id": document_id,
+            "inventory_id": inventory_id,
+            "date": now,
+            "user_id": user_id,
+            "description": description
+        }
+        for nomenclature_id, warehouse_id, movement_type, quantity in db.execute(query)
+    ]
+    return append_movements(db, rows)
+
+
+def rebuild_stock_balances(db: Session, warehouse_id: Optional[int] = None) -> int:
+    """Пересчет остатков из журнала движений одним запросом"""
+    totals = select(
+        StockMovement.nomenclature_id,
+        StockMovement.warehouse_id,
+        func.sum(StockMovement.quantity),
+        literal(0)
+    )
+    if warehouse_id is not None:
+        totals = totals.where(StockMovement.warehouse_id == warehouse_id)
+    totals = totals.group_by(StockMovement.nomenclature_id, StockMovement.warehouse_id)
+
+    stmt = pg_insert(Stock).from_select(
+        ["nomenclature_id", "warehouse_id", "quantity", "reserved_quantity"],
+        totals
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_stocks_nomenclature_warehouse",
+        set_={
+            "quantity": stmt.excluded.quantity,
+            "last_updated": func.now()
+        }
+    )
+    updated = db.execute(stmt).rowcount
+    refresh_stock_summary_for(db, warehouse_id=warehouse_id)
+    return updated
+
+
+def balances_as_of(
+    db: Session,
+    as_of: datetime,
+    warehouse_id: Optional[int] = None,
+    nomenclature_id: Optional[int] = None
+):
+    """Остатки на дату по журналу движений"""
+    query = select(
+        StockMovement.nomenclature_id,
+        StockMovement.warehouse_id,
+        func.sum(StockMovement.quantity).label("quantity")
+    ).where(StockMovement.date <= as_of)
+    if warehouse_id is not None:
+        query = query.where(StockMovement.warehouse_id == warehouse_id)
+    if nomenclature_id is not None:
+        query = query.where(StockMovement.nomenclature_id == nomenclature_id)
+    query = query.group_by(StockMovement.nomenclature_id, StockMovement.warehouse_id)
+    return db.execute(query).all()
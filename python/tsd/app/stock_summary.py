@@ -0,0 +1,125 @@
+from typing import Iterable, Optional, Tuple
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models import Nomenclature, NomenclatureCategory, Stock, StockSummaryRow, Warehouse
+
+# Количество пар (номенклатура, склад) в одном обновлении
+REFRESH_CHUNK_SIZE = 1000
+
+SUMMARY_COLUMNS = [
+    "id", "nomenclature_id", "nomenclature_code", "nomenclature_name", "category_id",
+    "warehouse_id", "warehouse_code", "warehouse_name",
+    "quantity", "reserved_quantity", "available_quantity", "last_updated"
+]
+
+
+def _summary_source():
+    """Строки сводки, рассчитанные из stocks, nomenclature и warehouses"""
+    return select(
+        Stock.id,
+        Stock.nomenclature_id,
+        Nomenclature.code,
+        Nomenclature.name,
+        Nomenclature.category_id,
+        Stock.warehouse_id,
+        Warehouse.code,
+        Warehouse.name,
+        Stock.quantity,
+        Stock.reserved_quantity,
+        Stock.quantity - Stock.reserved_quantity,
+        Stock.last_updated
+    ).join(
+        Nomenclature, Stock.nomenclature_id == Nomenclature.id
+    ).join(
+        Warehouse, Stock.warehouse_id == Warehouse.id
+    )
+
+
+def _upsert(db: Session, source) -> int:
+    stmt = pg_insert(StockSummaryRow).from_select(SUMMARY_COLUMNS, source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StockSummaryRow.id],
+        set_={column: stmt.excluded[column] for column in SUMMARY_COLUMNS if column != "id"}
+    )
+    return db.execute(stmt).rowcount
+
+
+def refresh_stock_summary(db: Session, keys: Iterable[Tuple[int, int]]) -> int:
+    """Инкрементное обновление сводки для пар (номенклатура, склад)"""
+    keys = list(keys)
+    updated = 0
+    for start in range(0, len(keys), REFRESH_CHUNK_SIZE):
+        chunk = keys[start:start + REFRESH_CHUNK_SIZE]
+        updated += _upsert(
+            db,
+            _summary_source().where(tuple_(Stock.nomenclature_id, Stock.warehouse_id).in_(chunk))
+        )
+    return updated
+
+
+def refresh_stock_summary_for(
+    db: Session,
+    nomenclature_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None
+) -> int:
+    """Обновление сводки по номенклатуре и/или складу (или полностью, без фильтров)"""
+    source = _summary_source()
+    if nomenclature_id is not None:
+        source = source.where(Stock.nomenclature_id == nomenclature_id)
+    if warehouse_id is not None:
+        source = source.where(Stock.warehouse_id == warehouse_id)
+    return _upsert(db, source)
+
+
+def summary_query(db: Session, warehouse_id: Optional[int] = None, nomenclature_id: Optional[int] = None):
+    query = db.query(StockSummaryRow)
+    if warehouse_id:
+        query = query.filter(StockSummaryRow.warehouse_id == warehouse_id)
+    if nomenclature_id:
+        query = query.filter(StockSummaryRow.nomenclature_id == nomenclature_id)
+    return query
+
+
+def warehouse_totals(db: Session, warehouse_id: Optional[int] = None):
+    """Итоги сводки по складам"""
+    query = select(
+        StockSummaryRow.warehouse_id,
+        func.min(StockSummaryRow.warehouse_code).label("warehouse_code"),
+        func.min(StockSummaryRow.warehouse_name).label("warehouse_name"),
+        func.count().label("positions"),
+        func.sum(StockSummaryRow.quantity).label("quantity"),
+        func.sum(StockSummaryRow.reserved_quantity).label("reserved_quantity"),
+        func.sum(StockSummaryRow.available_quantity).label("available_quantity")
+    )
+    if warehouse_id:
+        query = query.where(StockSummaryRow.warehouse_id == warehouse_id)
+    query = query.group_by(StockSummaryRow.warehouse_id).order_by(StockSummaryRow.warehouse_id)
+    return db.execute(query).all()
+
+
+def category_totals(db: Session, warehouse_id: Optional[int] = None):
+    """Итоги сводки по категориям номенклатуры"""
+    totals = select(
+        StockSummaryRow.category_id,
+        func.count().label("positions"),
+        func.sum(StockSummaryRow.quantity).label("quantity"),
+        func.sum(StockSummaryRow.reserved_quantity).label("reserved_quantity"),
+        func.sum(StockSummaryRow.available_quantity).label("available_quantity")
+    )
+    if warehouse_id:
+        totals = totals.where(StockSummaryRow.warehouse_id == warehouse_id)
+    totals = totals.group_by(StockSummaryRow.category_id).subquery()
+
+    query = select(
+        totals.c.category_id,
+        NomenclatureCategory.code.label("category_code"),
+        NomenclatureCategory.name.label("category_name"),
+        totals.c.positions,
+        totals.c.quantity,
+        totals.c.reserved_quantity,
+        totals.c.available_quantity
+    ).join(
+        NomenclatureCategory, NomenclatureCategory.id == totals.c.category_id
+    ).order_by(totals.c.category_id)
+    return db.execute(query).all()
@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+from decimal import Decimal
+from typing import Callable, Iterable, Iterator, List, Optional
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import read_session, set_statement_timeout
+
+# Количество строк, выбираемых из курсора БД за один раз
+STREAM_BATCH_SIZE = 1000
+# Размер буфера CSV перед отправкой клиенту
+CSV_FLUSH_SIZE = 64 * 1024
+
+# Decimal выгружается строкой без потери точности (как в ответах API)
+_ENCODERS = {Decimal: str}
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+
+
+def stream_rows(build_query: Callable[[Session], object], serialize: Callable) -> Iterator[object]:
+    """Построчная выборка большого результата серверным курсором.
+
+    Сессия открывается внутри генератора (на реплике, если она доступна) и живет,
+    пока ответ передается клиенту, независимо от сессии обработчика запроса.
+    """
+    db = read_session()
+    set_statement_timeout(db, settings.db_stream_statement_timeout_ms)
+    try:
+        query = build_query(db).yield_per(STREAM_BATCH_SIZE)
+        for row in query:
+            yield serialize(row)
+    finally:
+        db.close()
+
+
+def stream_statement(build_statement: Callable[[], object]) -> Iterator[dict]:
+    """Построчная выборка Core-запроса серверным курсором (строки как словари)"""
+    db = read_session()
+    set_statement_timeout(db, settings.db_stream_statement_timeout_ms)
+    try:
+        result = db.execute(build_statement().execution_options(yield_per=STREAM_BATCH_SIZE))
+        for row in result.mappings():
+            yield dict(row)
+    finally:
+        db.close()
+
+
+def ndjson_lines(items: Iterable[object]) -> Iterator[str]:
+    for item in items:
+        yield json.dumps(jsonable_encoder(item, custom_encoder=_ENCODERS), ensure_ascii=False) + "\n"
+
+
+def csv_lines(columns: List[str], rows: Iterable[dict]) -> Iterator[str]:
+    """CSV с заголовком; строки копятся в буфере и отдаются блоками"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(jsonable_encoder(row, custom_encoder=_ENCODERS))
+        if buffer.tell() >= CSV_FLUSH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _attachment(filename: Optional[str]) -> Optional[dict]:
+    return {"Content-Disposition": f'attachment; filename="{filename}"'} if filename else None
+
+
+def ndjson_response(
+    build_query: Callable[[Session], object],
+    serialize: Callable,
+    filename: str = None
+) -> StreamingResponse:
+    """Потоковый ответ NDJSON: одна JSON-строка на запись"""
+    return StreamingResponse(
+        ndjson_lines(stream_rows(build_query, serialize)),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers=_attachment(filename)
+    )
+
+
+def ndjson_stream_response(items: Iterable[object], filename: str = None) -> StreamingResponse:
+    """Потоковый ответ NDJSON из готового итератора записей"""
+    return StreamingResponse(ndjson_lines(items), media_type=NDJSON_MEDIA_TYPE, headers=_attachment(filename))
+
+
+def csv_stream_response(columns: List[str], rows: Iterable[dict], filename: str = None) -> StreamingResponse:
+    """Потоковый ответ CSV из итератора строк"""
+    return StreamingResponse(csv_lines(columns, rows), media_type=CSV_MEDIA_TYPE, headers=_attachment(filename))
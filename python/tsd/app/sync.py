@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, Query
+from app.config import settings
+from app.models import SyncTombstone
+
+
+def changed_at(model):
+    """Момент последнего изменения записи справочника"""
+    return func.coalesce(model.updated_at, model.created_at)
+
+
+def new_sync_token(db: Session) -> datetime:
+    """Токен синхронизации - время сервера БД на момент начала выборки"""
+    return db.scalar(select(func.now()))
+
+
+def _since(changed_since: datetime) -> datetime:
+    # Транзакции, начатые до выдачи токена и зафиксированные после него,
+    # получают время изменения раньше токена: перекрываем окно
+    return changed_since - timedelta(seconds=settings.sync_overlap_seconds)
+
+
+def filter_changed(query: Query, model, changed_since: Optional[datetime]) -> Query:
+    """Отбор записей, измененных после токена синхронизации"""
+    if changed_since is None:
+        return query
+    return query.filter(changed_at(model) > _since(changed_since)).order_by(changed_at(model), model.id)
+
+
+def get_deleted_ids(db: Session, entity: str, changed_since: Optional[datetime]) -> List[int]:
+    """Идентификаторы записей, удаленных после токена синхронизации"""
+    if changed_since is None:
+        return []
+    rows = db.query(SyncTombstone.entity_id).filter(
+        SyncTombstone.entity == entity,
+        SyncTombstone.deleted_at > _since(changed_since)
+    ).all()
+    return [row.entity_id for row in rows]
+
+
+def record_tombstone(db: Session, entity: str, entity_id: int) -> None:
+    """Отметка об удалении записи для дельта-синхронизации устройств"""
+    db.add(SyncTombstone(entity=entity, entity_id=entity_id))
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+from sqlalchemy import event, inspect
+from app.config import settings
+from app.models import User, OAuthToken
+
+
+class TokenCache:
+    """Ограниченный LRU-кэш проверенных access-токенов.
+
+    Хранит снимок колонок пользователя, которому принадлежит токен.
+    Запись живет не дольше ttl_seconds и никогда не дольше expires_at токена.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, access_token: str) -> Optional[dict]:
+        """Получение снимка пользователя по токену"""
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(access_token)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                self._discard_locked(access_token)
+                return None
+            self._entries.move_to_end(access_token)
+            return entry[0]
+
+    def put(self, access_token: str, user: User, expires_at: datetime) -> None:
+        """Сохранение проверенного токена"""
+        if self.max_size <= 0 or self.ttl_seconds <= 0:
+            return
+        deadline = min(time.time() + self.ttl_seconds, expires_at.timestamp())
+        snapshot = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+        with self._lock:
+            self._discard_locked(access_token)
+            self._entries[access_token] = (snapshot, deadline)
+            self._by_user.setdefault(user.id, set()).add(access_token)
+            while len(self._entries) > self.max_size:
+                self._discard_locked(next(iter(self._entries)))
+
+    def invalidate_token(self, access_token: Optional[str]) -> None:
+        """Удаление токена из кэша (отзыв токена)"""
+        if not access_token:
+            return
+        with self._lock:
+            self._discard_locked(access_token)
+
+    def invalidate_user(self, user_id: Optional[int]) -> None:
+        """Удаление из кэша всех токенов пользователя (изменение, деактивация, удаление)"""
+        if user_id is None:
+            return
+        with self._lock:
+            for access_token in list(self._by_user.get(user_id, ())):
+                self._discard_locked(access_token)
+
+    def clear(self) -> None:
+        """Очистка кэша"""
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _discard_locked(self, access_token: str) -> None:
+        entry = self._entries.pop(access_token, None)
+        if entry:
+            user_id = entry[0]["id"]
+            tokens = self._by_user.get(user_id)
+            if tokens:
+                tokens.discard(access_token)
+                if not tokens:
+                    del self._by_user[user_id]
+
+
+token_cache = TokenCache(
+    max_size=settings.token_cache_max_size,
+    ttl_seconds=settings.token_cache_ttl_seconds
+)
+
+
+# Инвалидация при любых изменениях пользователей и токенов через ORM
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    token_cache.invalidate_user(target.id)
+
+
+@event.listens_for(OAuthToken, "after_update")
+@event.listens_for(OAuthToken, "after_delete")
+def _invalidate_token(mapper, connection, target):
+    token_cache.invalidate_token(target.access_token)
+    for old_token in inspect(target).attrs.access_token.history.deleted:
+        token_cache.invalidate_token(old_token)
@@ -1,10 +1,17 @@
+import asyncio
+import anyio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine
+from app.config import settings
+from app.database import engine, SessionLocal, pool_status, run_replica_monitor
 from app.models import Base
 from app.models_tsd import Base as TsdBase
 from app.models_barcodes import Base as BarcodesBase
-from app.routers import oauth, units, nomenclature_categories, nomenclature, warehouses, stocks, documents, inventories, barcodes, tsd_devices
+from app.barcode_cache import barcode_index
+from app.idempotency import purge_expired_keys, IDEMPOTENT_REPLAY_HEADER
+from app.inventory_counts import count_buffer, run_count_flusher
+from app.metrics import MetricsMiddleware, metrics_response
+from app.routers import oauth, units, nomenclature_categories, nomenclature, warehouses, stocks, documents, inventories, barcodes, tsd_devices, snapshot, document_uploads, exports
 
 # Создание таблиц в базе данных
 Base.metadata.create_all(bind=engine)
@@ -24,8 +31,63 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", IDEMPOTENT_REPLAY_HEADER],
 )
 
+# Метрики Prometheus по маршрутам и запросам к БД
+app.add_middleware(MetricsMiddleware)
+
+
+@app.on_event("startup")
+async def configure_threadpool():
+    """Обработчики работают с синхронной сессией SQLAlchemy и выполняются в пуле потоков"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_limit
+
+
+@app.on_event("startup")
+def load_barcode_index():
+    """Загрузка индекса штрих-кодов при старте"""
+    db = SessionLocal()
+    try:
+        barcode_index.load(db)
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+async def start_count_flusher():
+    """Фоновая запись приращений пересчета инвентаризаций"""
+    app.state.count_flusher = asyncio.create_task(run_count_flusher())
+
+
+@app.on_event("startup")
+async def start_replica_monitor():
+    """Фоновая проверка отставания реплик для чтения"""
+    app.state.replica_monitor = asyncio.create_task(run_replica_monitor())
+
+
+@app.on_event("shutdown")
+async def stop_replica_monitor():
+    app.state.replica_monitor.cancel()
+
+
+@app.on_event("shutdown")
+async def stop_count_flusher():
+    """Остановка фоновой записи и запись оставшихся приращений"""
+    app.state.count_flusher.cancel()
+    await anyio.to_thread.run_sync(count_buffer.flush)
+
+
+@app.on_event("startup")
+def purge_idempotency_keys():
+    """Удаление просроченных ключей идемпотентности при старте"""
+    db = SessionLocal()
+    try:
+        purge_expired_keys(db)
+    finally:
+        db.close()
+
+
 # Подключение роутеров
 app.include_router(oauth.router, prefix="/api/v1")
 app.include_router(units.router, prefix="/api/v1")
@@ -34,9 +96,12 @@ app.include_router(nomenclature.router, prefix="/api/v1")
 app.include_router(warehouses.router, prefix="/api/v1")
 app.include_router(stocks.router, prefix="/api/v1")
 app.include_router(documents.router, prefix="/api/v1")
+app.include_router(document_uploads.router, prefix="/api/v1")
 app.include_router(inventories.router, prefix="/api/v1")
 app.include_router(barcodes.router, prefix="/api/v1")
 app.include_router(tsd_devices.router, prefix="/api/v1")
+app.include_router(snapshot.router, prefix="/api/v1")
+app.include_router(exports.router, prefix="/api/v1")
 
 
 @app.get("/")
@@ -48,12 +113,14 @@ async def root():
         "oauth_endpoints": {
             "register_client": "/api/v1/oauth/register",
             "get_token": "/api/v1/oauth/token",
+            "revoke_token": "/api/v1/oauth/revoke",
             "register_user": "/api/v1/oauth/register-user",
             "user_info": "/api/v1/oauth/me",
             "client_info": "/api/v1/oauth/client-info"
         },
         "units_endpoints": {
             "list_units": "/api/v1/units/",
+            "sync_units": "/api/v1/units/sync",
             "get_unit": "/api/v1/units/{id}",
             "get_unit_by_code": "/api/v1/units/code/{code}",
             "create_unit": "/api/v1/units/",
@@ -63,6 +130,7 @@ async def root():
         },
         "nomenclature_categories_endpoints": {
             "list_categories": "/api/v1/nomenclature-categories/",
+            "sync_categories": "/api/v1/nomenclature-categories/sync",
             "get_category": "/api/v1/nomenclature-categories/{id}",
             "get_category_by_code": "/api/v1/nomenclature-categories/code/{code}",
             "create_category": "/api/v1/nomenclature-categories/",
@@ -72,6 +140,7 @@ async def root():
         },
             "nomenclature_endpoints": {
                 "list_nomenclature": "/api/v1/nomenclature/",
+                "sync_nomenclature": "/api/v1/nomenclature/sync",
                 "get_nomenclature": "/api/v1/nomenclature/{id}",
                 "get_nomenclature_by_code": "/api/v1/nomenclature/code/{code}",
                 "create_nomenclature": "/api/v1/nomenclature/",
@@ -81,6 +150,7 @@ async def root():
             },
             "warehouses_endpoints": {
                 "list_warehouses": "/api/v1/warehouses/",
+                "sync_warehouses": "/api/v1/warehouses/sync",
                 "get_warehouse": "/api/v1/warehouses/{id}",
                 "get_warehouse_by_code": "/api/v1/warehouses/code/{code}",
                 "create_warehouse": "/api/v1/warehouses/",
@@ -91,6 +161,12 @@ async def root():
             "stocks_endpoints": {
                 "list_stocks": "/api/v1/stocks/",
                 "get_stocks_summary": "/api/v1/stocks/summary",
+                "stream_stocks_summary": "/api/v1/stocks/summary/stream",
+                "get_stocks_summary_by_warehouse": "/api/v1/stocks/summary/warehouses",
+                "get_stocks_summary_by_category": "/api/v1/stocks/summary/categories",
+                "get_stock_movements": "/api/v1/stocks/movements",
+                "get_stock_balances": "/api/v1/stocks/balances",
+                "rebuild_stocks": "/api/v1/stocks/rebuild",
                 "get_stock": "/api/v1/stocks/{id}",
                 "get_stock_by_nomenclature_and_warehouse": "/api/v1/stocks/nomenclature/{nomenclature_id}/warehouse/{warehouse_id}",
                 "create_stock": "/api/v1/stocks/",
@@ -101,13 +177,18 @@ async def root():
                 "list_documents": "/api/v1/documents/",
                 "get_document": "/api/v1/documents/{id}",
                 "create_document": "/api/v1/documents/",
+                "create_document_bulk": "/api/v1/documents/bulk",
                 "update_document": "/api/v1/documents/{id}",
                 "delete_document": "/api/v1/documents/{id}",
                 "post_document": "/api/v1/documents/{id}/post",
                 "cancel_document": "/api/v1/documents/{id}/cancel",
                 "create_document_item": "/api/v1/documents/{document_id}/items",
                 "update_document_item": "/api/v1/documents/items/{item_id}",
-                "delete_document_item": "/api/v1/documents/items/{item_id}"
+                "delete_document_item": "/api/v1/documents/items/{item_id}",
+                "start_document_upload": "/api/v1/documents/uploads/",
+                "get_document_upload": "/api/v1/documents/uploads/{upload_id}",
+                "upload_document_chunk": "/api/v1/documents/uploads/{upload_id}/chunks/{chunk_index}",
+                "complete_document_upload": "/api/v1/documents/uploads/{upload_id}/complete"
             },
             "inventories_endpoints": {
                 "list_inventories": "/api/v1/inventories/",
@@ -117,20 +198,37 @@ async def root():
                 "delete_inventory": "/api/v1/inventories/{id}",
                 "complete_inventory": "/api/v1/inventories/{id}/complete",
                 "cancel_inventory": "/api/v1/inventories/{id}/cancel",
+                "fill_inventory_from_stock": "/api/v1/inventories/{id}/fill-from-stock",
+                "add_inventory_counts": "/api/v1/inventories/{id}/counts",
+                "get_inventory_item_contributions": "/api/v1/inventories/items/{item_id}/contributions",
+                "get_inventory_item_count_log": "/api/v1/inventories/items/{item_id}/count-log",
+                "inventory_counts_stream": "ws://.../api/v1/inventories/{id}/counts/ws?token=...",
                 "create_inventory_item": "/api/v1/inventories/{inventory_id}/items",
                 "update_inventory_item": "/api/v1/inventories/items/{item_id}",
                 "delete_inventory_item": "/api/v1/inventories/items/{item_id}"
             },
             "barcodes_endpoints": {
                 "list_barcodes": "/api/v1/barcodes/",
+                "sync_barcodes": "/api/v1/barcodes/sync",
                 "get_barcode": "/api/v1/barcodes/{id}",
                 "scan_barcode": "/api/v1/barcodes/scan/{barcode_value}",
+                "scan_barcodes_batch": "/api/v1/barcodes/scan/batch",
+                "barcode_cache_stats": "/api/v1/barcodes/cache/stats",
                 "create_barcode": "/api/v1/barcodes/",
                 "update_barcode": "/api/v1/barcodes/{id}",
                 "delete_barcode": "/api/v1/barcodes/{id}",
                 "activate_barcode": "/api/v1/barcodes/{id}/activate",
                 "deactivate_barcode": "/api/v1/barcodes/{id}/deactivate",
                 "set_primary_barcode": "/api/v1/barcodes/{id}/set-primary"
+            },
+            "snapshot_endpoints": {
+                "download_snapshot": "/api/v1/snapshot/"
+            },
+            "exports_endpoints": {
+                "export_stocks": "/api/v1/exports/stocks?format=ndjson|csv",
+                "export_movements": "/api/v1/exports/movements?format=ndjson|csv",
+                "export_documents": "/api/v1/exports/documents?format=ndjson|csv",
+                "export_inventories": "/api/v1/exports/inventories?format=ndjson|csv"
             }
     }
 
@@ -139,3 +237,15 @@ async def root():
 async def health_check():
     """Проверка здоровья сервера"""
     return {"status": "healthy"}
+
+
+@app.get("/health/db")
+async def database_pool_status():
+    """Состояние пула соединений с БД"""
+    return pool_status()
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Метрики в формате Prometheus"""
+    return metrics_response()